@@ -1,32 +1,81 @@
 from datetime import datetime, timezone, timedelta
 import hashlib
 import hmac
-import json
 import base64
 import logging
 from functools import wraps
 
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
 import config
-from db import get_conn, get_cursor, USE_MYSQL
+from db import Row, get_conn, get_cursor, init_db, pool_stats, USE_MYSQL
+from sql_compiler import cache_info as sql_cache_info
+from log_setup import logging_stats, setup_logging
+from rate_limiter import TokenBucketLimiter
+from rollups import query_rollups, rollup_status
+from telemetry import label_cache_stats
+from verify_engine import DatabaseStorage, VerifyEngine, VerifyRequest
 from license_service import (
-    fetch_device,
-    is_device_blocklisted,
-    auto_create_device,
-    evaluate_license,
-    update_device_seen,
-    insert_access_log,
-    build_config_payload,
-    detect_clone_usage,
+    invalidate_device,
+    device_cache_stats,
+    refresh_blocklist,
+    blocklist_stats,
+    access_log_stats,
+    presence_stats,
+    rebuild_clone_detector,
+    clone_detector_stats,
+    cached_verify_response,
+    remember_verify_response,
+    device_cache_version,
+    verify_replay_stats,
+    license_state_stats,
+    record_verify_outcome,
+    load_stats,
 )
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (fila, amostragem por evento e JSON; ver log_setup.py)
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# Consultas das rotas (verificar_planos.py confere o plano destas mesmas strings;
+# escritas no dialeto SQLite, o cursor traduz para MySQL)
+_ADMIN_DEVICE_COLUMNS = """
+    id, device_id, owner_name, cpf, email, address, license_type, status,
+    start_date, end_date, custom_interval, features, last_seen_at, last_seen_ip,
+    last_hostname, last_version, created_by
+"""
+ADMIN_DEVICES_SQL = f"SELECT {_ADMIN_DEVICE_COLUMNS} FROM devices ORDER BY created_at DESC"
+ADMIN_DEVICES_BY_OWNER_SQL = (
+    f"SELECT {_ADMIN_DEVICE_COLUMNS} FROM devices WHERE created_by = ? ORDER BY created_at DESC"
+)
+ADMIN_LOGIN_SQL = "SELECT password_hash, must_change_password FROM admin_users WHERE username = ? LIMIT 1"
+USER_LOGIN_SQL = "SELECT password_hash, role FROM users WHERE username = ? LIMIT 1"
+USER_BY_EMAIL_SQL = "SELECT username FROM users WHERE email = ? LIMIT 1"
+VALID_RESET_TOKEN_SQL = (
+    "SELECT username, expires_at FROM password_resets WHERE token = ? AND expires_at_epoch > ? LIMIT 1"
+)
+
+
+class AppJSONProvider(DefaultJSONProvider):
+    """Serializa db.Row direto como objeto JSON (sem converter linha a linha antes)."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Row):
+            return o.as_dict()
+        return DefaultJSONProvider.default(o)
+
+
 app = Flask(__name__)
+app.json = AppJSONProvider(app)
+
+# Schema: migrações pendentes rodam uma vez no startup, fora do caminho das requisições
+if config.AUTO_MIGRATE:
+    init_db()
+refresh_blocklist()
+rebuild_clone_detector()
 
 # Configura Flask para confiar em proxies (necessário para Cloudflare Tunnel)
 # Isso permite que request.remote_addr funcione corretamente com X-Forwarded-For
@@ -45,6 +94,21 @@ CORS(
 )
 
 
+# Carga do /verify (req/s e 5xx) para o intervalo adaptativo de checagem
+@app.after_request
+def _track_verify_load(response):
+    if request.endpoint in ("verify", "verify_batch"):
+        record_verify_outcome(response.status_code >= 500)
+    return response
+
+
+@app.teardown_request
+def _track_verify_exception(exc):
+    # Exceção não tratada: after_request não roda, conta aqui como erro
+    if exc is not None and request.endpoint in ("verify", "verify_batch"):
+        record_verify_outcome(True)
+
+
 def json_response(payload, status=200):
     return jsonify(payload), status
 
@@ -105,7 +169,7 @@ def get_client_ip() -> str:
     # Cloudflare real envia o IP neste header
     cf_ip = request.headers.get("CF-Connecting-IP", "").strip()
     if cf_ip and cf_ip != "127.0.0.1":
-        logger.debug(f"IP obtido via CF-Connecting-IP: {cf_ip}")
+        logger.debug("IP obtido via CF-Connecting-IP: %s", cf_ip)
         return cf_ip
     
     # X-Forwarded-For (após ProxyFix, request.remote_addr já deve ter o IP correto)
@@ -115,37 +179,38 @@ def get_client_ip() -> str:
         # Pega o primeiro IP da lista (IP do cliente original)
         client_ip = forwarded_for.split(",")[0].strip()
         if client_ip and client_ip != "127.0.0.1":
-            logger.debug(f"IP obtido via X-Forwarded-For: {client_ip}")
+            logger.debug("IP obtido via X-Forwarded-For: %s", client_ip)
             return client_ip
     
     # X-Real-IP (alguns proxies usam)
     real_ip = request.headers.get("X-Real-IP", "").strip()
     if real_ip and real_ip != "127.0.0.1":
-        logger.debug(f"IP obtido via X-Real-IP: {real_ip}")
+        logger.debug("IP obtido via X-Real-IP: %s", real_ip)
         return real_ip
     
     # ProxyFix já processou X-Forwarded-For, então remote_addr deve ter o IP real
     remote_addr = request.remote_addr or ""
     if remote_addr and remote_addr != "127.0.0.1":
-        logger.debug(f"IP obtido via request.remote_addr: {remote_addr}")
+        logger.debug("IP obtido via request.remote_addr: %s", remote_addr)
         return remote_addr
     
     # Se ainda for localhost, tenta obter do ambiente (útil para desenvolvimento)
     if remote_addr == "127.0.0.1":
         # Em desenvolvimento local, pode ser que o cliente esteja na mesma máquina
         # Mas em produção via Cloudflare Tunnel, isso não deveria acontecer
-        logger.warning(f"IP é localhost (127.0.0.1) - pode indicar problema de configuração do proxy")
+        logger.warning("IP é localhost (127.0.0.1) - pode indicar problema de configuração do proxy")
         # Tenta obter do header X-Forwarded-For novamente (pode ter múltiplos IPs)
         if forwarded_for:
             ips = [ip.strip() for ip in forwarded_for.split(",")]
             for ip in ips:
                 if ip and ip != "127.0.0.1" and not ip.startswith("10.") and not ip.startswith("192.168."):
-                    logger.debug(f"IP obtido do X-Forwarded-For (filtrando local): {ip}")
+                    logger.debug("IP obtido do X-Forwarded-For (filtrando local): %s", ip)
                     return ip
     
     # Log detalhado para debug (apenas em desenvolvimento)
     if remote_addr == "127.0.0.1":
-        logger.warning(f"IP é localhost - Headers disponíveis: X-Forwarded-For={forwarded_for}, X-Real-IP={real_ip}, CF-Connecting-IP={cf_ip}")
+        logger.warning("IP é localhost - Headers disponíveis: X-Forwarded-For=%s, X-Real-IP=%s, CF-Connecting-IP=%s",
+                       forwarded_for, real_ip, cf_ip)
     
     return remote_addr or "unknown"
 
@@ -190,182 +255,130 @@ def ping():
     }, 200)
 
 
+# Núcleo da verificação (timestamp, assinatura, blocklist, licença, clones, token)
+# Limites de taxa por Device ID e, no /verify/batch, por IP (token bucket em memória, LRU)
+_device_limiter = _ip_limiter = None
+if config.RATE_LIMIT_ENABLED:
+    _device_limiter = TokenBucketLimiter(
+        config.RATE_LIMIT_DEVICE_RATE, config.RATE_LIMIT_DEVICE_BURST, config.RATE_LIMIT_MAX_KEYS
+    )
+if config.RATE_LIMIT_ENABLED and config.RATE_LIMIT_IP_ENABLED:
+    _ip_limiter = TokenBucketLimiter(
+        config.RATE_LIMIT_IP_RATE, config.RATE_LIMIT_IP_BURST, config.RATE_LIMIT_MAX_KEYS
+    )
+_verify_engine = VerifyEngine(DatabaseStorage(), device_limiter=_device_limiter, ip_limiter=_ip_limiter)
+
+
+def _verify_result_response(result):
+    response = jsonify(result.body)
+    if result.fingerprint:
+        # Fingerprint para o verify condicional (?fp=) fora do corpo, que segue o formato v1
+        response.headers["X-License-Fingerprint"] = result.fingerprint
+    if result.retry_after:
+        response.headers["Retry-After"] = str(result.retry_after)
+    return response, result.status
+
+
 @app.route("/verify", methods=["GET"])
 def verify():
-    id_ = (request.args.get("id") or "").strip()
-    version = (request.args.get("version") or "").strip()
-    ts = (request.args.get("ts") or "").strip()
-    sig = (request.args.get("sig") or "").strip()
     api_key_qs = (request.args.get("api_key") or "").strip()
     api_key_hdr = (request.headers.get("X-API-Key") or "").strip()
+    # Formato da resposta: "2" = compacto (opt-in); qualquer outro valor = v1
+    compact = (request.args.get("format") or "").strip() == "2"
+    ip = get_client_ip()
+    req = VerifyRequest.from_params(
+        request.args, ip, request.headers.get("User-Agent", ""), compact=compact
+    )
 
-    hostname = request.args.get("hostname", "")
-    username = request.args.get("username", "")
-    osbuild = request.args.get("osbuild", "")
-    ram_total = request.args.get("ram_total", "")
-    ram_free = request.args.get("ram_free", "")
-    cpu_load = request.args.get("cpu_load", "")
-    client_time = request.args.get("client_time", "")
-
-    logger.info(f"VERIFY: id={id_[:20]}..., version={version}, ts={ts}, sig_len={len(sig)}")
+    logger.info("VERIFY: id=%s, version=%s, ts=%s, sig_len=%s", req.device_id, req.version, req.ts, len(req.sig),
+                extra={"event": "verify.request", "fields": {"device_id": req.device_id, "ip": ip}})
 
-    if not id_ or not version:
-        logger.warning(f"VERIFY: Parâmetros ausentes - id={bool(id_)}, version={bool(version)}")
+    if not req.device_id or not req.version:
+        logger.warning("VERIFY: Parâmetros ausentes - id=%s, version=%s", bool(req.device_id), bool(req.version),
+                       extra={"event": "verify.deny", "fields": {"reason": "params"}})
         return json_response({"allow": False, "msg": "Parâmetros ausentes."}, 400)
 
     # API key
     if config.REQUIRE_API_KEY and config.API_KEY:
         if api_key_qs != config.API_KEY and api_key_hdr != config.API_KEY:
-            logger.warning(f"VERIFY: API key inválida - qs={bool(api_key_qs)}, hdr={bool(api_key_hdr)}")
+            logger.warning("VERIFY: API key inválida - qs=%s, hdr=%s", bool(api_key_qs), bool(api_key_hdr),
+                           extra={"event": "verify.deny", "fields": {"device_id": req.device_id, "reason": "api_key"}})
             return json_response({"allow": False, "msg": "API key inválida."}, 403)
 
-    # Timestamp
-    try:
-        if not ts or len(ts) != 14:
-            logger.warning(f"VERIFY: Timestamp inválido - ts={ts}, len={len(ts) if ts else 0}")
-            raise ValueError
-        client_dt = datetime.strptime(ts, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
-    except ValueError as e:
-        logger.warning(f"VERIFY: Erro ao parsear timestamp - ts={ts}, error={e}")
-        return json_response({"allow": False, "msg": f"Timestamp inválido: {ts}"}, 400)
-
     now_utc = datetime.now(timezone.utc)
-    time_diff = abs((now_utc - client_dt).total_seconds())
-    hours_diff = time_diff / 3600
-    
-    logger.info(f"VERIFY: Timestamp OK - client={client_dt}, server={now_utc}, diff={time_diff}s ({hours_diff:.1f}h), max_skew={config.MAX_TIME_SKEW}s")
-    
-    if time_diff > config.MAX_TIME_SKEW:
-        logger.warning(f"VERIFY: Requisição expirada - diff={time_diff}s ({hours_diff:.1f}h), max={config.MAX_TIME_SKEW}s")
-        hours_max = config.MAX_TIME_SKEW / 3600
-        return json_response({
-            "allow": False, 
-            "msg": f"Relógio desincronizado. Diferença: {int(hours_diff)}h {int((time_diff % 3600) / 60)}min (máximo permitido: {int(hours_max)}h). Sincronize o relógio do sistema."
-        }, 400)
-
-    # Assinatura
-    if config.REQUIRE_SIGNATURE and config.SHARED_SECRET:
-        if not sig:
-            logger.warning(f"VERIFY: Assinatura ausente")
-            return json_response({"allow": False, "msg": "Assinatura ausente."}, 403)
-        expected = hashlib.sha256(
-            f"{id_}|{version}|{ts}|{config.SHARED_SECRET}".encode("utf-8")
-        ).hexdigest()
-        # Usa hmac.compare_digest() em vez de hashlib.compare_digest() para compatibilidade com Python antigo
-        if not hmac.compare_digest(expected, sig):
-            logger.warning(f"VERIFY: Assinatura inválida - expected={expected[:20]}..., received={sig[:20]}...")
-            return json_response({"allow": False, "msg": "Assinatura inválida."}, 403)
-
-    # Blocklist hardcoded
-    if id_ in config.HARDCODED_BLOCKLIST:
-        return json_response({"allow": False, "msg": "Dispositivo bloqueado."}, 403)
-
-    # Busca/auto provision
-    device = fetch_device(id_)
-    if not device:
-        if not config.ALLOW_AUTO_PROVISION:
-            logger.warning(f"VERIFY: ID não registrado - id={id_}")
-            return json_response({"allow": False, "msg": "ID não registrado."}, 403)
-        logger.info(f"VERIFY: Auto-provisionando dispositivo - id={id_}")
-        device = auto_create_device(id_)
-
-    # Blocklist na tabela
-    if is_device_blocklisted(id_):
-        return json_response(
-            {"allow": False, "msg": "Este dispositivo está bloqueado."}, 403
-        )
+    error = _verify_engine.check(req, now_utc)
+    if error:
+        return _verify_result_response(error)
+
+    # Retentativa exata (retry/failover do cliente): devolve a resposta já calculada,
+    # sem leituras nem escritas no banco. O IP entra na chave para que outra
+    # máquina com a mesma assinatura não escape da detecção de clones.
+    replay_key = (req.device_id, req.version, req.ts, req.sig, ip, req.token_fp, compact)
+    cached_response = cached_verify_response(replay_key)
+    if cached_response is not None:
+        logger.info("VERIFY: Retentativa duplicada - id=%s, ts=%s", req.device_id, req.ts,
+                    extra={"event": "verify.replay", "fields": {"device_id": req.device_id}})
+        return _verify_result_response(cached_response)
+    cache_version = device_cache_version()
+
+    result = _verify_engine.decide(req, now_utc)
+    if result.status == 200:
+        remember_verify_response(replay_key, result, cache_version)
+    return _verify_result_response(result)
+
+
+@app.route("/verify/batch", methods=["POST"])
+def verify_batch():
+    """
+    Verificação em lote para gateways/proxies de rede local.
+
+    Corpo: {"entries": [{"id", "version", "ts", "sig", "hostname", ..., "fp"}, ...], "format": "2"?}
+    Cada entrada é assinada como no /verify. Os devices vêm de um único
+    SELECT ... IN (...), a blocklist é o snapshot em memória e os access_logs
+    são gravados em lote. Retorna {"results": [...]} na ordem das entradas,
+    cada uma com "id", "status" (HTTP equivalente), o corpo do /verify e, no
+    formato v1, o "fingerprint" que o /verify manda no header X-License-Fingerprint.
+    """
+    api_key_qs = (request.args.get("api_key") or "").strip()
+    api_key_hdr = (request.headers.get("X-API-Key") or "").strip()
+    if config.REQUIRE_API_KEY and config.API_KEY:
+        if api_key_qs != config.API_KEY and api_key_hdr != config.API_KEY:
+            logger.warning("VERIFY_BATCH: API key inválida - qs=%s, hdr=%s", bool(api_key_qs), bool(api_key_hdr),
+                           extra={"event": "verify.deny", "fields": {"reason": "api_key"}})
+            return json_response({"error": "API key inválida."}, 403)
 
-    validation = evaluate_license(device)
-    allow = bool(validation["allow"])
-    msg = validation["msg"]
-    effective_end = validation.get("end_date")
-    
-    logger.info(f"VERIFY: Device encontrado - id={id_}, license_type={device.get('license_type')}, status={device.get('status')}, allow={allow}, msg={msg}")
+    data = request.get_json(silent=True) or {}
+    entries = data.get("entries")
+    if not isinstance(entries, list) or not entries:
+        return json_response({"error": "Envie 'entries' com ao menos uma entrada."}, 400)
+    if len(entries) > config.VERIFY_BATCH_MAX:
+        return json_response({"error": f"Máximo de {config.VERIFY_BATCH_MAX} entradas por lote."}, 413)
+    compact = str(data.get("format") or "").strip() == "2"
 
-    # Detecção de clones (ANTES de atualizar métricas)
-    # Obtém IP real do cliente (considerando proxies/Cloudflare)
     ip = get_client_ip()
-    is_clone, clone_message = detect_clone_usage(id_, ip, hostname)
-    
-    if is_clone:
-        logger.warning(f"VERIFY: Clone detectado - Device ID: {id_}, IP: {ip}, Hostname: {hostname}, Mensagem: {clone_message}")
-        
-        # Bloqueia automaticamente
-        with get_conn() as conn:
-            cur = get_cursor(conn)
-            cur.execute(
-                "UPDATE devices SET status = 'blocked', updated_at = datetime('now') WHERE device_id = ?",
-                (id_,),
-            )
-            conn.commit()
-        
-        # Re-avalia a licença (agora bloqueada)
-        device["status"] = "blocked"
-        validation = evaluate_license(device)
-        allow = False
-        msg = clone_message or "Licença bloqueada - uso simultâneo detectado."
-
-    # Atualiza métricas de último acesso
-    update_device_seen(device["id"], ip, version, hostname)
-
-    # Loga acesso
-    telemetry = {
-        "hostname": hostname,
-        "username": username,
-        "osbuild": osbuild,
-        "ram_total": ram_total,
-        "ram_free": ram_free,
-        "cpu_load": cpu_load,
-        "client_time": client_time,
-    }
-    insert_access_log(
-        device_id=id_,
-        allowed=allow,
-        message=msg,
-        version=version,
-        hostname=hostname,
-        telemetry_json=json.dumps(telemetry, ensure_ascii=False),
-        ip=ip,
-        user_agent=request.headers.get("User-Agent", ""),
-    )
-
-    config_payload = build_config_payload(device, effective_end)
-
-    # ------------------------------------------------------------------
-    # Token de licença assinado (para cache/offline no cliente)
-    # Assinatura HMAC-SHA256 sobre o JSON serializado do payload.
-    # ------------------------------------------------------------------
-    license_payload = {
-        "device_id": id_,
-        "license_type": device.get("license_type"),
-        "status": device.get("status"),
-        "issued_at": now_utc.isoformat(),
-        "expires_at": effective_end,
-        "features": config_payload.get("features", []),
-    }
-    payload_raw = json.dumps(license_payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
-    signature = hmac.new(
-        config.SHARED_SECRET.encode("utf-8"),
-        payload_raw.encode("utf-8"),
-        hashlib.sha256,
-    ).hexdigest()
-
-    license_token = {
-        "payload": license_payload,
-        "payload_raw": payload_raw,
-        "signature": signature,
-    }
-
-    response_payload = {
-        "allow": allow,
-        "msg": msg,
-        "config": config_payload,
-        "license_token": license_token,
-    }
-    
-    logger.info(f"VERIFY: Resposta final - allow={allow}, msg={msg[:50] if msg else 'N/A'}")
-    
-    return json_response(response_payload)
+    user_agent = request.headers.get("User-Agent", "")
+    results = [None] * len(entries)
+    reqs = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            results[index] = {"id": None, "status": 400, "allow": False, "msg": "Entrada inválida."}
+            continue
+        reqs.append((index, VerifyRequest.from_params(entry, ip, user_agent, compact=compact)))
+
+    verified = _verify_engine.verify_many([req for _, req in reqs])
+    for (index, req), result in zip(reqs, verified):
+        results[index] = {"id": req.device_id or None, "status": result.status, **result.body}
+        if result.fingerprint and not compact:
+            results[index]["fingerprint"] = result.fingerprint
+
+    allowed = sum(1 for result in verified if result.status == 200)
+    logger.info("VERIFY_BATCH: %s entradas, %s avaliadas, IP=%s", len(entries), allowed, ip,
+                extra={"event": "verify.batch", "fields": {"entries": len(entries), "evaluated": allowed, "ip": ip}})
+    response = jsonify({"results": results})
+    retry_after = max((result.retry_after for result in verified), default=0)
+    if retry_after:
+        response.headers["Retry-After"] = str(retry_after)
+    return response, 200
 
 
 @app.route("/servers", methods=["GET"])
@@ -405,6 +418,76 @@ def get_servers():
     return json_response(response)
 
 
+@app.route("/admin/metrics", methods=["GET"])
+@require_admin
+def admin_metrics():
+    """Métricas internas do processo (pool de conexões, etc.) para diagnóstico."""
+    return json_response({
+        "db_pool": pool_stats(),
+        "sql_cache": sql_cache_info(),
+        "device_cache": device_cache_stats(),
+        "blocklist": blocklist_stats(),
+        "access_log_writer": access_log_stats(),
+        "presence": presence_stats(),
+        "clone_detector": clone_detector_stats(),
+        "verify_replay": verify_replay_stats(),
+        "license_states": license_state_stats(),
+        "verify_load": load_stats(),
+        "logging": logging_stats(),
+        "telemetry_labels": label_cache_stats(),
+        "rate_limit": {
+            "device": _device_limiter.stats() if _device_limiter else None,
+            "ip": _ip_limiter.stats() if _ip_limiter else None,
+        },
+    })
+
+
+@app.route("/admin/stats/access", methods=["GET"])
+@require_admin
+def admin_stats_access():
+    """
+    Verificações liberadas/negadas e devices únicos por hora (period=h) ou dia
+    (period=d), lidos dos agregados (rollups.py), nunca de access_logs.
+    since/until em epoch UTC (padrão: últimas 24h / 30 dias); group_by=version
+    ou created_by. Usuários comuns veem apenas as próprias licenças.
+    """
+    username = getattr(request, "admin_username", None)
+    user_role = getattr(request, "user_role", "admin")
+
+    period = request.args.get("period", "h")
+    if period not in ("h", "d"):
+        return json_response({"error": "period deve ser 'h' ou 'd'."}, 400)
+    group_by = request.args.get("group_by") or None
+    if group_by not in (None, "none", "version", "created_by"):
+        return json_response({"error": "group_by deve ser 'version', 'created_by' ou 'none'."}, 400)
+    if group_by == "none":
+        group_by = None
+    now = int(datetime.now(timezone.utc).timestamp())
+    try:
+        until = int(request.args.get("until", now + 1))
+        since = int(request.args.get("since", until - (86400 if period == "h" else 30 * 86400)))
+    except ValueError:
+        return json_response({"error": "since/until devem ser epoch em segundos."}, 400)
+
+    created_by = None if user_role == "admin" else username
+    items = query_rollups(period, since, until, group_by=group_by, created_by=created_by)
+    return json_response({
+        "period": period,
+        "since": since,
+        "until": until,
+        "group_by": group_by,
+        "items": items,
+        "rollup": rollup_status(),
+    })
+
+
+@app.route("/admin/stats/rollups", methods=["GET"])
+@require_admin
+def admin_stats_rollups():
+    """Estado dos agregados: último access_logs.id processado e linhas pendentes."""
+    return json_response(rollup_status())
+
+
 @app.route("/admin/devices", methods=["GET"])
 @require_admin
 def admin_devices():
@@ -416,82 +499,12 @@ def admin_devices():
         cur = get_cursor(conn)
         if user_role == "admin":
             # Admin vê todas as licenças
-            cur.execute(
-                """
-                SELECT
-                    id,
-                    device_id,
-                    owner_name,
-                    cpf,
-                    email,
-                    address,
-                    license_type,
-                    status,
-                    start_date,
-                    end_date,
-                    custom_interval,
-                    features,
-                    last_seen_at,
-                    last_seen_ip,
-                    last_hostname,
-                    last_version,
-                    created_by
-                FROM devices
-                ORDER BY created_at DESC
-                """
-            )
+            cur.execute(ADMIN_DEVICES_SQL)
         else:
             # Usuário comum vê apenas suas licenças
-            cur.execute(
-                """
-                SELECT
-                    id,
-                    device_id,
-                    owner_name,
-                    cpf,
-                    email,
-                    address,
-                    license_type,
-                    status,
-                    start_date,
-                    end_date,
-                    custom_interval,
-                    features,
-                    last_seen_at,
-                    last_seen_ip,
-                    last_hostname,
-                    last_version,
-                    created_by
-                FROM devices
-                WHERE created_by = ?
-                ORDER BY created_at DESC
-                """,
-                (username,),
-            )
-        rows_data = cur.fetchall()
-        # Converter rows para dict (compatível com SQLite e MySQL)
-        rows = []
-        for row in rows_data:
-            # MySQL com DictCursor já retorna dict diretamente
-            if USE_MYSQL:
-                # pymysql DictCursor já retorna dict, apenas copiar
-                row_dict = row.copy() if isinstance(row, dict) else dict(row)
-            else:
-                # SQLite: Row precisa ser convertido para dict
-                if hasattr(row, 'keys'):
-                    row_dict = {key: row[key] for key in row.keys()}
-                else:
-                    try:
-                        row_dict = dict(row)
-                    except:
-                        row_dict = {}
-            
-            # Garantir que created_by existe mesmo em registros antigos
-            if "created_by" not in row_dict:
-                row_dict["created_by"] = None
-            
-            rows.append(row_dict)
-    
+            cur.execute(ADMIN_DEVICES_BY_OWNER_SQL, (username,))
+        rows = cur.fetchall()
+
     return json_response({"items": rows})
 
 
@@ -629,6 +642,7 @@ def create_device_license():
                 ),
             )
         conn.commit()
+        invalidate_device(device_id)
         
         # Envia email de boas-vindas se email foi fornecido
         if email and config.SMTP_ENABLED:
@@ -705,6 +719,7 @@ def create_pix_payment():
             ),
         )
         conn.commit()
+        invalidate_device(device_id)
         
         # Envia email de boas-vindas se email foi fornecido (apenas se status for 'active')
         # Para 'pending', o email será enviado quando o pagamento for confirmado e status mudar para 'active'
@@ -750,25 +765,10 @@ def admin_login():
     with get_conn() as conn:
         cur = get_cursor(conn)
         # Primeiro tenta admin_users
-        if USE_MYSQL:
-            cur.execute(
-                "SELECT password_hash, must_change_password FROM admin_users WHERE username = %s LIMIT 1",
-                (username,),
-            )
-        else:
-            cur.execute(
-                "SELECT password_hash, must_change_password FROM admin_users WHERE username = ? LIMIT 1",
-                (username,),
-            )
+        cur.execute(ADMIN_LOGIN_SQL, (username,))
         row = cur.fetchone()
         if row:
-            # Compatível com MySQL DictCursor e SQLite Row
-            if USE_MYSQL and hasattr(row, 'keys'):
-                pwd_hash, must_change = row['password_hash'], int(row['must_change_password'])
-            else:
-                pwd_hash = row[0] if isinstance(row, tuple) else row['password_hash']
-                must_change = int(row[1] if isinstance(row, tuple) else row['must_change_password'])
-            
+            pwd_hash, must_change = row["password_hash"], int(row["must_change_password"])
             if _admin_hash_password(password) == pwd_hash:
                 token = _make_admin_token(username, "admin")
                 return json_response({
@@ -778,25 +778,10 @@ def admin_login():
                 })
         
         # Se não encontrou em admin_users, tenta users
-        if USE_MYSQL:
-            cur.execute(
-                "SELECT password_hash, role FROM users WHERE username = %s LIMIT 1",
-                (username,),
-            )
-        else:
-            cur.execute(
-                "SELECT password_hash, role FROM users WHERE username = ? LIMIT 1",
-                (username,),
-            )
+        cur.execute(USER_LOGIN_SQL, (username,))
         row = cur.fetchone()
         if row:
-            # Compatível com MySQL DictCursor e SQLite Row
-            if USE_MYSQL and hasattr(row, 'keys'):
-                pwd_hash, role = row['password_hash'], row['role']
-            else:
-                pwd_hash = row[0] if isinstance(row, tuple) else row['password_hash']
-                role = row[1] if isinstance(row, tuple) else row['role']
-            
+            pwd_hash, role = row["password_hash"], row["role"]
             if _user_hash_password(password) == pwd_hash:
                 token = _make_admin_token(username, role or "user")
                 return json_response({
@@ -878,17 +863,7 @@ def admin_users():
             ORDER BY created_at DESC
             """
         )
-        rows = cur.fetchall()
-        items = [
-            {
-                "id": row["id"],
-                "username": row["username"],
-                "email": row["email"],
-                "role": row["role"],
-                "created_at": row["created_at"],
-            }
-            for row in rows
-        ]
+        items = cur.fetchall()
     return json_response({"items": items})
 
 
@@ -1003,6 +978,7 @@ def user_devices_create():
             ),
         )
         conn.commit()
+        invalidate_device(device_id)
 
     logger.info(f"Licença gratuita criada por usuário comum {username} para Device ID: {device_id}")
     return json_response({"success": True, "device_id": device_id, "license_type": license_type}, 201)
@@ -1032,6 +1008,7 @@ def update_device_created_by():
             (new_created_by, device_id)
         )
         conn.commit()
+        invalidate_device(device_id)
     
     logger.info(f"created_by atualizado para Device ID {device_id}: {new_created_by}")
     return json_response({"success": True, "device_id": device_id, "created_by": new_created_by}, 200)
@@ -1080,6 +1057,7 @@ def deactivate_device(device_id: str):
             (new_status, device_id)
         )
         conn.commit()
+        invalidate_device(device_id)
     
     action_text = "reativada" if new_status == "active" else "desativada"
     logger.info(f"Licença {action_text}: {device_id} por {username} (status: {new_status})")
@@ -1111,6 +1089,7 @@ def delete_device(device_id: str):
         # Excluir licença
         cur.execute("DELETE FROM devices WHERE device_id = ?", (device_id,))
         conn.commit()
+        invalidate_device(device_id)
     
     logger.info(f"Licença excluída: {device_id} por {username}")
     return json_response({"success": True, "device_id": device_id, "message": "Licença excluída permanentemente."}, 200)
@@ -1143,24 +1122,13 @@ def user_profile():
                 )
             row = cur.fetchone()
             if row:
-                # Compatível com MySQL DictCursor e SQLite Row
-                if USE_MYSQL and hasattr(row, 'keys'):
-                    return json_response({
-                        "id": row["id"],
-                        "username": row["username"],
-                        "email": row["email"],
-                        "role": row["role"],
-                        "created_at": str(row["created_at"]),
-                    })
-                else:
-                    row_dict = dict(row) if hasattr(row, 'keys') else {
-                        "id": row[0],
-                        "username": row[1],
-                        "email": row[2],
-                        "role": row[3],
-                        "created_at": row[4],
-                    }
-                    return json_response(row_dict)
+                return json_response({
+                    "id": row["id"],
+                    "username": row["username"],
+                    "email": row["email"],
+                    "role": row["role"],
+                    "created_at": str(row["created_at"]),
+                })
             else:
                 # Se não está em users, é admin
                 if USE_MYSQL:
@@ -1175,22 +1143,13 @@ def user_profile():
                     )
                 row = cur.fetchone()
                 if row:
-                    if USE_MYSQL and hasattr(row, 'keys'):
-                        return json_response({
-                            "id": row["id"],
-                            "username": row["username"],
-                            "email": None,
-                            "role": "admin",
-                            "created_at": str(row["created_at"]),
-                        })
-                    else:
-                        return json_response({
-                            "id": row[0] if isinstance(row, tuple) else row["id"],
-                            "username": row[1] if isinstance(row, tuple) else row["username"],
-                            "email": None,
-                            "role": "admin",
-                            "created_at": str(row[2] if isinstance(row, tuple) else row["created_at"]),
-                        })
+                    return json_response({
+                        "id": row["id"],
+                        "username": row["username"],
+                        "email": None,
+                        "role": "admin",
+                        "created_at": str(row["created_at"]),
+                    })
         
         return json_response({"error": "Usuário não encontrado."}, 404)
     
@@ -1204,25 +1163,19 @@ def user_profile():
             
             # Verificar primeiro em users
             if USE_MYSQL:
-                cur.execute("SELECT id, role FROM users WHERE username = %s LIMIT 1", (username,))
+                cur.execute("SELECT id FROM users WHERE username = %s LIMIT 1", (username,))
             else:
-                cur.execute("SELECT id, role FROM users WHERE username = ? LIMIT 1", (username,))
+                cur.execute("SELECT id FROM users WHERE username = ? LIMIT 1", (username,))
             row = cur.fetchone()
             
             if row:
                 # Usuário existe em users, atualizar email
                 if USE_MYSQL:
-                    if hasattr(row, 'keys'):
-                        user_id, user_role = row['id'], row.get('role', 'user')
-                    else:
-                        user_id, user_role = row[0], row[1] if len(row) > 1 else 'user'
                     cur.execute(
                         "UPDATE users SET email = %s, updated_at = NOW() WHERE username = %s",
                         (email, username),
                     )
                 else:
-                    user_id = row[0] if isinstance(row, tuple) else row['id']
-                    user_role = row[1] if isinstance(row, tuple) and len(row) > 1 else row.get('role', 'user') if hasattr(row, 'get') else 'user'
                     cur.execute(
                         "UPDATE users SET email = ?, updated_at = datetime('now') WHERE username = ?",
                         (email, username),
@@ -1299,10 +1252,7 @@ def forgot_password():
         cur = get_cursor(conn)
         
         # Verificar primeiro em users (tabela de usuários/revendedores)
-        if USE_MYSQL:
-            cur.execute("SELECT username FROM users WHERE email = %s LIMIT 1", (email,))
-        else:
-            cur.execute("SELECT username FROM users WHERE email = ? LIMIT 1", (email,))
+        cur.execute(USER_BY_EMAIL_SQL, (email,))
         row = cur.fetchone()
         
         # Se não encontrou em users, verificar se é admin (admin_users não tem email, mas podemos verificar por username se necessário)
@@ -1312,48 +1262,23 @@ def forgot_password():
             # Não revelar se email existe ou não por segurança
             return json_response({"ok": True, "message": "Se o email existir, você receberá instruções."})
         
-        # Obter username (compatível com MySQL DictCursor e SQLite Row)
-        if USE_MYSQL and hasattr(row, 'keys'):
-            username = row['username']
-        else:
-            username = row[0] if isinstance(row, tuple) else row['username']
+        username = row["username"]
         
         # Gerar token de recuperação (válido por 30 minutos)
         import secrets
         reset_token = secrets.token_urlsafe(32)
-        reset_expires = (datetime.utcnow() + timedelta(minutes=30)).isoformat()
+        now_utc = datetime.now(timezone.utc)
+        expires_utc = now_utc + timedelta(minutes=30)
+        reset_expires = expires_utc.replace(tzinfo=None).isoformat()
         
-        # Salvar token no banco (criar tabela se necessário)
-        if USE_MYSQL:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS password_resets (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(100) NOT NULL,
-                    token VARCHAR(255) NOT NULL UNIQUE,
-                    expires_at DATETIME NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_token (token),
-                    INDEX idx_expires_at (expires_at)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-            """)
-            cur.execute(
-                "INSERT INTO password_resets (username, token, expires_at) VALUES (%s, %s, %s)",
-                (username, reset_token, reset_expires),
-            )
-        else:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS password_resets (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL,
-                    token TEXT NOT NULL UNIQUE,
-                    expires_at TEXT NOT NULL,
-                    created_at TEXT DEFAULT (datetime('now'))
-                )
-            """)
-            cur.execute(
-                "INSERT INTO password_resets (username, token, expires_at) VALUES (?, ?, ?)",
-                (username, reset_token, reset_expires),
-            )
+        # Salvar token no banco (tabela criada pela migração 003; colunas epoch na 004)
+        cur.execute(
+            """
+            INSERT INTO password_resets (username, token, expires_at, created_at_epoch, expires_at_epoch)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (username, reset_token, reset_expires, int(now_utc.timestamp()), int(expires_utc.timestamp())),
+        )
         conn.commit()
         
         # Enviar email
@@ -1502,12 +1427,8 @@ def get_reset_token_info():
         if not row:
             return json_response({"error": "Token inválido."}, 400)
         
-        # Obter expires_at (compatível com MySQL DictCursor e SQLite Row)
         from datetime import datetime
-        if USE_MYSQL and hasattr(row, 'keys'):
-            expires_at = row['expires_at']
-        else:
-            expires_at = row[0] if isinstance(row, tuple) else row['expires_at']
+        expires_at = row["expires_at"]
         
         # Converter para datetime se necessário
         if isinstance(expires_at, str):
@@ -1567,26 +1488,12 @@ def reset_password():
     with get_conn() as conn:
         cur = get_cursor(conn)
         # Verificar token
-        if USE_MYSQL:
-            cur.execute(
-                "SELECT username, expires_at FROM password_resets WHERE token = %s AND expires_at > NOW() LIMIT 1",
-                (token,),
-            )
-        else:
-            cur.execute(
-                "SELECT username, expires_at FROM password_resets WHERE token = ? AND expires_at > datetime('now') LIMIT 1",
-                (token,),
-            )
+        cur.execute(VALID_RESET_TOKEN_SQL, (token, int(datetime.now(timezone.utc).timestamp())))
         row = cur.fetchone()
         if not row:
             return json_response({"error": "Token inválido ou expirado."}, 400)
         
-        # Obter username e expires_at (compatível com MySQL DictCursor e SQLite Row)
-        if USE_MYSQL and hasattr(row, 'keys'):
-            username, expires_at = row['username'], row['expires_at']
-        else:
-            username = row[0] if isinstance(row, tuple) else row['username']
-            expires_at = row[1] if isinstance(row, tuple) else row['expires_at']
+        username = row["username"]
         
         # IMPORTANTE: Deletar o token ANTES de atualizar a senha para evitar uso múltiplo
         # Isso garante que mesmo se houver erro depois, o token já foi invalidado
@@ -1656,6 +1563,7 @@ def reset_password():
 try:
     from apscheduler.schedulers.background import BackgroundScheduler
     from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
     from email_service import check_and_send_expiration_emails
     
     scheduler = BackgroundScheduler()
@@ -1667,6 +1575,30 @@ try:
         name="Verificar e enviar emails de expiração",
         replace_existing=True,
     )
+    if config.RETENTION_ENABLED:
+        from retencao import run_retention_job
+
+        # Retenção de access_logs (arquiva + apaga em lotes), fora do horário de pico
+        scheduler.add_job(
+            run_retention_job,
+            trigger=CronTrigger(hour=config.RETENTION_HOUR, minute=30),
+            id="access_logs_retention",
+            name="Retenção de access_logs",
+            replace_existing=True,
+        )
+    if config.ROLLUP_ENABLED:
+        from rollups import run_rollup_job
+
+        # Agregados incrementais de access_logs (consultados por /admin/stats/access)
+        scheduler.add_job(
+            run_rollup_job,
+            trigger=IntervalTrigger(minutes=config.ROLLUP_INTERVAL_MINUTES),
+            id="access_logs_rollups",
+            name="Agregados de access_logs",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
     SCHEDULER_AVAILABLE = True
 except ImportError:
     logger.warning("APScheduler não disponível - emails automáticos desabilitados")
@@ -1701,9 +1633,14 @@ if __name__ == "__main__":
         logger.info("Keep-alive interno iniciado (recomendado usar serviço externo como UptimeRobot)")
     
     # Inicia scheduler
-    if SCHEDULER_AVAILABLE and config.SMTP_ENABLED:
+    if SCHEDULER_AVAILABLE and (config.SMTP_ENABLED or config.RETENTION_ENABLED or config.ROLLUP_ENABLED):
         scheduler.start()
-        logger.info("Scheduler de emails iniciado - verificará expirações diariamente às 09:00")
+        if config.SMTP_ENABLED:
+            logger.info("Scheduler de emails iniciado - verificará expirações diariamente às 09:00")
+        if config.RETENTION_ENABLED:
+            logger.info(f"Retenção de access_logs agendada - diariamente às {config.RETENTION_HOUR:02d}:30 ({config.RETENTION_DAYS} dias)")
+        if config.ROLLUP_ENABLED:
+            logger.info(f"Agregados de access_logs agendados - a cada {config.ROLLUP_INTERVAL_MINUTES} min")
     elif config.SMTP_ENABLED and not SCHEDULER_AVAILABLE:
         logger.warning("SMTP habilitado mas scheduler não disponível - instale apscheduler")
     
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark de escrita em lote em access_logs: db.bulk_insert versus um INSERT
+por linha (com commit por linha, como o caminho síncrono antigo, e com um
+único commit no final).
+
+Usa o banco configurado (DB_TYPE) ou, com --temp, um SQLite temporário com o
+schema das migrações. As linhas gravadas ficam na tabela; use um banco de teste.
+
+Uso (a partir da pasta api/):
+
+    python benchmark_bulk.py --temp                        # 1k, 100k e 1M linhas
+    python benchmark_bulk.py --temp --sizes 1000 50000
+    python benchmark_bulk.py --temp --per-row-max 100000   # limita o caminho linha a linha
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+
+def _rows(count: int, start: int = 0):
+    epoch = int(time.time())
+    for i in range(start, start + count):
+        yield (
+            f"BENCH{i % 5000:06d}", f"10.0.{i % 250}.{i % 200}", "Mozilla/5.0 (bench)", f"host{i % 5000}",
+            "1.0", None, None, 16384, 8192, 12, 20250101120000, None, 1, "Licença ativa.", epoch,
+        )
+
+
+def _per_row(db, columns, count: int, commit_each: bool) -> float:
+    query = f"INSERT INTO access_logs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    started = time.perf_counter()
+    with db.get_conn() as conn:
+        cur = db.get_cursor(conn)
+        for row in _rows(count):
+            cur.execute(query, row)
+            if commit_each:
+                conn.commit()
+        conn.commit()
+    return time.perf_counter() - started
+
+
+def _bulk(db, columns, count: int) -> float:
+    started = time.perf_counter()
+    db.bulk_insert("access_logs", columns, _rows(count))
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de bulk_insert")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--temp", action="store_true", help="usa um SQLite temporário")
+    parser.add_argument("--per-row-max", type=int, default=100000,
+                        help="maior tamanho medido no caminho linha a linha (o commit por linha vai até 1/10 disso)")
+    args = parser.parse_args()
+
+    if args.temp:
+        os.environ["DB_TYPE"] = "sqlite"
+        os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_bulk.db")
+
+    import db
+    from log_writer import ACCESS_LOG_COLUMNS
+
+    db.init_db()
+    backend = "MySQL" if db.USE_MYSQL else "SQLite"
+    print(f"Banco: {backend}")
+    print(f"{'linhas':>10} {'modo':<22} {'tempo (s)':>10} {'linhas/s':>12}")
+
+    for size in args.sizes:
+        runs = [("bulk_insert", lambda: _bulk(db, ACCESS_LOG_COLUMNS, size))]
+        if size <= args.per_row_max:
+            runs.append(("execute por linha", lambda: _per_row(db, ACCESS_LOG_COLUMNS, size, False)))
+        if size <= args.per_row_max // 10:
+            runs.append(("commit por linha", lambda: _per_row(db, ACCESS_LOG_COLUMNS, size, True)))
+        for name, run in runs:
+            elapsed = run()
+            print(f"{size:>10} {name:<22} {elapsed:>10.3f} {size / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
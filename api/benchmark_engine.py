@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark do VerifyEngine, sem Flask nem HTTP.
+
+Monta VerifyRequests assinadas e chama o engine direto, com MemoryStorage
+(só a lógica de decisão + token) e com DatabaseStorage (banco configurado ou,
+com --temp, um SQLite temporário com o schema das migrações). Mede verify()
+uma a uma e verify_many() em lotes.
+
+Uso (a partir da pasta api/):
+
+    python benchmark_engine.py --temp                  # 20k verificações, 1000 devices
+    python benchmark_engine.py --temp --requests 100000 --batch 200
+    python benchmark_engine.py --storage memory        # só em memória
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SECRET = "benchmark-secret"
+os.environ.setdefault("SHARED_SECRET", SECRET)
+
+
+def _requests(VerifyRequest, count: int, devices: int, compact: bool):
+    ts = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    secret = os.environ["SHARED_SECRET"]
+    reqs = []
+    for i in range(count):
+        device_id = f"BENCH{i % devices:06d}"
+        sig = hashlib.sha256(f"{device_id}|1.0|{ts}|{secret}".encode("utf-8")).hexdigest()
+        reqs.append(VerifyRequest(
+            device_id, "1.0", ts, sig,
+            # Um IP/hostname fixo por device: sem clones detectados no meio da medição
+            ip=f"10.0.{i % devices // 250}.{i % devices % 250}", user_agent="bench",
+            telemetry={"hostname": f"host{i % devices}"}, compact=compact,
+        ))
+    return reqs
+
+
+def _populate_database(devices: int) -> None:
+    from db import bulk_insert
+
+    bulk_insert(
+        "devices",
+        ("device_id", "license_type", "status", "start_date", "end_date"),
+        ((f"BENCH{i:06d}", "anual", "active", "2025-01-01", "2099-01-01") for i in range(devices)),
+        ignore_duplicates=True,
+    )
+
+
+def _measure(label: str, engine, reqs, batch: int) -> None:
+    started = time.perf_counter()
+    if batch > 1:
+        statuses = []
+        for start in range(0, len(reqs), batch):
+            statuses.extend(r.status for r in engine.verify_many(reqs[start:start + batch]))
+    else:
+        statuses = [engine.verify(req).status for req in reqs]
+    elapsed = time.perf_counter() - started
+    errors = sum(1 for status in statuses if status != 200)
+    mode = f"lote {batch}" if batch > 1 else "uma a uma"
+    print(f"{label:<10} {mode:<12} {len(reqs) / elapsed:>12,.0f} {elapsed / len(reqs) * 1e6:>10.1f} {errors:>7}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmark do VerifyEngine")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=100, help="tamanho do lote de verify_many")
+    parser.add_argument("--storage", choices=("memory", "database", "all"), default="all")
+    parser.add_argument("--format", choices=("1", "2"), default="1", help="formato da resposta")
+    parser.add_argument("--temp", action="store_true", help="usa um SQLite temporário")
+    args = parser.parse_args()
+
+    if args.temp:
+        os.environ["DB_TYPE"] = "sqlite"
+        os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_engine.db")
+    os.environ.setdefault("ALLOW_AUTO_PROVISION", "false")
+    logging.disable(logging.WARNING)
+
+    from license_service import flush_access_logs
+    from verify_engine import DatabaseStorage, MemoryStorage, VerifyEngine, VerifyRequest
+
+    reqs = _requests(VerifyRequest, args.requests, args.devices, args.format == "2")
+    print(f"{args.requests} verificações, {args.devices} devices, formato v{args.format}")
+    print(f"{'storage':<10} {'modo':<12} {'verif./s':>12} {'µs/verif.':>10} {'erros':>7}")
+
+    if args.storage in ("memory", "all"):
+        devices = [
+            {"device_id": f"BENCH{i:06d}", "license_type": "anual", "status": "active",
+             "start_date": "2025-01-01", "end_date": "2099-01-01"}
+            for i in range(args.devices)
+        ]
+        for batch in (1, args.batch):
+            _measure("memória", VerifyEngine(MemoryStorage(devices)), reqs, batch)
+
+    if args.storage in ("database", "all"):
+        import db
+
+        db.init_db()
+        _populate_database(args.devices)
+        engine = VerifyEngine(DatabaseStorage())
+        for batch in (1, args.batch):
+            _measure("SQLite" if not db.USE_MYSQL else "MySQL", engine, reqs, batch)
+        flush_access_logs()
+
+
+if __name__ == "__main__":
+    main()
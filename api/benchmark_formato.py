@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark do corpo da resposta do /verify: formato v1 versus v2 (?format=2).
+
+Mede, para o mesmo device, o tempo de montar + assinar + serializar a resposta
+e o tamanho do JSON gerado, como o Flask serializa (chaves ordenadas, compacto).
+
+Uso (a partir da pasta api/):
+
+    python benchmark_formato.py                 # 100k respostas de cada formato
+    python benchmark_formato.py --responses 500000
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("SHARED_SECRET", "benchmark-secret")
+
+from license_service import (  # noqa: E402
+    build_compact_response,
+    build_config_payload,
+    build_license_token,
+    build_unchanged_response,
+)
+
+DEVICE = {
+    "device_id": "A1B2C3D4E5F6-0001",
+    "license_type": "anual",
+    "status": "active",
+    "features": "core,premium",
+    "custom_interval": None,
+    "update_url": None,
+}
+EFFECTIVE_END = "2099-12-31"
+FINGERPRINT = "61d8a47357c7756f"
+
+
+def _dumps(payload) -> str:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+
+def _v1(now):
+    cfg = build_config_payload(DEVICE, EFFECTIVE_END)
+    token = build_license_token(DEVICE["device_id"], DEVICE, EFFECTIVE_END, cfg.get("features", []), now)
+    return _dumps({"allow": True, "msg": "Licença ativa.", "config": cfg, "license_token": token})
+
+
+def _v2(now):
+    cfg = build_config_payload(DEVICE, EFFECTIVE_END)
+    return _dumps(build_compact_response(
+        True, "Licença ativa.", DEVICE["device_id"], DEVICE, EFFECTIVE_END, cfg, now, FINGERPRINT
+    ))
+
+
+def _unchanged(now):
+    return _dumps(build_unchanged_response(
+        True, FINGERPRINT, DEVICE["device_id"], EFFECTIVE_END, now, 30, compact=True
+    ))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark dos formatos de resposta do /verify")
+    parser.add_argument("--responses", type=int, default=100000)
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    print(f"{'formato':<16} {'bytes':>7} {'µs/resposta':>12} {'respostas/s':>13}")
+    for name, build in (("v1", _v1), ("v2", _v2), ("v2 inalterado", _unchanged)):
+        size = len(build(now).encode("utf-8"))
+        started = time.perf_counter()
+        for _ in range(args.responses):
+            build(now)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<16} {size:>7} {elapsed / args.responses * 1e6:>12.2f} {args.responses / elapsed:>13,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de leitura de linhas: listagem grande de /admin/devices.
+
+Compara o caminho antigo (sqlite3.Row / dict do DictCursor + cópia para dict
+por linha) com db.Row (tupla do driver + índice compartilhado), medindo
+fetch + serialização JSON da lista inteira.
+
+Uso (a partir da pasta api/):
+
+    python benchmark_rows.py                 # 50k linhas
+    python benchmark_rows.py --rows 200000
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+
+from db import DatabaseCursor, Row
+
+COLUMNS = (
+    "id, device_id, owner_name, cpf, email, address, license_type, status, start_date, end_date, "
+    "custom_interval, features, last_seen_at, last_seen_ip, last_hostname, last_version, created_by"
+)
+QUERY = f"SELECT {COLUMNS} FROM devices ORDER BY id DESC"
+
+
+def _populate(conn, rows: int) -> None:
+    conn.execute(f"CREATE TABLE devices ({COLUMNS.replace(',', ' ,')}, created_at TEXT)")
+    conn.executemany(
+        "INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (i, f"DEV{i:08d}", f"Cliente {i}", "000.000.000-00", f"c{i}@exemplo.com", "Rua X, 1",
+             "anual", "active", "2025-01-01", "2026-01-01", 60, "core", "2025-06-01 12:00:00",
+             "10.0.0.1", f"host{i}", "1.0", "admin", "2025-01-01 00:00:00")
+            for i in range(rows)
+        ),
+    )
+    conn.commit()
+
+
+def _timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmark de Row")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    _populate(conn, args.rows)
+
+    def default(o):
+        if isinstance(o, Row):
+            return o.as_dict()
+        raise TypeError
+
+    def sqlite_antigo():
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        cur.execute(QUERY)
+        items = [{key: row[key] for key in row.keys()} for row in cur.fetchall()]
+        conn.row_factory = None
+        return json.dumps({"items": items})
+
+    def mysql_antigo():
+        # Simula DictCursor (dict por linha) + row.copy() do admin_devices antigo
+        cur = conn.cursor()
+        cur.execute(QUERY)
+        fields = [d[0] for d in cur.description]
+        items = [dict(zip(fields, values)).copy() for values in cur.fetchall()]
+        return json.dumps({"items": items})
+
+    def row_novo():
+        cur = DatabaseCursor(conn, conn.cursor())
+        cur.execute(QUERY)
+        return json.dumps({"items": cur.fetchall()}, default=default)
+
+    def fetch_antigo():
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        cur.execute(QUERY)
+        items = [{key: row[key] for key in row.keys()} for row in cur.fetchall()]
+        conn.row_factory = None
+        return items
+
+    def fetch_novo():
+        cur = DatabaseCursor(conn, conn.cursor())
+        cur.execute(QUERY)
+        return cur.fetchall()
+
+    print("=" * 60)
+    print(f"Microbenchmark Row — {args.rows} linhas, melhor de {args.repeat}")
+    print("=" * 60)
+    results = [
+        ("fetch: sqlite3.Row + dict", _timed(fetch_antigo, args.repeat)),
+        ("fetch: db.Row", _timed(fetch_novo, args.repeat)),
+        ("fetch+json: sqlite3.Row + dict", _timed(sqlite_antigo, args.repeat)),
+        ("fetch+json: DictCursor + copy", _timed(mysql_antigo, args.repeat)),
+        ("fetch+json: db.Row", _timed(row_novo, args.repeat)),
+    ]
+    for name, seconds in results:
+        print(f"{name:>32}: {seconds * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark do /verify sobre SQLite: compara perfis de configuração do banco.
+
+Cada perfil roda em um subprocesso com um banco temporário próprio, dispara
+requisições /verify assinadas a partir de várias threads (Flask test client)
+e mede throughput e latência.
+
+Uso (a partir da pasta api/):
+
+    python benchmark_verify.py                      # 8 threads x 250 requisições
+    python benchmark_verify.py --threads 16 --requests 500 --devices 200
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+SECRET = "benchmark-secret"
+
+# Perfis comparados (variáveis de ambiente aplicadas ao subprocesso)
+PROFILES = {
+    "legado": {
+        "SQLITE_POOL_SIZE": "0",
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_CACHE_SIZE": "-2000",
+        "SQLITE_MMAP_SIZE": "0",
+    },
+    "otimizado": {},
+}
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def run_worker(threads: int, requests_per_thread: int, devices: int) -> dict:
+    """Executado dentro do subprocesso: popula o banco e mede o /verify."""
+    import logging
+
+    logging.disable(logging.WARNING)
+    import app as app_module
+    from db import get_conn, get_cursor
+
+    with get_conn() as conn:
+        cur = get_cursor(conn)
+        for i in range(devices):
+            cur.execute(
+                "INSERT INTO devices (device_id, license_type, status, start_date, end_date) "
+                "VALUES (?, 'anual', 'active', '2025-01-01', '2099-01-01')",
+                (f"BENCH{i:06d}",),
+            )
+        conn.commit()
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index: int) -> None:
+        client = app_module.app.test_client()
+        local = []
+        for n in range(requests_per_thread):
+            device_id = f"BENCH{(index * requests_per_thread + n) % devices:06d}"
+            ts = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+            sig = hashlib.sha256(f"{device_id}|1.0|{ts}|{SECRET}".encode("utf-8")).hexdigest()
+            started = time.perf_counter()
+            resp = client.get(
+                "/verify",
+                query_string={"id": device_id, "version": "1.0", "ts": ts, "sig": sig, "hostname": f"host{index}"},
+                headers={"X-Forwarded-For": f"10.0.{index}.1"},
+            )
+            local.append(time.perf_counter() - started)
+            if resp.status_code != 200:
+                with lock:
+                    errors.append(resp.status_code)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total = threads * requests_per_thread
+    return {
+        "requests": total,
+        "errors": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def run_profile(name: str, overrides: dict, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update({
+            "DB_TYPE": "sqlite",
+            "DB_PATH": os.path.join(tmp, "bench.db"),
+            "SHARED_SECRET": SECRET,
+            "API_KEY": "",
+            "ALLOW_AUTO_PROVISION": "false",
+            # Mede o caminho completo do /verify, sem requisições recusadas por limite de taxa
+            "RATE_LIMIT_ENABLED": "false",
+        })
+        env.update(overrides)
+        cmd = [
+            sys.executable, os.path.abspath(__file__), "--worker",
+            "--threads", str(args.threads),
+            "--requests", str(args.requests),
+            "--devices", str(args.devices),
+        ]
+        out = subprocess.run(
+            cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark do /verify (SQLite)")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=250, help="requisições por thread")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--profile", choices=sorted(PROFILES), action="append")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.threads, args.requests, args.devices)))
+        return
+
+    print("=" * 60)
+    print(f"Benchmark /verify — {args.threads} threads x {args.requests} req, {args.devices} devices")
+    print("=" * 60)
+    results = {}
+    for name in args.profile or list(PROFILES):
+        results[name] = run_profile(name, PROFILES[name], args)
+        r = results[name]
+        print(f"{name:>10}: {r['rps']:>8} req/s  p50={r['p50_ms']}ms  p99={r['p99_ms']}ms  erros={r['errors']}")
+
+    if "legado" in results and "otimizado" in results and results["legado"]["rps"]:
+        ganho = results["otimizado"]["rps"] / results["legado"]["rps"]
+        print(f"\nGanho de throughput: {ganho:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Detecção de clones em memória (janela deslizante por device).
+
+Mantém, para cada Device ID, um buffer circular com as últimas observações
+permitidas (ip, hostname, timestamp) e o último IP/hostname visto. Aplica a
+mesma política da consulta em access_logs (MAX_SIMULTANEOUS_IPS dentro de
+CLONE_DETECTION_WINDOW e troca simultânea de IP + hostname) sem tocar no
+banco. Atualizar é O(1) e a memória é limitada a `max_devices` x `per_device`
+observações (LRU entre devices).
+
+O estado vale por processo: com vários workers, use
+CLONE_DETECTION_BACKEND=database ou fixe cada device em um worker.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Optional, Tuple
+
+
+class _DeviceWindow:
+    __slots__ = ("observations", "last_ip", "last_hostname")
+
+    def __init__(self, per_device: int):
+        self.observations = deque(maxlen=per_device)  # (ip, hostname, ts) permitidas
+        self.last_ip = None
+        self.last_hostname = None
+
+
+class CloneDetector:
+    def __init__(self, window: int = 300, max_ips: int = 1, per_device: int = 20, max_devices: int = 100000):
+        self.window = window
+        self.max_ips = max_ips
+        self.per_device = per_device
+        self.max_devices = max(1, max_devices)
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.detections = 0
+        self.evictions = 0
+
+    def record(self, device_id: str, ip: str, hostname: str, allowed: bool, ts: Optional[float] = None) -> None:
+        """Registra um acesso (chamado depois da decisão do /verify)."""
+        ts = int(time.time() if ts is None else ts)
+        ip = ip or ""
+        hostname = hostname or ""
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._devices[device_id] = _DeviceWindow(self.per_device)
+                if len(self._devices) > self.max_devices:
+                    self._devices.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._devices.move_to_end(device_id)
+            state.last_ip = ip
+            state.last_hostname = hostname
+            if allowed:
+                obs = (ip, hostname, ts)
+                # Equivalente ao SELECT DISTINCT ip, hostname, created_at
+                if not state.observations or state.observations[-1] != obs:
+                    state.observations.append(obs)
+
+    def check(self, device_id: str, current_ip: str, current_hostname: str, now: Optional[float] = None) -> Tuple[bool, Optional[str]]:
+        now = time.time() if now is None else now
+        cutoff = now - self.window
+        with self._lock:
+            self.checks += 1
+            state = self._devices.get(device_id)
+            if state is None:
+                return (False, None)
+            recent = [obs for obs in state.observations if obs[2] >= cutoff]
+            last_ip = state.last_ip or ""
+            last_hostname = state.last_hostname or ""
+
+        if len(recent) < 2:
+            return (False, None)  # Não há acessos suficientes para detectar clone
+
+        unique_ips = {obs[0] for obs in recent if obs[0]}
+        if len(unique_ips) > self.max_ips:
+            self.detections += 1
+            ips_list = ", ".join(sorted(unique_ips))
+            return (
+                True,
+                f"Uso simultâneo detectado de {len(unique_ips)} IPs diferentes: {ips_list}. Licença bloqueada por possível clonagem."
+            )
+
+        if (current_ip != last_ip and
+                current_hostname != last_hostname and
+                last_hostname and
+                current_hostname):
+            self.detections += 1
+            return (
+                True,
+                f"Mudança suspeita detectada: IP {last_ip} → {current_ip}, Hostname {last_hostname} → {current_hostname}. Possível clonagem."
+            )
+
+        return (False, None)
+
+    def forget(self, device_id: str) -> None:
+        with self._lock:
+            self._devices.pop(device_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._devices.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "devices": len(self._devices),
+                "max_devices": self.max_devices,
+                "window_s": self.window,
+                "checks": self.checks,
+                "detections": self.detections,
+                "evictions": self.evictions,
+            }
+
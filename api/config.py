@@ -10,6 +10,19 @@ load_dotenv()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.getenv("DB_PATH", os.path.join(BASE_DIR, "license.db"))
 
+# Ajustes do SQLite (aplicados em cada conexão do pool, ver db._get_sqlite_connection)
+# WAL permite leituras concorrentes com escrita; NORMAL evita fsync a cada commit no WAL
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+# Espera (ms) por lock antes de "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Negativo = KiB (-16000 ≈ 16 MB de cache de páginas por conexão)
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))
+# Bytes mapeados em memória para leitura (0 desativa)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+# Conexões persistentes mantidas pelo processo; 0 = abrir/fechar a cada uso
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+
 # Configuração MySQL (HostGator)
 DB_TYPE = os.getenv("DB_TYPE", "sqlite").lower()  # "sqlite" ou "mysql"
 
@@ -22,6 +35,27 @@ MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "")
 MYSQL_USER = os.getenv("MYSQL_USER", "")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "")
 
+# Pool de conexões MySQL (ver db.ConnectionPool)
+MYSQL_POOL_MIN = int(os.getenv("MYSQL_POOL_MIN", "1"))
+MYSQL_POOL_MAX = int(os.getenv("MYSQL_POOL_MAX", "10"))
+# Tempo máximo (s) esperando uma conexão livre antes de falhar
+MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "10"))
+# Idade máxima (s) de uma conexão antes de ser reciclada (abaixo do wait_timeout do servidor)
+MYSQL_POOL_MAX_AGE = int(os.getenv("MYSQL_POOL_MAX_AGE", "1800"))
+# Conexões ociosas há mais que isso (s) recebem ping no checkout; 0 = ping sempre
+MYSQL_POOL_PING_INTERVAL = int(os.getenv("MYSQL_POOL_PING_INTERVAL", "30"))
+
+# Migrações do schema (ver migrations.py)
+# true: aplica migrações pendentes na primeira conexão do processo (startup)
+# false: schema gerenciado apenas via "python migrations.py" no deploy
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "true").lower() == "true"
+
+# Escrita em lote (db.bulk_insert / db.bulk_upsert)
+# Linhas por statement (MySQL: INSERT multi-linha) ou por executemany (SQLite)
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", "1000"))
+# Tamanho estimado máximo (bytes) de cada INSERT multi-linha; manter abaixo do max_allowed_packet
+BULK_MAX_PACKET_BYTES = int(os.getenv("BULK_MAX_PACKET_BYTES", str(1024 * 1024)))
+
 # Connection string MySQL (para uso com pymysql)
 if DB_TYPE == "mysql":
     MYSQL_CONNECTION_STRING = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}?charset=utf8mb4"
@@ -62,11 +96,122 @@ DEFAULT_CONFIG = {
     "message": "",
 }
 
+# Intervalo adaptativo (build_config_payload): sem custom_interval, licenças
+# estáveis checam menos; sob carga/erros todos os intervalos são esticados.
+ADAPTIVE_INTERVAL = os.getenv("ADAPTIVE_INTERVAL", "true").lower() == "true"
+# Requisições/s no /verify (por processo) a partir das quais o intervalo cresce
+ADAPTIVE_TARGET_RPS = float(os.getenv("ADAPTIVE_TARGET_RPS", "200"))
+# Fração de respostas 5xx que dobra o intervalo
+ADAPTIVE_ERROR_THRESHOLD = float(os.getenv("ADAPTIVE_ERROR_THRESHOLD", "0.05"))
+# Multiplicador máximo por carga e teto absoluto do intervalo (s)
+ADAPTIVE_MAX_FACTOR = float(os.getenv("ADAPTIVE_MAX_FACTOR", "4"))
+ADAPTIVE_MAX_INTERVAL = int(os.getenv("ADAPTIVE_MAX_INTERVAL", "900"))
+# Vitalícias checam N vezes menos; licenças com mais de LONG_DAYS dias restantes, 2x menos
+ADAPTIVE_STABLE_FACTOR = float(os.getenv("ADAPTIVE_STABLE_FACTOR", "4"))
+ADAPTIVE_LONG_LICENSE_DAYS = int(os.getenv("ADAPTIVE_LONG_LICENSE_DAYS", "30"))
+# Jitter determinístico por device: intervalo varia ±N (fração) para espalhar os clientes
+INTERVAL_JITTER = float(os.getenv("INTERVAL_JITTER", "0.2"))
+
 # Lista rápida de IDs bloqueados (hardcoded)
 HARDCODED_BLOCKLIST = [
     # "12345ABC",
 ]
 
+# Intervalo (s) para conferir mudanças em blocked_devices e recarregar o snapshot em memória
+BLOCKLIST_REFRESH_SECONDS = int(os.getenv("BLOCKLIST_REFRESH_SECONDS", "30"))
+
+# Cache em memória dos registros de devices usados pelo /verify
+# TTL (s) limita a defasagem entre workers; 0 desativa o cache
+DEVICE_CACHE_TTL = int(os.getenv("DEVICE_CACHE_TTL", "60"))
+DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", "50000"))
+
+# Retentativas do /verify com a mesma assinatura (id, version, ts, sig) e IP recebem a
+# resposta já calculada, sem tocar no banco. Vale por MAX_TIME_SKEW; 0 desativa.
+VERIFY_REPLAY_CACHE_SIZE = int(os.getenv("VERIFY_REPLAY_CACHE_SIZE", "10000"))
+
+# Máximo de devices por chamada ao POST /verify/batch
+VERIFY_BATCH_MAX = int(os.getenv("VERIFY_BATCH_MAX", "500"))
+
+# Limite de taxa do /verify (token bucket por chave, em memória; ver rate_limiter.py).
+# Checado logo após timestamp/assinatura; excedido = 429 com Retry-After.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Por Device ID: fichas por segundo e rajada máxima (o cliente checa a cada 30s+)
+RATE_LIMIT_DEVICE_RATE = float(os.getenv("RATE_LIMIT_DEVICE_RATE", "0.2"))
+RATE_LIMIT_DEVICE_BURST = float(os.getenv("RATE_LIMIT_DEVICE_BURST", "10"))
+# Por IP, desligado por padrão: só o POST /verify/batch gasta (uma ficha por
+# chamada); o /verify avulso conta só com o limite por device, já que muitos
+# devices legítimos saem pelo mesmo NAT. Loopback e IP desconhecido nunca são
+# limitados. Ao ligar, dimensione pelo número de gateways x 1/intervalo.
+RATE_LIMIT_IP_ENABLED = os.getenv("RATE_LIMIT_IP_ENABLED", "false").lower() == "true"
+RATE_LIMIT_IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", "1"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "10"))
+# Chaves acompanhadas por limitador (LRU)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Gravação de access_logs em lote, fora da requisição (ver log_writer.py)
+ACCESS_LOG_ASYNC = os.getenv("ACCESS_LOG_ASYNC", "true").lower() == "true"
+ACCESS_LOG_QUEUE_SIZE = int(os.getenv("ACCESS_LOG_QUEUE_SIZE", "10000"))
+ACCESS_LOG_BATCH_SIZE = int(os.getenv("ACCESS_LOG_BATCH_SIZE", "500"))
+# Tempo máximo (s) que uma linha espera na fila antes do lote ser gravado
+ACCESS_LOG_FLUSH_INTERVAL = float(os.getenv("ACCESS_LOG_FLUSH_INTERVAL", "1.0"))
+# Fila cheia: "drop" descarta (e conta); "block" espera alguns ms antes de descartar
+ACCESS_LOG_FULL_POLICY = os.getenv("ACCESS_LOG_FULL_POLICY", "drop").lower()
+
+# Retenção de access_logs (ver retencao.py): arquiva e apaga acessos antigos,
+# diariamente às RETENTION_HOUR:30 pelo scheduler do app. Desligada por padrão:
+# apaga linhas de vez, e o arquivo precisa estar em disco persistente
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "90"))
+RETENTION_HOUR = int(os.getenv("RETENTION_HOUR", "3"))
+# Pasta dos arquivos .jsonl.gz; vazio = apaga sem arquivar
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", os.path.join(BASE_DIR, "arquivo"))
+# Lote máximo por transação e duração-alvo de cada uma (o lote encolhe/cresce para caber)
+RETENTION_CHUNK_ROWS = int(os.getenv("RETENTION_CHUNK_ROWS", "2000"))
+RETENTION_CHUNK_MAX_MS = int(os.getenv("RETENTION_CHUNK_MAX_MS", "200"))
+# Pausa entre lotes (deixa o /verify gravar) e tempo máximo por execução (s)
+RETENTION_PAUSE_MS = int(os.getenv("RETENTION_PAUSE_MS", "50"))
+RETENTION_MAX_RUNTIME = float(os.getenv("RETENTION_MAX_RUNTIME", "600"))
+# Páginas devolvidas por passo do PRAGMA incremental_vacuum (SQLite)
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))
+
+# Agregados horários/diários de access_logs (ver rollups.py), atualizados a
+# cada ROLLUP_INTERVAL_MINUTES pelo scheduler e antes de cada retenção
+ROLLUP_ENABLED = os.getenv("ROLLUP_ENABLED", "true").lower() == "true"
+ROLLUP_INTERVAL_MINUTES = int(os.getenv("ROLLUP_INTERVAL_MINUTES", "5"))
+# Linhas de access_logs por transação e tempo máximo por execução (s)
+ROLLUP_CHUNK_ROWS = int(os.getenv("ROLLUP_CHUNK_ROWS", "5000"))
+ROLLUP_MAX_RUNTIME = float(os.getenv("ROLLUP_MAX_RUNTIME", "120"))
+# Acessos mais novos que isso (s) esperam a próxima execução (transações ainda abertas)
+ROLLUP_LAG_SECONDS = int(os.getenv("ROLLUP_LAG_SECONDS", "60"))
+
+# Atualização de last_seen_* agregada em memória (ver presence.py)
+PRESENCE_COALESCE = os.getenv("PRESENCE_COALESCE", "true").lower() == "true"
+# Intervalo (s) entre gravações em lote
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "10"))
+# Sem mudança de IP/versão/hostname, regrava last_seen_at no máximo a cada N segundos
+PRESENCE_MAX_STALENESS = float(os.getenv("PRESENCE_MAX_STALENESS", "300"))
+
+# ---------------------------------------------------------------------------
+# Logging (ver log_setup.py)
+# ---------------------------------------------------------------------------
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" (formato padrão do logging, o de sempre) ou "json" (uma linha JSON por registro)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Escrita no stderr por uma thread própria (QueueHandler/QueueListener)
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fração registrada por evento (formato: evento=taxa,evento=taxa); eventos
+# ausentes usam LOG_SAMPLE_DEFAULT. WARNING ou acima nunca é amostrado.
+LOG_SAMPLE_DEFAULT = float(os.getenv("LOG_SAMPLE_DEFAULT", "1.0"))
+LOG_SAMPLE_RATES = {}
+for _item in os.getenv(
+    "LOG_SAMPLE_RATES",
+    "verify.request=0.01,verify.timestamp=0.01,verify.device=0.01,verify.allow=0.01,verify.replay=0.01,verify.batch=0.1,verify.shed=0.01",
+).split(","):
+    _name, _sep, _rate = _item.partition("=")
+    if _sep and _name.strip():
+        LOG_SAMPLE_RATES[_name.strip()] = max(0.0, min(1.0, float(_rate)))
+
 # ---------------------------------------------------------------------------
 # Detecção de clones (anti-pirataria)
 # ---------------------------------------------------------------------------
@@ -76,6 +221,14 @@ ENABLE_CLONE_DETECTION = os.getenv("ENABLE_CLONE_DETECTION", "true").lower() ==
 MAX_SIMULTANEOUS_IPS = int(os.getenv("MAX_SIMULTANEOUS_IPS", "1"))
 # Janela de tempo (em segundos) para considerar acessos como "simultâneos"
 CLONE_DETECTION_WINDOW = int(os.getenv("CLONE_DETECTION_WINDOW", "300"))  # 5 minutos
+# "memory": janela deslizante por device em memória (um processo);
+# "database": consulta access_logs a cada /verify (vários workers)
+CLONE_DETECTION_BACKEND = os.getenv("CLONE_DETECTION_BACKEND", "memory").lower()
+# Observações guardadas por device e devices acompanhados (LRU)
+CLONE_DETECTOR_PER_DEVICE = int(os.getenv("CLONE_DETECTOR_PER_DEVICE", "20"))
+CLONE_DETECTOR_MAX_DEVICES = int(os.getenv("CLONE_DETECTOR_MAX_DEVICES", "100000"))
+# Máximo de access_logs relidos no startup para reconstruir a janela
+CLONE_DETECTOR_REBUILD_LIMIT = int(os.getenv("CLONE_DETECTOR_REBUILD_LIMIT", "200000"))
 
 # ---------------------------------------------------------------------------
 # Configuração de Email (SMTP)
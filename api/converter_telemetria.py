@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Converte o telemetry_json das linhas antigas de access_logs (anteriores à
+migração 007) para as colunas tipadas: username_id, osbuild_id, ram_total_mb,
+ram_free_mb, cpu_load_pct e client_time. Em telemetry_json ficam só os extras
+(NULL se não houver nenhum).
+
+Percorre a tabela por id, um lote por transação, e pode ser interrompido e
+rodado de novo: o JSON antigo sempre tem "hostname" (o formato novo nunca
+guarda esse campo nos extras), então linhas já convertidas são puladas.
+
+Uso (a partir da pasta api/):
+
+    python converter_telemetria.py                 # converte tudo
+    python converter_telemetria.py --chunk 500     # lotes menores (menos tempo de lock)
+    python converter_telemetria.py --dry-run       # só conta e estima a economia
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from db import get_conn, get_cursor
+from telemetry import TELEMETRY_COLUMNS, compact_telemetry, resolve_labels
+
+
+def _convert(row):
+    """(colunas tipadas..., telemetry_json novo) ou None se a linha já estiver convertida."""
+    try:
+        telemetry = json.loads(row["telemetry_json"])
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(telemetry, dict) or "hostname" not in telemetry:
+        return None
+    return compact_telemetry(telemetry)
+
+
+def convert_access_logs(chunk: int = 2000, dry_run: bool = False, pause_ms: int = 20) -> dict:
+    report = {"rows_scanned": 0, "rows_converted": 0, "json_bytes_before": 0, "json_bytes_after": 0}
+    started = time.monotonic()
+    last_id = 0
+    assignments = ", ".join(f"{column} = ?" for column in TELEMETRY_COLUMNS)
+    while True:
+        with get_conn() as conn:
+            cur = get_cursor(conn)
+            cur.execute(
+                """
+                SELECT id, telemetry_json FROM access_logs
+                WHERE id > ? AND telemetry_json IS NOT NULL
+                ORDER BY id
+                LIMIT ?
+                """,
+                (last_id, chunk),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            report["rows_scanned"] += len(rows)
+
+            updates = []
+            for row in rows:
+                converted = _convert(row)
+                if converted is None:
+                    continue
+                report["json_bytes_before"] += len(row["telemetry_json"].encode("utf-8"))
+                report["json_bytes_after"] += len((converted[-1] or "").encode("utf-8"))
+                updates.append(converted + (row["id"],))
+            report["rows_converted"] += len(updates)
+            if updates and not dry_run:
+                # Colunas na ordem de TELEMETRY_COLUMNS + telemetry_json + id
+                updates = resolve_labels(updates, TELEMETRY_COLUMNS + ("telemetry_json", "id"), conn=conn)
+                cur.executemany(
+                    f"UPDATE access_logs SET {assignments}, telemetry_json = ? WHERE id = ?",
+                    updates,
+                )
+                conn.commit()
+        time.sleep(pause_ms / 1000)
+    report["elapsed_s"] = round(time.monotonic() - started, 3)
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Converte telemetry_json antigo para colunas tipadas")
+    parser.add_argument("--chunk", type=int, default=2000, help="linhas por transação")
+    parser.add_argument("--dry-run", action="store_true", help="só conta, sem gravar")
+    args = parser.parse_args()
+
+    report = convert_access_logs(chunk=max(1, args.chunk), dry_run=args.dry_run)
+    for key, value in report.items():
+        print(f"  {key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
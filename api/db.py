@@ -1,14 +1,19 @@
 from contextlib import contextmanager
 import hashlib
 import sqlite3
+import threading
+import time
 from pathlib import Path
+from typing import Callable, Dict, List
 import os
 
 import config
+from sql_compiler import MYSQL, SQLITE, compile_query
 
 # Suporte a MySQL
 DB_TYPE = getattr(config, "DB_TYPE", "sqlite").lower()
 USE_MYSQL = DB_TYPE == "mysql"
+DIALECT = MYSQL if USE_MYSQL else SQLITE
 
 if USE_MYSQL:
     try:
@@ -22,6 +27,7 @@ else:
     MYSQL_AVAILABLE = False
 
 DB_PATH = Path(config.DB_PATH) if not USE_MYSQL else None
+AUTO_MIGRATE = getattr(config, "AUTO_MIGRATE", True)
 
 
 def _hash_admin_password(raw: str) -> str:
@@ -41,7 +47,7 @@ def _get_mysql_connection():
         password=config.MYSQL_PASSWORD,
         database=config.MYSQL_DATABASE,
         charset='utf8mb4',
-        cursorclass=pymysql.cursors.DictCursor,
+        cursorclass=pymysql.cursors.Cursor,  # tuplas; DatabaseCursor devolve Row
         autocommit=False
     )
 
@@ -60,332 +66,412 @@ def _execute_mysql_query(conn, query: str, params=None):
         raise
 
 
-def init_db() -> None:
-    """Cria as tabelas básicas em SQLite ou MySQL, se ainda não existirem."""
-    
-    if USE_MYSQL:
-        if not MYSQL_AVAILABLE:
-            raise ImportError("MySQL configurado mas pymysql não está instalado. Execute: pip install pymysql")
-        
-        conn = _get_mysql_connection()
-        cur = conn.cursor()
-        
+class PoolTimeoutError(RuntimeError):
+    """Nenhuma conexão livre no pool dentro do tempo limite de checkout."""
+
+
+class ConnectionPool:
+    """
+    Pool de conexões thread-safe e limitado (usado para MySQL).
+
+    - min_size conexões são abertas no primeiro uso; no máximo max_size coexistem.
+    - Checkout espera até `timeout` segundos por uma conexão livre.
+    - Conexões com mais de `max_age` segundos são recicladas no checkout.
+    - Conexões ociosas há mais de `ping_interval` segundos recebem ping antes do uso.
+    """
+
+    def __init__(self, factory, min_size=1, max_size=10, timeout=10.0, max_age=1800, ping_interval=30):
+        self._factory = factory
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_age = max_age
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # pilha LIFO de (conn, created_at, released_at)
+        self._created_at = {}  # id(conn) -> created_at das conexões em uso
+        self._total = 0
+        self._warmed = False
+
+        # Métricas
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.recycled = 0
+        self.ping_failures = 0
+
+    # -- criação / descarte -------------------------------------------------
+    def _open(self):
+        conn = self._factory()
+        with self._cond:
+            self.created += 1
+        return conn
+
+    @staticmethod
+    def _close_quietly(conn) -> None:
         try:
-            # Tabela devices
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS devices (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    device_id VARCHAR(255) NOT NULL UNIQUE,
-                    owner_name VARCHAR(255),
-                    license_type VARCHAR(50) NOT NULL,
-                    status VARCHAR(50) NOT NULL DEFAULT 'active',
-                    start_date DATE NOT NULL,
-                    end_date DATE,
-                    allow_offline TINYINT NOT NULL DEFAULT 0,
-                    custom_interval INT,
-                    features TEXT,
-                    update_url TEXT,
-                    update_hash TEXT,
-                    update_version TEXT,
-                    notes TEXT,
-                    last_seen_at DATETIME,
-                    last_seen_ip VARCHAR(45),
-                    last_version VARCHAR(50),
-                    last_hostname VARCHAR(255),
-                    cpf VARCHAR(20),
-                    address TEXT,
-                    email VARCHAR(255),
-                    created_by VARCHAR(100),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    INDEX idx_device_id (device_id),
-                    INDEX idx_status (status),
-                    INDEX idx_created_by (created_by)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-            """)
-            
-            # Verificar e adicionar colunas se não existirem
-            cur.execute("SHOW COLUMNS FROM devices LIKE 'cpf'")
-            if not cur.fetchone():
-                cur.execute("ALTER TABLE devices ADD COLUMN cpf VARCHAR(20)")
-            
-            cur.execute("SHOW COLUMNS FROM devices LIKE 'address'")
-            if not cur.fetchone():
-                cur.execute("ALTER TABLE devices ADD COLUMN address TEXT")
-            
-            cur.execute("SHOW COLUMNS FROM devices LIKE 'email'")
-            if not cur.fetchone():
-                cur.execute("ALTER TABLE devices ADD COLUMN email VARCHAR(255)")
-            
-            cur.execute("SHOW COLUMNS FROM devices LIKE 'created_by'")
-            if not cur.fetchone():
-                cur.execute("ALTER TABLE devices ADD COLUMN created_by VARCHAR(100)")
-            
-            # Tabela blocked_devices
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS blocked_devices (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    device_id VARCHAR(255) NOT NULL UNIQUE,
-                    reason TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_device_id (device_id)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-            """)
-            
-            # Tabela access_logs
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS access_logs (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    device_id VARCHAR(255) NOT NULL,
-                    ip VARCHAR(45) NOT NULL,
-                    user_agent TEXT,
-                    hostname VARCHAR(255),
-                    client_version VARCHAR(50),
-                    telemetry_json TEXT,
-                    allowed TINYINT NOT NULL,
-                    message TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_device_id (device_id),
-                    INDEX idx_created_at (created_at)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-            """)
-            
-            # Tabela license_history
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS license_history (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    device_id VARCHAR(255) NOT NULL,
-                    action VARCHAR(100) NOT NULL,
-                    details TEXT,
-                    admin VARCHAR(100),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_device_id (device_id),
-                    INDEX idx_created_at (created_at)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-            """)
-            
-            # Tabela de usuários admin do painel
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS admin_users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(100) NOT NULL UNIQUE,
-                    password_hash VARCHAR(255) NOT NULL,
-                    must_change_password TINYINT NOT NULL DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_username (username)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-            """)
-            
-            # Tabela de usuários/revendedores
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(100) NOT NULL UNIQUE,
-                    password_hash VARCHAR(255) NOT NULL,
-                    email VARCHAR(255),
-                    role VARCHAR(50) NOT NULL DEFAULT 'user',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    INDEX idx_username (username),
-                    INDEX idx_role (role)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-            """)
-            
-            # Usuário admin padrão (admin / admin123) se não existir nenhum usuário
-            cur.execute("SELECT COUNT(1) as count FROM admin_users")
-            result = cur.fetchone()
-            count = result['count'] if result else 0
-            
-            if count == 0:
-                default_user = getattr(config, "ADMIN_DEFAULT_USER", "admin")
-                default_pass = getattr(config, "ADMIN_DEFAULT_PASSWORD", "admin123")
-                cur.execute(
-                    "INSERT INTO admin_users (username, password_hash, must_change_password) VALUES (%s, %s, 1)",
-                    (default_user, _hash_admin_password(default_pass)),
-                )
-            
-            conn.commit()
-        finally:
             conn.close()
-    else:
-        # SQLite (código original)
-        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-        
-        with sqlite3.connect(DB_PATH) as conn:
-            cur = conn.cursor()
-            
-            # Tabela devices
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS devices (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT NOT NULL UNIQUE,
-                    owner_name TEXT,
-                    license_type TEXT NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'active',
-                    start_date TEXT NOT NULL,
-                    end_date TEXT,
-                    allow_offline INTEGER NOT NULL DEFAULT 0,
-                    custom_interval INTEGER,
-                    features TEXT,
-                    update_url TEXT,
-                    update_hash TEXT,
-                    update_version TEXT,
-                    notes TEXT,
-                    last_seen_at TEXT,
-                    last_seen_ip TEXT,
-                    last_version TEXT,
-                    last_hostname TEXT,
-                    created_at TEXT DEFAULT (datetime('now')),
-                    updated_at TEXT DEFAULT (datetime('now'))
-                )
-            """)
-            
-            # Garantir colunas adicionais (cpf, address, email, created_by) mesmo em bases antigas
-            cur.execute("PRAGMA table_info(devices)")
-            existing_cols = {row[1] for row in cur.fetchall()}
-            if "cpf" not in existing_cols:
-                cur.execute("ALTER TABLE devices ADD COLUMN cpf TEXT")
-            if "address" not in existing_cols:
-                cur.execute("ALTER TABLE devices ADD COLUMN address TEXT")
-            if "email" not in existing_cols:
-                cur.execute("ALTER TABLE devices ADD COLUMN email TEXT")
-            if "created_by" not in existing_cols:
-                cur.execute("ALTER TABLE devices ADD COLUMN created_by TEXT")
-            
-            # Tabela blocked_devices
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS blocked_devices (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT NOT NULL UNIQUE,
-                    reason TEXT,
-                    created_at TEXT DEFAULT (datetime('now'))
-                )
-            """)
-            
-            # Tabela access_logs
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS access_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT NOT NULL,
-                    ip TEXT NOT NULL,
-                    user_agent TEXT,
-                    hostname TEXT,
-                    client_version TEXT,
-                    telemetry_json TEXT,
-                    allowed INTEGER NOT NULL,
-                    message TEXT,
-                    created_at TEXT DEFAULT (datetime('now'))
-                )
-            """)
-            
-            # Tabela license_history
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS license_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    device_id TEXT NOT NULL,
-                    action TEXT NOT NULL,
-                    details TEXT,
-                    admin TEXT,
-                    created_at TEXT DEFAULT (datetime('now'))
-                )
-            """)
-            
-            # Tabela de usuários admin do painel
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS admin_users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL UNIQUE,
-                    password_hash TEXT NOT NULL,
-                    must_change_password INTEGER NOT NULL DEFAULT 1,
-                    created_at TEXT DEFAULT (datetime('now'))
-                )
-            """)
-            
-            # Tabela de usuários/revendedores
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL UNIQUE,
-                    password_hash TEXT NOT NULL,
-                    email TEXT,
-                    role TEXT NOT NULL DEFAULT 'user',
-                    created_at TEXT DEFAULT (datetime('now')),
-                    updated_at TEXT DEFAULT (datetime('now'))
-                )
-            """)
-            
-            # Usuário admin padrão (admin / admin123) se não existir nenhum usuário
-            cur.execute("SELECT COUNT(1) FROM admin_users")
-            (count,) = cur.fetchone()
-            if count == 0:
-                default_user = getattr(config, "ADMIN_DEFAULT_USER", "admin")
-                default_pass = getattr(config, "ADMIN_DEFAULT_PASSWORD", "admin123")
-                cur.execute(
-                    "INSERT INTO admin_users (username, password_hash, must_change_password) VALUES (?, ?, 1)",
-                    (default_user, _hash_admin_password(default_pass)),
-                )
-            
-            conn.commit()
+        except Exception:
+            pass
+
+    def _discard(self, conn) -> None:
+        self._close_quietly(conn)
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def _warm_up(self) -> None:
+        """Abre min_size conexões no primeiro uso (best-effort: falhas ficam para o checkout)."""
+        with self._cond:
+            if self._warmed:
+                return
+            self._warmed = True
+        for _ in range(self.min_size):
+            with self._cond:
+                if self._total >= self.min_size:
+                    return
+                self._total += 1
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                    self._cond.notify()
+                return
+            now = time.monotonic()
+            with self._cond:
+                self._idle.append((conn, now, now))
+                self._cond.notify()
+
+    # -- checkout / checkin -------------------------------------------------
+    def acquire(self):
+        if not self._warmed:
+            self._warm_up()
+
+        deadline = None
+        waited_since = None
+        entry = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._total < self.max_size:
+                    self._total += 1
+                    break
+                if deadline is None:
+                    waited_since = time.monotonic()
+                    deadline = waited_since + self.timeout
+                    self.waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.wait_time += time.monotonic() - waited_since
+                    raise PoolTimeoutError(
+                        f"Pool de conexões esgotado ({self.max_size} em uso) após {self.timeout}s"
+                    )
+                self._cond.wait(remaining)
+            if waited_since is not None:
+                self.wait_time += time.monotonic() - waited_since
+            self.checkouts += 1
+
+        try:
+            conn, created_at = self._validate(entry)
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created_at[id(conn)] = created_at
+        return conn
+
+    def _validate(self, entry):
+        """Devolve (conn, created_at) utilizável: recicla antigas e testa ociosas."""
+        now = time.monotonic()
+        if entry is None:
+            return self._open(), now
+
+        conn, created_at, released_at = entry
+        if self.max_age and now - created_at > self.max_age:
+            self._close_quietly(conn)
+            with self._cond:
+                self.recycled += 1
+            return self._open(), now
+
+        if self.ping_interval is not None and now - released_at >= self.ping_interval:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                self._close_quietly(conn)
+                with self._cond:
+                    self.ping_failures += 1
+                return self._open(), now
+
+        return conn, created_at
+
+    def release(self, conn, broken: bool = False) -> None:
+        with self._cond:
+            created_at = self._created_at.pop(id(conn), time.monotonic())
+
+        if not broken:
+            try:
+                # Não devolver transação aberta (snapshot antigo/locks) para o próximo uso
+                if _in_transaction(conn):
+                    conn.rollback()
+            except Exception:
+                broken = True
 
+        if broken:
+            self._discard(conn)
+            return
 
-def _normalize_query(query: str) -> str:
-    """Normaliza query SQL: converte ? para %s se usar MySQL e ajusta funções SQLite"""
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._warmed = False
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": self._total - idle,
+                "idle": idle,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_time_ms": round(self.wait_time * 1000, 3),
+                "timeouts": self.timeouts,
+                "created": self.created,
+                "recycled": self.recycled,
+                "ping_failures": self.ping_failures,
+            }
+
+
+# pymysql.constants.SERVER_STATUS.SERVER_STATUS_IN_TRANS
+_SERVER_STATUS_IN_TRANS = 1
+
+
+def _in_transaction(conn) -> bool:
+    in_tx = getattr(conn, "in_transaction", None)  # sqlite3
+    if in_tx is not None:
+        return bool(in_tx)
+    return bool(getattr(conn, "server_status", _SERVER_STATUS_IN_TRANS) & _SERVER_STATUS_IN_TRANS)
+
+
+def _get_sqlite_connection():
+    """
+    Abre conexão SQLite já ajustada (WAL, busy_timeout, cache, mmap, synchronous).
+    check_same_thread=False: a conexão vive no pool e é usada por uma thread por vez.
+    """
+    busy_ms = getattr(config, "SQLITE_BUSY_TIMEOUT_MS", 5000)
+    conn = sqlite3.connect(DB_PATH, timeout=busy_ms / 1000, check_same_thread=False)
+    conn.execute(f"PRAGMA journal_mode={getattr(config, 'SQLITE_JOURNAL_MODE', 'WAL')}")
+    conn.execute(f"PRAGMA synchronous={getattr(config, 'SQLITE_SYNCHRONOUS', 'NORMAL')}")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_ms)}")
+    conn.execute(f"PRAGMA cache_size={int(getattr(config, 'SQLITE_CACHE_SIZE', -16000))}")
+    conn.execute(f"PRAGMA mmap_size={int(getattr(config, 'SQLITE_MMAP_SIZE', 0))}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Pool de conexões compartilhado pelo processo (criado sob demanda)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if USE_MYSQL:
+                    _pool = ConnectionPool(
+                        _get_mysql_connection,
+                        min_size=getattr(config, "MYSQL_POOL_MIN", 1),
+                        max_size=getattr(config, "MYSQL_POOL_MAX", 10),
+                        timeout=getattr(config, "MYSQL_POOL_TIMEOUT", 10.0),
+                        max_age=getattr(config, "MYSQL_POOL_MAX_AGE", 1800),
+                        ping_interval=getattr(config, "MYSQL_POOL_PING_INTERVAL", 30),
+                    )
+                else:
+                    # Arquivo local: sem ping nem reciclagem, conexões vivem o processo todo
+                    size = getattr(config, "SQLITE_POOL_SIZE", 8)
+                    _pool = ConnectionPool(
+                        _get_sqlite_connection,
+                        min_size=1,
+                        max_size=size,
+                        timeout=getattr(config, "SQLITE_BUSY_TIMEOUT_MS", 5000) / 1000,
+                        max_age=0,
+                        ping_interval=None,
+                    )
+    return _pool
+
+
+def pool_stats() -> dict:
+    """Métricas do pool de conexões (vazio enquanto nenhum pool foi criado)."""
+    if _pool is not None:
+        return _pool.stats()
+    return {}
+
+
+def raw_connection():
+    """Conexão crua do driver (sem row_factory), usada pelas migrações e scripts."""
     if USE_MYSQL:
-        # Substituir funções SQLite por MySQL
-        query = query.replace("datetime('now')", "NOW()")
-        query = query.replace("CURRENT_TIMESTAMP", "NOW()")
-        
-        # Contar quantos ? existem
-        count = query.count('?')
-        # Substituir todos os ? por %s
-        query = query.replace('?', '%s', count)
-    return query
+        if not MYSQL_AVAILABLE:
+            raise ImportError("MySQL configurado mas pymysql não está instalado. Execute: pip install pymysql")
+        return _get_mysql_connection()
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH)
+    # Só tem efeito em banco novo (antes da primeira tabela): permite que a
+    # retenção devolva espaço com PRAGMA incremental_vacuum (ver retencao.py)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    return conn
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def init_db() -> None:
+    """
+    Aplica as migrações pendentes (ver migrations.py) uma única vez por processo.
+    Chamado no startup do app; chamadas seguintes não tocam no banco.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        from migrations import run_migrations
+        run_migrations()
+        _schema_ready = True
+
+
+class Row:
+    """
+    Linha de resultado única para SQLite e MySQL.
+
+    Guarda a tupla devolvida pelo driver e um índice nome→posição compartilhado
+    por todas as linhas do mesmo resultado, então aceita row[0] e row["col"] sem
+    copiar dados. Como sqlite3.Row, iterar percorre os valores; keys()/get()
+    permitem usar dict(row) e row.get("col").
+    """
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index[key]]
+        return self._values[key]
+
+    def get(self, key, default=None):
+        pos = self._index.get(key)
+        return default if pos is None else self._values[pos]
+
+    def keys(self):
+        return self._index.keys()
+
+    def values(self):
+        return self._values
+
+    def items(self):
+        return zip(self._index, self._values)
+
+    def as_dict(self) -> dict:
+        return dict(zip(self._index, self._values))
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            return self._values == other._values and list(self._index) == list(other._index)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Row({self.as_dict()!r})"
+
+
+# Índices nome→posição reaproveitados entre execuções com as mesmas colunas
+_row_indexes = {}
+
+
+def _row_index(description):
+    names = tuple(col[0] for col in description)
+    index = _row_indexes.get(names)
+    if index is None:
+        if len(_row_indexes) > 1024:
+            _row_indexes.clear()
+        index = _row_indexes.setdefault(names, {name: pos for pos, name in enumerate(names)})
+    return index
 
 
 class DatabaseCursor:
-    """Wrapper para cursor que normaliza queries automaticamente"""
+    """Wrapper para cursor que traduz as queries para o dialeto do banco (ver sql_compiler)"""
+    __slots__ = ("conn", "cursor", "_description", "_index")
+
     def __init__(self, conn, cursor):
         self.conn = conn
         self.cursor = cursor
-        self.is_mysql = USE_MYSQL
+        self._description = None
+        self._index = None
     
     def execute(self, query: str, params=None):
-        """Executa query normalizando placeholders"""
-        query = _normalize_query(query)
-        if self.is_mysql:
-            return self.cursor.execute(query, params)
-        else:
-            return self.cursor.execute(query, params)
+        """Executa query compilada para o dialeto atual (cacheada por statement)"""
+        query = compile_query(query, DIALECT)
+        if params is None:
+            return self.cursor.execute(query)
+        return self.cursor.execute(query, params)
+    
+    def executemany(self, query: str, seq_of_params):
+        """Executa a mesma query para várias linhas de parâmetros"""
+        return self.cursor.executemany(compile_query(query, DIALECT), seq_of_params)
+    
+    def _current_index(self):
+        description = self.cursor.description
+        if description is not self._description:
+            self._description = description
+            self._index = _row_index(description) if description else None
+        return self._index
     
     def fetchone(self):
-        """Busca uma linha"""
-        result = self.cursor.fetchone()
-        if self.is_mysql and result:
-            # Converter dict para Row-like object
-            class Row:
-                def __init__(self, data):
-                    self._data = data
-                def __getitem__(self, key):
-                    if isinstance(key, int):
-                        return list(self._data.values())[key]
-                    return self._data.get(key)
-                def __len__(self):
-                    return len(self._data)
-                def __iter__(self):
-                    return iter(self._data.values())
-            return Row(result)
-        return result
+        """Busca uma linha (Row ou None)"""
+        values = self.cursor.fetchone()
+        if values is None:
+            return None
+        return Row(self._current_index(), values)
     
     def fetchall(self):
-        """Busca todas as linhas"""
+        """Busca todas as linhas (lista de Row)"""
         results = self.cursor.fetchall()
-        # MySQL com DictCursor já retorna lista de dicts diretamente
-        # SQLite retorna lista de Row objects
-        if self.is_mysql:
-            # pymysql DictCursor já retorna dicts, retornar diretamente
-            return results if results else []
-        # SQLite: retornar Row objects (compatível com código existente)
-        return results
+        if not results:
+            return []
+        index = self._current_index()
+        return [Row(index, values) for values in results]
     
     def __getattr__(self, name):
         """Delega outros métodos para o cursor"""
@@ -395,29 +481,197 @@ class DatabaseCursor:
 @contextmanager
 def get_conn():
     """Context manager para conexão com banco (SQLite ou MySQL)"""
-    init_db()
+    if not _schema_ready and AUTO_MIGRATE:
+        init_db()
     
     if USE_MYSQL:
         if not MYSQL_AVAILABLE:
             raise ImportError("MySQL configurado mas pymysql não está instalado. Execute: pip install pymysql")
-        
-        conn = _get_mysql_connection()
+    elif getattr(config, "SQLITE_POOL_SIZE", 8) <= 0:
+        # SQLite sem pool: uma conexão por bloco (comportamento antigo)
+        conn = _get_sqlite_connection()
         try:
             yield conn
         finally:
             conn.close()
+        return
+
+    pool = get_pool()
+    conn = pool.acquire()
+    broken = False
+    try:
+        yield conn
+    except Exception:
+        # Erro no meio do bloco: desfaz e descarta a conexão se ela não responder
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        raise
+    finally:
+        pool.release(conn, broken=broken)
+
+
+def get_cursor(conn):
+    """Retorna cursor normalizado (compatível com SQLite e MySQL)"""
+    return DatabaseCursor(conn, conn.cursor())
+
+
+def in_transaction(conn) -> bool:
+    """True se a conexão tem uma transação aberta (escritas ainda não confirmadas)."""
+    return _in_transaction(conn)
+
+
+# Callbacks a rodar depois do commit de cada unidade de trabalho (por id da conexão)
+_after_commit_hooks: Dict[int, List[Callable[[], None]]] = {}
+
+
+def after_commit(conn, callback: Callable[[], None]) -> None:
+    """
+    Agenda `callback` para depois do commit da unidade de trabalho de `conn`
+    (ex.: invalidar caches só quando a escrita já é visível para os outros).
+    Se a unidade de trabalho for desfeita, o callback é descartado. Fora de
+    uma unidade de trabalho (conexão própria, já confirmada), roda na hora.
+    """
+    hooks = _after_commit_hooks.get(id(conn))
+    if hooks is None:
+        callback()
     else:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        hooks.append(callback)
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Conexão única para uma requisição inteira: leituras e escritas compartilham
+    a mesma conexão e a transação é confirmada uma única vez, ao final do bloco.
+    Em caso de exceção, get_conn() desfaz tudo. Callbacks de after_commit()
+    rodam só depois do commit.
+    """
+    with get_conn() as conn:
+        hooks = _after_commit_hooks[id(conn)] = []
         try:
             yield conn
+            if _in_transaction(conn):
+                conn.commit()
         finally:
-            conn.close()
+            _after_commit_hooks.pop(id(conn), None)
+        for callback in hooks:
+            callback()
 
 
-def get_cursor(conn):
-    """Retorna cursor normalizado (compatível com SQLite e MySQL)"""
-    if USE_MYSQL:
-        return DatabaseCursor(conn, conn.cursor())
+@contextmanager
+def conn_scope(conn=None):
+    """
+    Reaproveita a conexão do chamador (unidade de trabalho) ou abre uma própria.
+    Retorna (conn, owned): só quem é dono da conexão faz commit.
+    """
+    if conn is not None:
+        yield conn, False
+        return
+    with get_conn() as own:
+        yield own, True
+
+
+# ---------------------------------------------------------------------------
+# Escrita em lote
+# ---------------------------------------------------------------------------
+def _estimate_row_bytes(row) -> int:
+    """Tamanho aproximado da linha no texto do INSERT (valores + aspas + vírgulas)."""
+    size = 4
+    for value in row:
+        if value is None:
+            size += 6
+        elif isinstance(value, (bytes, bytearray)):
+            size += 2 * len(value) + 4
+        else:
+            size += len(str(value)) + 4
+    return size
+
+
+def _chunked(rows, max_rows: int, max_bytes: int = 0, base_bytes: int = 0):
+    """Agrupa `rows` (qualquer iterável) em listas de até max_rows linhas e ~max_bytes."""
+    chunk = []
+    size = base_bytes
+    for row in rows:
+        row_size = _estimate_row_bytes(row) if max_bytes else 0
+        if chunk and (len(chunk) >= max_rows or (max_bytes and size + row_size > max_bytes)):
+            yield chunk
+            chunk = []
+            size = base_bytes
+        chunk.append(row)
+        size += row_size
+    if chunk:
+        yield chunk
+
+
+def _bulk_write(template: str, width: int, rows, conn, chunk_rows, max_packet_bytes) -> int:
+    chunk_rows = max(1, chunk_rows or getattr(config, "BULK_CHUNK_ROWS", 1000))
+    compiled = compile_query(template, DIALECT)
+    total = 0
+    with conn_scope(conn) as (conn, owned):
+        cursor = conn.cursor()
+        if USE_MYSQL:
+            # Um INSERT com N grupos de VALUES por lote (um round-trip por lote)
+            max_bytes = max_packet_bytes or getattr(config, "BULK_MAX_PACKET_BYTES", 1024 * 1024)
+            group = "(" + ", ".join(["%s"] * width) + ")"
+            head, tail = compiled.split(group, 1)
+            for chunk in _chunked(rows, chunk_rows, max_bytes, len(head) + len(tail)):
+                values = ", ".join([group] * len(chunk))
+                cursor.execute(f"{head}{values}{tail}", [value for row in chunk for value in row])
+                total += len(chunk)
+        else:
+            for chunk in _chunked(rows, chunk_rows):
+                cursor.executemany(compiled, chunk)
+                total += len(chunk)
+        if owned:
+            conn.commit()
+    return total
+
+
+def bulk_insert(table: str, columns, rows, conn=None, ignore_duplicates: bool = False,
+                chunk_rows: int = None, max_packet_bytes: int = None) -> int:
+    """
+    Insere várias linhas (sequências na ordem de `columns`) em uma única transação.
+
+    MySQL: INSERT multi-linha, em lotes limitados por BULK_CHUNK_ROWS e
+    BULK_MAX_PACKET_BYTES. SQLite: executemany por lote. `rows` pode ser um
+    gerador; só um lote fica em memória por vez. Com `conn` do chamador, o
+    commit fica por conta dele. Retorna o número de linhas enviadas.
+
+    `table` e `columns` são interpolados no SQL: use apenas nomes do código.
+    """
+    columns = tuple(columns)
+    template = (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})"
+    )
+    if ignore_duplicates:
+        template += " ON CONFLICT DO NOTHING"
+    return _bulk_write(template, len(columns), rows, conn, chunk_rows, max_packet_bytes)
+
+
+def bulk_upsert(table: str, columns, rows, key_columns, update_columns=None, conn=None,
+                chunk_rows: int = None, max_packet_bytes: int = None, accumulate_columns=()) -> int:
+    """
+    Como bulk_insert, mas atualiza `update_columns` (padrão: as colunas fora de
+    `key_columns` e `accumulate_columns`) quando a chave única já existe.
+    `accumulate_columns` somam o valor novo ao existente (contadores).
+    """
+    columns = tuple(columns)
+    key_columns = tuple(key_columns)
+    accumulate_columns = tuple(accumulate_columns)
+    if update_columns is None:
+        update_columns = [col for col in columns if col not in key_columns and col not in accumulate_columns]
+    assignments = [f"{col} = excluded.{col}" for col in update_columns]
+    assignments += [f"{col} = {col} + excluded.{col}" for col in accumulate_columns]
+    template = (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)}) "
+        f"ON CONFLICT({', '.join(key_columns)}) "
+    )
+    if assignments:
+        template += "DO UPDATE SET " + ", ".join(assignments)
     else:
-        return conn.cursor()
+        template += "DO NOTHING"
+    return _bulk_write(template, len(columns), rows, conn, chunk_rows, max_packet_bytes)
@@ -5,11 +5,31 @@ Serviço de envio de emails para notificações de licenças.
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
 from typing import Optional
 
 import config
-from db import get_conn
+from db import get_conn, get_cursor
+from license_service import insert_access_log
+
+# Consultas do job diário (verificar_planos.py confere o plano destas mesmas strings)
+EXPIRING_LICENSES_SQL = """
+    SELECT device_id, owner_name, email, license_type, end_date
+    FROM devices
+    WHERE status = 'active'
+      AND email IS NOT NULL
+      AND email != ''
+      AND end_date IS NOT NULL
+      AND end_date != ''
+      AND license_type != 'vitalicia'
+"""
+ALERT_SENT_SQL = """
+    SELECT 1 FROM access_logs
+    WHERE device_id = ?
+      AND message LIKE ?
+      AND created_at_epoch >= ?
+    LIMIT 1
+"""
 
 
 def get_welcome_email_template(owner_name: str, license_type: str, start_date: str, end_date: str, days_duration: int) -> str:
@@ -316,28 +336,24 @@ def check_and_send_expiration_emails():
         return
     
     today = date.today()
+    # Equivale a date('now', '-1 day'): meia-noite UTC de ontem, em epoch
+    utc_midnight = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    since_yesterday = int((utc_midnight - timedelta(days=1)).timestamp())
     
     with get_conn() as conn:
-        cur = conn.cursor()
+        cur = get_cursor(conn)
         
         # Busca licenças ativas que expiram em 1, 2 ou 3 dias
-        cur.execute(
-            """
-            SELECT device_id, owner_name, email, license_type, end_date
-            FROM devices
-            WHERE status = 'active'
-              AND email IS NOT NULL
-              AND email != ''
-              AND end_date IS NOT NULL
-              AND end_date != ''
-              AND license_type != 'vitalicia'
-            """,
-        )
+        cur.execute(EXPIRING_LICENSES_SQL)
         
         devices = cur.fetchall()
         
         for row in devices:
-            device_id, owner_name, email, license_type, end_date_str = row
+            device_id = row["device_id"]
+            owner_name = row["owner_name"]
+            email = row["email"]
+            license_type = row["license_type"]
+            end_date_str = str(row["end_date"]) if row["end_date"] else None
             
             if not email or not end_date_str:
                 continue
@@ -350,14 +366,8 @@ def check_and_send_expiration_emails():
                 if days_remaining in config.EMAIL_ALERT_DAYS:
                     # Verifica se já foi enviado email para este dia
                     cur.execute(
-                        """
-                        SELECT 1 FROM access_logs
-                        WHERE device_id = ?
-                          AND message LIKE ?
-                          AND created_at >= date('now', '-1 day')
-                        LIMIT 1
-                        """,
-                        (device_id, f"%Email enviado: {days_remaining} dias%"),
+                        ALERT_SENT_SQL,
+                        (device_id, f"%Email enviado: {days_remaining} dias%", since_yesterday),
                     )
                     
                     already_sent = cur.fetchone()
@@ -379,7 +389,7 @@ def check_and_send_expiration_emails():
                                 message=f"Email enviado: {days_remaining} dias restantes",
                                 version="system",
                                 hostname="system",
-                                telemetry_json="{}",
+                                telemetry=None,
                                 ip="system",
                                 user_agent="email-service",
                             )
@@ -389,40 +399,3 @@ def check_and_send_expiration_emails():
                             
             except Exception as e:
                 print(f"Erro ao processar dispositivo {device_id}: {e}")
-
-
-def insert_access_log(
-    device_id: str,
-    allowed: bool,
-    message: str,
-    version: str,
-    hostname: str,
-    telemetry_json: str,
-    ip: str,
-    user_agent: str,
-) -> None:
-    """Helper para inserir log de acesso."""
-    from db import get_conn
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO access_logs
-                (device_id, ip, user_agent, hostname, client_version,
-                 telemetry_json, allowed, message)
-            VALUES
-                (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                device_id,
-                ip,
-                user_agent,
-                hostname,
-                version,
-                telemetry_json,
-                1 if allowed else 0,
-                message,
-            ),
-        )
-        conn.commit()
-
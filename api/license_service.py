@@ -1,62 +1,243 @@
 from calendar import monthrange
+import hashlib
+import hmac
+import json
+import threading
+import time
+import zlib
 from datetime import date, datetime, timezone, timedelta
 from typing import Any, Dict, Optional, List, Tuple
 
 import config
-from db import get_conn, get_cursor, USE_MYSQL
+from cache import TTLCache
+from clone_detector import CloneDetector
+from db import USE_MYSQL, Row, after_commit, bulk_insert, conn_scope, get_cursor, in_transaction
+from load_monitor import LoadMonitor
+from log_writer import ACCESS_LOG_COLUMNS, AccessLogWriter
+from presence import PresenceTracker
+from telemetry import compact_telemetry, resolve_labels
+
+# Cache de registros de devices para o /verify (licenças só mudam por ação do admin).
+# Toda escrita em devices.status/licença deve chamar invalidate_device() depois do
+# commit (numa unidade de trabalho, via db.after_commit); leituras feitas com uma
+# transação aberta não entram no cache.
+_device_cache = TTLCache(
+    maxsize=getattr(config, "DEVICE_CACHE_SIZE", 50000),
+    ttl=getattr(config, "DEVICE_CACHE_TTL", 60),
+)
+_NOT_CACHED = object()
+
+
+def invalidate_device(device_id: str) -> None:
+    """Remove o device do cache após alterações na licença."""
+    _device_cache.invalidate(device_id)
+
+
+def device_cache_stats() -> Dict[str, Any]:
+    return _device_cache.stats()
+
+
+# Respostas do /verify por (id, version, ts, sig, ip): o cliente AHK repete a mesma
+# requisição assinada em rajadas (retry/failover) e recebe a resposta anterior.
+_replay_cache_size = getattr(config, "VERIFY_REPLAY_CACHE_SIZE", 10000)
+_verify_replay_cache = TTLCache(
+    maxsize=_replay_cache_size,
+    ttl=config.MAX_TIME_SKEW if _replay_cache_size > 0 else 0,
+)
+
+
+def cached_verify_response(key: Tuple[str, ...]) -> Optional[Any]:
+    """Resposta já calculada para esta requisição assinada, ou None."""
+    entry = _verify_replay_cache.get(key)
+    # Resposta anterior a uma alteração de licença (invalidate_device) não vale mais
+    if entry is None or entry[0] != _device_cache.version:
+        return None
+    return entry[1]
 
 
-def _row_to_dict(row) -> Dict[str, Any]:
-    if row is None:
-        return {}
-    
-    # MySQL com DictCursor já retorna dict diretamente
-    if USE_MYSQL:
-        if isinstance(row, dict):
-            return row.copy()
-        # Se for Row wrapper, acessar _data
-        if hasattr(row, '_data'):
-            return row._data.copy()
-    
-    # SQLite: Row precisa ser convertido
-    if hasattr(row, 'keys'):
-        return {key: row[key] for key in row.keys()}
-    
-    # Fallback: tentar dict() normal
-    try:
-        return dict(row)
-    except:
-        return {}
+def remember_verify_response(key: Tuple[str, ...], response: Any, cache_version: int) -> None:
+    """Guarda a resposta; `cache_version` é _device_cache.version lido antes de calculá-la."""
+    _verify_replay_cache.set(key, (cache_version, response))
+
+
+def device_cache_version() -> int:
+    return _device_cache.version
+
+
+def verify_replay_stats() -> Dict[str, Any]:
+    stats = _verify_replay_cache.stats()
+    stats["duplicates"] = stats["hits"]
+    return stats
+
 
+# Consultas do caminho quente (verificar_planos.py confere o plano destas mesmas strings)
+DEVICE_BY_ID_SQL = "SELECT * FROM devices WHERE device_id = ? LIMIT 1"
+DEVICES_BY_IDS_SQL = "SELECT * FROM devices WHERE device_id IN ({placeholders})"
+CLONE_WINDOW_SQL = """
+    SELECT DISTINCT ip, hostname, created_at_epoch
+    FROM access_logs
+    WHERE device_id = ?
+      AND allowed = 1
+      AND created_at_epoch >= ?
+    ORDER BY created_at_epoch DESC
+    LIMIT 20
+"""
+CLONE_REBUILD_SQL = """
+    SELECT device_id, ip, hostname, allowed, created_at_epoch
+    FROM access_logs
+    WHERE created_at_epoch >= ?
+      AND ip <> 'system'
+    ORDER BY created_at_epoch, id
+    LIMIT ?
+"""
 
-def fetch_device(device_id: str) -> Optional[Dict[str, Any]]:
-    with get_conn() as conn:
+
+def fetch_device(device_id: str, conn=None) -> Optional[Row]:
+    """
+    Registro do device (cacheado por DEVICE_CACHE_TTL, inclusive "não existe").
+    Os campos last_seen_* do objeto em cache podem estar defasados.
+    """
+    cached = _device_cache.get(device_id, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        return cached
+
+    version = _device_cache.version
+    with conn_scope(conn) as (conn, owned):
+        # Com escritas pendentes do chamador, o que se lê pode ainda ser desfeito
+        cacheable = owned or not in_transaction(conn)
         cur = get_cursor(conn)
-        cur.execute(
-            "SELECT * FROM devices WHERE device_id = ? LIMIT 1",
-            (device_id,),
-        )
+        cur.execute(DEVICE_BY_ID_SQL, (device_id,))
         row = cur.fetchone()
-        return _row_to_dict(row) or None
+    if cacheable:
+        _device_cache.set(device_id, row, version=version)
+    return row
+
 
+# Parâmetros por IN (...) (SQLite antigo limita a 999 variáveis por statement)
+_IN_CHUNK = 500
 
-def is_device_blocklisted(device_id: str) -> bool:
-    with get_conn() as conn:
+
+def fetch_devices(device_ids: List[str], conn=None) -> Dict[str, Optional[Row]]:
+    """
+    Versão em conjunto de fetch_device: o que não estiver no cache vem em um
+    único SELECT ... WHERE device_id IN (...) (por lote de 500 IDs).
+    """
+    found = {}
+    missing = []
+    for device_id in dict.fromkeys(device_ids):
+        cached = _device_cache.get(device_id, _NOT_CACHED)
+        if cached is _NOT_CACHED:
+            missing.append(device_id)
+        else:
+            found[device_id] = cached
+    if not missing:
+        return found
+
+    version = _device_cache.version
+    with conn_scope(conn) as (conn, owned):
+        cacheable = owned or not in_transaction(conn)
         cur = get_cursor(conn)
-        cur.execute(
-            "SELECT 1 FROM blocked_devices WHERE device_id = ? LIMIT 1",
-            (device_id,),
-        )
-        return cur.fetchone() is not None
+        for start in range(0, len(missing), _IN_CHUNK):
+            chunk = missing[start:start + _IN_CHUNK]
+            cur.execute(DEVICES_BY_IDS_SQL.format(placeholders=", ".join("?" for _ in chunk)), chunk)
+            rows = {_device_key(row["device_id"]): row for row in cur.fetchall()}
+            for device_id in chunk:
+                found[device_id] = rows.get(_device_key(device_id))
+    if cacheable:
+        for device_id in missing:
+            _device_cache.set(device_id, found[device_id], version=version)
+    return found
+
+
+def _device_key(device_id: str) -> str:
+    # Colação do MySQL (utf8mb4_unicode_ci) compara sem diferenciar maiúsculas
+    return device_id.lower() if USE_MYSQL else device_id
+
+
+class BlocklistSnapshot:
+    """
+    Conjunto em memória com os IDs de blocked_devices + config.HARDCODED_BLOCKLIST.
+
+    A consulta por device não toca no banco. No máximo a cada `refresh_interval`
+    segundos uma thread confere um marcador barato (COUNT + MAX(id)) e só relê a
+    tabela se ele mudou; as demais seguem usando o snapshot atual enquanto isso.
+    """
+
+    def __init__(self, hardcoded, refresh_interval: float):
+        self._hardcoded = frozenset(hardcoded)
+        self.refresh_interval = refresh_interval
+        self._ids = None
+        self._marker = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def contains(self, device_id: str, conn=None) -> bool:
+        if device_id in self._hardcoded:
+            return True
+        if self._ids is None or time.monotonic() >= self._next_check:
+            self._maybe_refresh(conn)
+        return device_id in self._ids
+
+    def _maybe_refresh(self, conn=None, force: bool = False) -> None:
+        # Primeira carga bloqueia; depois, quem não pegar o lock usa o snapshot atual
+        if not self._lock.acquire(blocking=self._ids is None or force):
+            return
+        try:
+            if not force and self._ids is not None and time.monotonic() < self._next_check:
+                return
+            with conn_scope(conn) as (conn, _owned):
+                cur = get_cursor(conn)
+                cur.execute("SELECT COUNT(1) AS total, MAX(id) AS max_id FROM blocked_devices")
+                row = cur.fetchone()
+                marker = (row["total"], row["max_id"]) if row else (0, None)
+                if force or marker != self._marker or self._ids is None:
+                    cur.execute("SELECT device_id FROM blocked_devices")
+                    self._ids = self._hardcoded | frozenset(r[0] for r in cur.fetchall())
+                    self._marker = marker
+                    self.reloads += 1
+            self._next_check = time.monotonic() + self.refresh_interval
+        finally:
+            self._lock.release()
+
+    def refresh(self, conn=None) -> None:
+        """Recarrega imediatamente (ex.: após inserir em blocked_devices)."""
+        self._maybe_refresh(conn, force=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._ids) if self._ids is not None else 0,
+            "hardcoded": len(self._hardcoded),
+            "reloads": self.reloads,
+            "refresh_interval_s": self.refresh_interval,
+        }
+
+
+_blocklist = BlocklistSnapshot(
+    config.HARDCODED_BLOCKLIST,
+    refresh_interval=getattr(config, "BLOCKLIST_REFRESH_SECONDS", 30),
+)
 
 
-def auto_create_device(device_id: str) -> Dict[str, Any]:
+def is_device_blocklisted(device_id: str, conn=None) -> bool:
+    return _blocklist.contains(device_id, conn=conn)
+
+
+def refresh_blocklist(conn=None) -> None:
+    _blocklist.refresh(conn=conn)
+
+
+def blocklist_stats() -> Dict[str, Any]:
+    return _blocklist.stats()
+
+
+def auto_create_device(device_id: str, conn=None) -> Row:
     """Cria registro automático, similar ao PHP (status pending, tipo mensal)."""
     start = datetime.now(timezone.utc).date().isoformat()
     license_type = "mensal"
     end = calculate_end_date(license_type, start)
 
-    with get_conn() as conn:
+    with conn_scope(conn) as (conn, owned):
         cur = get_cursor(conn)
         cur.execute(
             """
@@ -65,9 +246,13 @@ def auto_create_device(device_id: str) -> Dict[str, Any]:
             """,
             (device_id, license_type, "pending", start, end),
         )
-        conn.commit()
-
-    fetched = fetch_device(device_id)
+        if owned:
+            conn.commit()
+        # O "não existe" em cache só cai depois do commit; o registro novo é lido
+        # sem passar pelo cache (a transação do chamador ainda pode ser desfeita)
+        after_commit(conn, lambda: invalidate_device(device_id))
+        cur.execute(DEVICE_BY_ID_SQL, (device_id,))
+        fetched = cur.fetchone()
     assert fetched is not None
     return fetched
 
@@ -154,7 +339,32 @@ def calculate_end_date(license_type: str, start_date: str) -> Optional[str]:
     return end.isoformat()
 
 
-def detect_clone_usage(device_id: str, current_ip: str, current_hostname: str) -> Tuple[bool, Optional[str]]:
+def block_device(device_id: str, conn=None) -> None:
+    """Marca a licença como bloqueada (ex.: clone detectado)."""
+    with conn_scope(conn) as (conn, owned):
+        cur = get_cursor(conn)
+        cur.execute(
+            "UPDATE devices SET status = 'blocked', updated_at = datetime('now') WHERE device_id = ?",
+            (device_id,),
+        )
+        if owned:
+            conn.commit()
+        after_commit(conn, lambda: invalidate_device(device_id))
+
+
+_clone_detector = CloneDetector(
+    window=config.CLONE_DETECTION_WINDOW,
+    max_ips=config.MAX_SIMULTANEOUS_IPS,
+    per_device=getattr(config, "CLONE_DETECTOR_PER_DEVICE", 20),
+    max_devices=getattr(config, "CLONE_DETECTOR_MAX_DEVICES", 100000),
+)
+
+
+def _clone_detection_in_memory() -> bool:
+    return getattr(config, "CLONE_DETECTION_BACKEND", "memory") != "database"
+
+
+def detect_clone_usage(device_id: str, current_ip: str, current_hostname: str, conn=None) -> Tuple[bool, Optional[str]]:
     """
     Detecta se o mesmo Device ID está sendo usado de múltiplos IPs simultaneamente.
     
@@ -164,24 +374,57 @@ def detect_clone_usage(device_id: str, current_ip: str, current_hostname: str) -
     if not config.ENABLE_CLONE_DETECTION:
         return (False, None)
     
-    with get_conn() as conn:
+    if _clone_detection_in_memory():
+        return _clone_detector.check(device_id, current_ip, current_hostname)
+    return _detect_clone_usage_db(device_id, current_ip, current_hostname, conn)
+
+
+def record_clone_observation(device_id: str, ip: str, hostname: str, allowed: bool) -> None:
+    """Alimenta a janela em memória com o resultado de um /verify."""
+    if config.ENABLE_CLONE_DETECTION and _clone_detection_in_memory():
+        _clone_detector.record(device_id, ip, hostname, allowed)
+
+
+def rebuild_clone_detector(conn=None) -> int:
+    """
+    Recarrega a janela em memória a partir dos access_logs recentes (startup).
+    Retorna quantos acessos foram reprocessados.
+    """
+    if not (config.ENABLE_CLONE_DETECTION and _clone_detection_in_memory()):
+        return 0
+    
+    window_start = int(time.time()) - config.CLONE_DETECTION_WINDOW
+    limit = getattr(config, "CLONE_DETECTOR_REBUILD_LIMIT", 200000)
+    
+    with conn_scope(conn) as (conn, _owned):
+        cur = get_cursor(conn)
+        cur.execute(CLONE_REBUILD_SQL, (window_start, limit))
+        rows = cur.fetchall()
+    
+    _clone_detector.clear()
+    for row in rows:
+        _clone_detector.record(
+            row["device_id"], row["ip"], row["hostname"], bool(row["allowed"]), ts=row["created_at_epoch"]
+        )
+    return len(rows)
+
+
+def clone_detector_stats() -> Dict[str, Any]:
+    stats = _clone_detector.stats()
+    stats["backend"] = "memory" if _clone_detection_in_memory() else "database"
+    return stats
+
+
+def _detect_clone_usage_db(device_id: str, current_ip: str, current_hostname: str, conn=None) -> Tuple[bool, Optional[str]]:
+    """Implementação original, consultando access_logs e devices a cada chamada."""
+    with conn_scope(conn) as (conn, _owned):
         cur = get_cursor(conn)
         
         # Busca acessos recentes do mesmo Device ID (dentro da janela de tempo)
-        window_start = (datetime.now(timezone.utc) - timedelta(seconds=config.CLONE_DETECTION_WINDOW)).isoformat()
+        # (epoch inteiro: range no índice (device_id, allowed, created_at_epoch))
+        window_start = int(time.time()) - config.CLONE_DETECTION_WINDOW
         
-        cur.execute(
-            """
-            SELECT DISTINCT ip, hostname, created_at
-            FROM access_logs
-            WHERE device_id = ?
-              AND created_at >= ?
-              AND allowed = 1
-            ORDER BY created_at DESC
-            LIMIT 20
-            """,
-            (device_id, window_start),
-        )
+        cur.execute(CLONE_WINDOW_SQL, (device_id, window_start))
         
         recent_accesses = cur.fetchall()
         
@@ -193,16 +436,8 @@ def detect_clone_usage(device_id: str, current_ip: str, current_hostname: str) -
         unique_hostnames = set()
         
         for row in recent_accesses:
-            # MySQL retorna dict, SQLite retorna Row
-            if USE_MYSQL and isinstance(row, dict):
-                ip = row.get('ip', '') or ""
-                hostname = row.get('hostname', '') or ""
-            elif hasattr(row, '__getitem__'):
-                ip = row[0] if len(row) > 0 and row[0] else ""
-                hostname = row[1] if len(row) > 1 and row[1] else ""
-            else:
-                ip = ""
-                hostname = ""
+            ip = row["ip"] or ""
+            hostname = row["hostname"] or ""
             
             if ip:
                 unique_ips.add(ip)
@@ -218,20 +453,18 @@ def detect_clone_usage(device_id: str, current_ip: str, current_hostname: str) -
             )
         
         # Se o IP atual é diferente do último conhecido E há acessos recentes, pode ser clone
-        cur.execute("SELECT last_seen_ip, last_hostname FROM devices WHERE device_id = ?", (device_id,))
+        cur.execute("SELECT id, last_seen_ip, last_hostname FROM devices WHERE device_id = ?", (device_id,))
         last_seen = cur.fetchone()
         
         if last_seen:
-            # MySQL retorna dict, SQLite retorna Row
-            if USE_MYSQL and isinstance(last_seen, dict):
-                last_ip = last_seen.get('last_seen_ip', '') or ""
-                last_hostname = last_seen.get('last_hostname', '') or ""
-            elif hasattr(last_seen, '__getitem__'):
-                last_ip = last_seen[0] if len(last_seen) > 0 and last_seen[0] else ""
-                last_hostname = last_seen[1] if len(last_seen) > 1 and last_seen[1] else ""
+            # Com PRESENCE_COALESCE, devices.last_seen_* pode estar defasado: vale o
+            # estado pendente do PresenceTracker, se houver
+            pending = _presence.last_seen(last_seen["id"])
+            if pending is not None:
+                last_ip, last_hostname = pending[0] or "", pending[1] or ""
             else:
-                last_ip = ""
-                last_hostname = ""
+                last_ip = last_seen["last_seen_ip"] or ""
+                last_hostname = last_seen["last_hostname"] or ""
             
             # Se IP mudou E hostname mudou E há acessos recentes, suspeito
             if (current_ip != last_ip and 
@@ -247,8 +480,23 @@ def detect_clone_usage(device_id: str, current_ip: str, current_hostname: str) -
         return (False, None)
 
 
-def update_device_seen(primary_id: int, ip: str, version: str, hostname: str) -> None:
-    with get_conn() as conn:
+_presence = PresenceTracker(
+    flush_interval=getattr(config, "PRESENCE_FLUSH_INTERVAL", 10.0),
+    max_staleness=getattr(config, "PRESENCE_MAX_STALENESS", 300.0),
+)
+
+
+def update_device_seen(primary_id: int, ip: str, version: str, hostname: str, conn=None) -> None:
+    """
+    Atualiza last_seen_* do device. Com PRESENCE_COALESCE (padrão) a observação
+    é agregada em memória e gravada em lote pelo PresenceTracker; `conn` só é
+    usado no modo síncrono.
+    """
+    if getattr(config, "PRESENCE_COALESCE", True):
+        _presence.record(primary_id, ip, version, hostname)
+        return
+
+    with conn_scope(conn) as (conn, owned):
         cur = get_cursor(conn)
         cur.execute(
             """
@@ -262,7 +510,67 @@ def update_device_seen(primary_id: int, ip: str, version: str, hostname: str) ->
             """,
             (ip, version, hostname, primary_id),
         )
-        conn.commit()
+        if owned:
+            conn.commit()
+
+
+def flush_presence() -> int:
+    """Grava imediatamente os last_seen_* pendentes."""
+    return _presence.flush()
+
+
+def presence_stats() -> Dict[str, Any]:
+    return _presence.stats()
+
+
+_access_log_writer = AccessLogWriter(
+    queue_size=getattr(config, "ACCESS_LOG_QUEUE_SIZE", 10000),
+    batch_size=getattr(config, "ACCESS_LOG_BATCH_SIZE", 500),
+    flush_interval=getattr(config, "ACCESS_LOG_FLUSH_INTERVAL", 1.0),
+    full_policy=getattr(config, "ACCESS_LOG_FULL_POLICY", "drop"),
+)
+
+
+def access_log_row(
+    device_id: str,
+    allowed: bool,
+    message: str,
+    version: str,
+    hostname: str,
+    telemetry: Optional[Dict[str, Any]],
+    ip: str,
+    user_agent: str,
+) -> Tuple:
+    """
+    Linha de access_logs na ordem de ACCESS_LOG_COLUMNS, com a telemetria já
+    em colunas tipadas (username/osbuild em texto até resolve_labels).
+    """
+    return (
+        device_id,
+        ip,
+        user_agent,
+        hostname,
+        version,
+        *compact_telemetry(telemetry),
+        1 if allowed else 0,
+        message,
+        int(time.time()),
+    )
+
+
+def insert_access_logs(rows: List[Tuple], conn=None) -> None:
+    """
+    Registra vários acessos (linhas de access_log_row). Com ACCESS_LOG_ASYNC
+    (padrão) vão para o AccessLogWriter; no modo síncrono, um bulk_insert na
+    conexão do chamador.
+    """
+    if not rows:
+        return
+    if getattr(config, "ACCESS_LOG_ASYNC", True):
+        for row in rows:
+            _access_log_writer.submit(row)
+        return
+    bulk_insert("access_logs", ACCESS_LOG_COLUMNS, resolve_labels(rows, ACCESS_LOG_COLUMNS, conn=conn), conn=conn)
 
 
 def insert_access_log(
@@ -271,46 +579,137 @@ def insert_access_log(
     message: str,
     version: str,
     hostname: str,
-    telemetry_json: str,
+    telemetry: Optional[Dict[str, Any]],
     ip: str,
     user_agent: str,
+    conn=None,
 ) -> None:
-    with get_conn() as conn:
+    """
+    Registra um acesso. Com ACCESS_LOG_ASYNC (padrão) a linha vai para o
+    AccessLogWriter e é gravada em lote fora da requisição; `conn` só é usado
+    no modo síncrono.
+    """
+    row = access_log_row(device_id, allowed, message, version, hostname, telemetry, ip, user_agent)
+    if getattr(config, "ACCESS_LOG_ASYNC", True):
+        _access_log_writer.submit(row)
+        return
+
+    with conn_scope(conn) as (conn, owned):
         cur = get_cursor(conn)
         cur.execute(
-            """
-            INSERT INTO access_logs
-                (device_id, ip, user_agent, hostname, client_version,
-                 telemetry_json, allowed, message)
-            VALUES
-                (?, ?, ?, ?, ?, ?, ?, ?)
+            f"""
+            INSERT INTO access_logs ({", ".join(ACCESS_LOG_COLUMNS)})
+            VALUES ({", ".join("?" for _ in ACCESS_LOG_COLUMNS)})
             """,
-            (
-                device_id,
-                ip,
-                user_agent,
-                hostname,
-                version,
-                telemetry_json,
-                1 if allowed else 0,
-                message,
-            ),
+            resolve_labels([row], ACCESS_LOG_COLUMNS, conn=conn)[0],
         )
-        conn.commit()
+        if owned:
+            conn.commit()
 
 
-def build_config_payload(device: Dict[str, Any], effective_end: Optional[str]) -> Dict[str, Any]:
-    cfg = dict(config.DEFAULT_CONFIG)
+def flush_access_logs(timeout: float = 10.0) -> bool:
+    """Espera a gravação dos access_logs pendentes (ex.: antes de consultas/relatórios)."""
+    return _access_log_writer.flush(timeout)
+
+
+def access_log_stats() -> Dict[str, Any]:
+    return _access_log_writer.stats()
 
+
+# Carga recente do /verify (alimentada por app.py) para o intervalo adaptativo
+_load_monitor = LoadMonitor(window=60)
+_load_factor_state = [float("-inf"), 1.0]  # (monotonic do cálculo, fator)
+
+MIN_INTERVAL = 15
+
+
+def record_verify_outcome(error: bool) -> None:
+    _load_monitor.record(error)
+
+
+def load_stats() -> Dict[str, Any]:
+    stats = _load_monitor.stats()
+    stats["interval_factor"] = _load_factor()
+    return stats
+
+
+def _load_factor() -> float:
+    """Multiplicador do intervalo pela carga; recalculado no máximo 1x por segundo."""
+    now = time.monotonic()
+    if now - _load_factor_state[0] < 1.0:
+        return _load_factor_state[1]
+    rps, error_ratio = _load_monitor.rates()
+    factor = 1.0
+    target = getattr(config, "ADAPTIVE_TARGET_RPS", 200.0)
+    if target > 0 and rps > target:
+        factor = rps / target
+    if error_ratio > getattr(config, "ADAPTIVE_ERROR_THRESHOLD", 0.05):
+        factor *= 2
+    # Degraus de 0,5: o intervalo não oscila a cada requisição
+    factor = max(1.0, min(getattr(config, "ADAPTIVE_MAX_FACTOR", 4.0), round(factor * 2) / 2))
+    _load_factor_state[0] = now
+    _load_factor_state[1] = factor
+    return factor
+
+
+def _stability_factor(device: Dict[str, Any], effective_end: Optional[str]) -> float:
+    """Licenças que não vão mudar tão cedo podem checar com menos frequência."""
+    if device.get("status") != "active":
+        return 1.0
+    if device.get("license_type") == "vitalicia":
+        return getattr(config, "ADAPTIVE_STABLE_FACTOR", 4.0)
+    if effective_end:
+        try:
+            days_left = (date.fromisoformat(str(effective_end)[:10]) - date.today()).days
+        except ValueError:
+            return 1.0
+        if days_left > getattr(config, "ADAPTIVE_LONG_LICENSE_DAYS", 30):
+            return 2.0
+    return 1.0
+
+
+def _device_jitter(device_id: str) -> float:
+    """Fator em [1 - j, 1 + j], fixo por device (crc32), para espalhar clientes sincronizados."""
+    ratio = getattr(config, "INTERVAL_JITTER", 0.2)
+    if ratio <= 0 or not device_id:
+        return 1.0
+    position = zlib.crc32(str(device_id).encode("utf-8")) / 0xFFFFFFFF
+    return 1.0 + ratio * (2 * position - 1)
+
+
+def compute_interval(device: Dict[str, Any], effective_end: Optional[str]) -> int:
+    """
+    Próximo intervalo de checagem do device. O padrão é esticado pela
+    estabilidade da licença e pela carga do servidor, com jitter determinístico
+    por device; o custom_interval do admin só acompanha a carga.
+    """
+    base = int(config.DEFAULT_CONFIG.get("interval", 30))
+    custom = False
     custom_interval = device.get("custom_interval")
     if custom_interval:
         try:
             val = int(custom_interval)
             if val > 0:
-                cfg["interval"] = max(15, val)
+                base = max(MIN_INTERVAL, val)
+                custom = True
         except (TypeError, ValueError):
             pass
 
+    interval = float(base)
+    if getattr(config, "ADAPTIVE_INTERVAL", True):
+        if not custom:
+            interval *= _stability_factor(device, effective_end)
+        interval *= _load_factor()
+        interval = min(interval, max(base, getattr(config, "ADAPTIVE_MAX_INTERVAL", 900)))
+    if not custom:
+        interval *= _device_jitter(device.get("device_id"))
+    return max(MIN_INTERVAL, int(round(interval)))
+
+
+def build_config_payload(device: Dict[str, Any], effective_end: Optional[str]) -> Dict[str, Any]:
+    cfg = dict(config.DEFAULT_CONFIG)
+    cfg["interval"] = compute_interval(device, effective_end)
+
     features = device.get("features")
     if features:
         # CSV simples: "core,premium"
@@ -330,3 +729,132 @@ def build_config_payload(device: Dict[str, Any], effective_end: Optional[str]) -
     return cfg
 
 
+def _sign(raw: str) -> str:
+    """HMAC-SHA256 (hex) com o SHARED_SECRET, usado nos tokens de licença."""
+    return hmac.new(config.SHARED_SECRET.encode("utf-8"), raw.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def build_license_token(device_id: str, device: Dict[str, Any], effective_end: Optional[str],
+                        features: List[str], issued_at: datetime) -> Dict[str, Any]:
+    """
+    Token de licença v1 (para cache/offline no cliente): payload, o mesmo payload
+    serializado (payload_raw) e a assinatura HMAC-SHA256 sobre payload_raw.
+    """
+    license_payload = {
+        "device_id": device_id,
+        "license_type": device.get("license_type"),
+        "status": device.get("status"),
+        "issued_at": issued_at.isoformat(),
+        "expires_at": effective_end,
+        "features": features,
+    }
+    payload_raw = json.dumps(license_payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return {
+        "payload": license_payload,
+        "payload_raw": payload_raw,
+        "signature": _sign(payload_raw),
+    }
+
+
+# Formato v2 (opt-in, ?format=2): cada campo uma vez, chaves curtas.
+#   {"v": 2, "a": 1, "m": msg, "c": {...}, "t": blob, "s": assinatura, "fp": fingerprint}
+# "t" é o JSON canônico (chaves ordenadas, sem espaços) assinado em "s":
+#   {"d": device_id, "e": expires_at, "f": features, "ia": issued_at (epoch), "lt": license_type, "st": status}
+# Inalterado (?fp= igual ao atual): {"v": 2, "a", "n": 1, "fp", "c": {"i"}, "r": blob, "s": assinatura de "r"},
+#   com "r" = {"d": device_id, "e": expires_at, "fp": fingerprint, "ia": issued_at (epoch)}.
+# "c" traz só o que não está no token: "i" intervalo, "m" mensagem, "u" update {"u","h","v"}.
+_V2_CONFIG_KEYS = {"interval": "i", "message": "m", "update": "u"}
+_V2_TOKEN_FIELDS = ("features", "license_expires_at")
+
+
+def _compact_config(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    out = {}
+    for key, value in cfg.items():
+        if key in _V2_TOKEN_FIELDS or value is None or value == "":
+            continue
+        if key == "update":
+            value = {"u": value.get("url"), "h": value.get("sha256"), "v": value.get("version")}
+        out[_V2_CONFIG_KEYS.get(key, key)] = value
+    return out
+
+
+def build_compact_response(allow: bool, msg: str, device_id: str, device: Dict[str, Any],
+                           effective_end: Optional[str], config_payload: Dict[str, Any],
+                           issued_at: datetime, fingerprint: str) -> Dict[str, Any]:
+    """Resposta do /verify no formato v2 (ver comentário acima)."""
+    blob = json.dumps(
+        {
+            "d": device_id,
+            "e": effective_end,
+            "f": config_payload.get("features", []),
+            "ia": int(issued_at.timestamp()),
+            "lt": device.get("license_type"),
+            "st": device.get("status"),
+        },
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return {
+        "v": 2,
+        "a": 1 if allow else 0,
+        "m": msg,
+        "c": _compact_config(config_payload),
+        "t": blob,
+        "s": _sign(blob),
+        "fp": fingerprint,
+    }
+
+
+def build_unchanged_response(allow: bool, fingerprint: str, device_id: str, effective_end: Optional[str],
+                             issued_at: datetime, interval: int, compact: bool = False) -> Dict[str, Any]:
+    """
+    Resposta do verify condicional quando o token do cliente continua válido.
+    Traz issued_at/expires_at novos, assinados junto com o fingerprint, para o
+    cliente renovar a carência offline do token que já tem sem recebê-lo de novo,
+    e o intervalo atual (fora do fingerprint, muda com a carga do servidor).
+    """
+    refresh = json.dumps(
+        {"d": device_id, "e": effective_end, "fp": fingerprint, "ia": int(issued_at.timestamp())},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    if compact:
+        return {
+            "v": 2, "a": 1 if allow else 0, "n": 1, "fp": fingerprint, "c": {"i": interval},
+            "r": refresh, "s": _sign(refresh),
+        }
+    return {
+        "allow": allow,
+        "unchanged": True,
+        "fingerprint": fingerprint,
+        "interval": interval,
+        "issued_at": issued_at.isoformat(),
+        "expires_at": effective_end,
+        "refresh_raw": refresh,
+        "signature": _sign(refresh),
+    }
+
+
+# Fingerprint do estado da licença por device (verify condicional). Guarda o
+# último estado visto: se não mudou, o fingerprint é reaproveitado sem re-hash.
+_license_states = TTLCache(
+    maxsize=getattr(config, "DEVICE_CACHE_SIZE", 50000),
+    ttl=getattr(config, "DEVICE_CACHE_TTL", 60),
+)
+
+
+def license_fingerprint(device_id: str, state: Dict[str, Any]) -> str:
+    """
+    Identificador curto do estado entregue ao cliente (allow, msg, licença e config).
+    Não depende de issued_at nem do intervalo (que varia com a carga e vai em
+    toda resposta): muda só quando a licença ou a config do cliente muda.
+    """
+    cached = _license_states.get(device_id)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+    canonical = json.dumps(state, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    fingerprint = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+    _license_states.set(device_id, (state, fingerprint))
+    return fingerprint
+
+
+def license_state_stats() -> Dict[str, Any]:
+    return _license_states.stats()
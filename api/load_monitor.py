@@ -0,0 +1,53 @@
+"""
+Medição da carga recente do /verify (requisições/s e taxa de erro).
+
+Janela deslizante de `window` segundos em baldes de 1 s (buffer circular):
+registrar é O(1) e a leitura soma no máximo `window` baldes. Vale por processo.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+
+class LoadMonitor:
+    def __init__(self, window: int = 60):
+        self.window = max(1, window)
+        self._seconds = [0] * self.window
+        self._requests = [0] * self.window
+        self._errors = [0] * self.window
+        self._started = int(time.monotonic())
+        self._lock = threading.Lock()
+
+    def record(self, error: bool = False) -> None:
+        now = int(time.monotonic())
+        slot = now % self.window
+        with self._lock:
+            if self._seconds[slot] != now:
+                self._seconds[slot] = now
+                self._requests[slot] = 0
+                self._errors[slot] = 0
+            self._requests[slot] += 1
+            if error:
+                self._errors[slot] += 1
+
+    def rates(self) -> Tuple[float, float]:
+        """(requisições por segundo, fração de erros) na janela."""
+        now = int(time.monotonic())
+        requests = errors = 0
+        with self._lock:
+            for slot in range(self.window):
+                if now - self._seconds[slot] < self.window:
+                    requests += self._requests[slot]
+                    errors += self._errors[slot]
+        # Logo após o startup a janela ainda não está cheia
+        elapsed = max(1, min(self.window, now - self._started + 1))
+        return requests / elapsed, (errors / requests if requests else 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        rps, error_ratio = self.rates()
+        return {
+            "window_s": self.window,
+            "requests_per_s": round(rps, 2),
+            "error_ratio": round(error_ratio, 4),
+        }
@@ -0,0 +1,147 @@
+"""
+Configuração de logging do processo: fila, amostragem por evento e JSON.
+
+- Assíncrono: os loggers só enfileiram o LogRecord (QueueHandler) e uma
+  QueueListener formata e escreve no stderr em outra thread. Com a fila
+  cheia o registro é descartado e contado, nunca bloqueia a requisição.
+- Formatação preguiçosa: as mensagens usam o estilo %-args do logging e o
+  texto só é montado na thread da listener, e só para o que passou da
+  amostragem (os args não devem ser alterados depois da chamada).
+- Amostragem por evento: chamadas com extra={"event": "verify.allow", ...}
+  passam com a taxa de LOG_SAMPLE_RATES (ex.: 1% das liberações, 100% das
+  negativas); WARNING ou acima e registros sem evento sempre passam.
+- JSON (opt-in, LOG_FORMAT=json): uma linha por registro com ts, level,
+  logger, event, msg e os campos de extra={"fields": {...}}. O padrão é o
+  texto de sempre (LEVEL:logger:mensagem).
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import config
+
+_TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event:
+            entry["event"] = event
+        fields = getattr(record, "fields", None)
+        if fields:
+            for key, value in fields.items():
+                entry.setdefault(key, value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class EventSampler(logging.Filter):
+    """Deixa passar uma fração `rates[event]` dos registros de cada evento."""
+
+    def __init__(self, rates: Dict[str, float], default_rate: float = 1.0):
+        super().__init__()
+        self.rates = dict(rates)
+        self.default_rate = default_rate
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(event, self.default_rate)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que não formata na thread do chamador e descarta com a fila cheia."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # O padrão formata aqui (getMessage + traceback); a listener faz isso depois
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_state_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+_sampler: Optional[EventSampler] = None
+
+
+def setup_logging() -> None:
+    """Configura o logger raiz (uma vez por processo) conforme LOG_*."""
+    global _listener, _handler, _sampler
+    with _state_lock:
+        if _handler is not None:
+            return
+
+        stream = logging.StreamHandler(sys.stderr)
+        if getattr(config, "LOG_FORMAT", "text") == "json":
+            stream.setFormatter(JsonFormatter())
+        else:
+            stream.setFormatter(logging.Formatter(_TEXT_FORMAT))
+
+        _sampler = EventSampler(
+            getattr(config, "LOG_SAMPLE_RATES", {}),
+            default_rate=getattr(config, "LOG_SAMPLE_DEFAULT", 1.0),
+        )
+        if getattr(config, "LOG_ASYNC", True):
+            handler = _DroppingQueueHandler(queue.Queue(maxsize=getattr(config, "LOG_QUEUE_SIZE", 10000)))
+            _listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+            _listener.start()
+            atexit.register(_stop_listener)
+        else:
+            handler = stream
+        handler.addFilter(_sampler)
+        _handler = handler
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(getattr(config, "LOG_LEVEL", "INFO"))
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+def logging_stats() -> Dict[str, Any]:
+    stats = {
+        "async": _listener is not None,
+        "format": getattr(config, "LOG_FORMAT", "text"),
+        "sampled_out": _sampler.sampled_out if _sampler else 0,
+        "sample_rates": _sampler.rates if _sampler else {},
+    }
+    if isinstance(_handler, _DroppingQueueHandler):
+        stats["queued"] = _handler.queue.qsize()
+        stats["dropped"] = _handler.dropped
+    return stats
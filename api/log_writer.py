@@ -0,0 +1,183 @@
+"""
+Gravação assíncrona (write-behind) de access_logs.
+
+O /verify só enfileira a linha; uma thread de fundo agrupa as linhas e grava
+cada lote com db.bulk_insert em uma única transação. O lote é gravado quando
+atinge `batch_size` ou quando `flush_interval` segundos se passam desde a
+primeira linha pendente. Com a fila cheia, a política "drop" descarta e conta,
+e "block" espera até `block_timeout` segundos antes de descartar.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, Sequence
+
+from db import bulk_insert
+from telemetry import resolve_labels
+
+logger = logging.getLogger(__name__)
+
+# username_id/osbuild_id chegam com o texto e viram ids na gravação (telemetry.resolve_labels)
+ACCESS_LOG_COLUMNS = (
+    "device_id", "ip", "user_agent", "hostname", "client_version",
+    "username_id", "osbuild_id", "ram_total_mb", "ram_free_mb", "cpu_load_pct", "client_time",
+    "telemetry_json", "allowed", "message", "created_at_epoch",
+)
+
+_STOP = object()
+
+
+class AccessLogWriter:
+    def __init__(
+        self,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        full_policy: str = "drop",
+        block_timeout: float = 0.05,
+        max_retries: int = 3,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.01, flush_interval)
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self._counter_lock = threading.Lock()
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    # -- produtor -------------------------------------------------------------
+    def submit(self, row: Sequence[Any]) -> bool:
+        """Enfileira uma linha (na ordem de ACCESS_LOG_COLUMNS). False se descartada."""
+        if not self._closed:
+            self._ensure_started()
+            try:
+                if self.full_policy == "block":
+                    self._queue.put(row, timeout=self.block_timeout)
+                else:
+                    self._queue.put_nowait(row)
+                with self._counter_lock:
+                    self.enqueued += 1
+                return True
+            except queue.Full:
+                pass
+        with self._counter_lock:
+            self.dropped += 1
+        return False
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Bloqueia até que tudo o que foi enfileirado antes desta chamada esteja gravado."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Grava o que estiver pendente e encerra a thread (chamado no shutdown)."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="access-log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    # -- consumidor -----------------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch = []
+            waiters = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                self._drain()
+                return
+
+    def _drain(self) -> None:
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not _STOP:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    batch = []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch) -> None:
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                bulk_insert("access_logs", ACCESS_LOG_COLUMNS, resolve_labels(batch, ACCESS_LOG_COLUMNS))
+                self.written += len(batch)
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+                return
+            except Exception as e:
+                logger.warning("ACCESS_LOG: falha ao gravar lote de %s (tentativa %s): %s", len(batch), attempt, e)
+                time.sleep(min(1.0, 0.1 * attempt))
+        self.failed += len(batch)
+        logger.error("ACCESS_LOG: lote de %s linhas descartado após %s tentativas", len(batch), self.max_retries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "largest_batch": self.largest_batch,
+            "full_policy": self.full_policy,
+        }
@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""
+Migrações versionadas do schema (SQLite e MySQL).
+
+Cada migração é uma função que recebe o cursor cru do driver e aplica um passo
+do schema. A versão aplicada fica registrada na tabela ``schema_version``, de
+modo que cada passo roda uma única vez por banco.
+
+Uso pela linha de comando (a partir da pasta api/):
+
+    python migrations.py           # aplica migrações pendentes
+    python migrations.py status    # mostra versão atual e pendências
+"""
+
+import sys
+from typing import Callable, List, Tuple
+
+import config
+from db import USE_MYSQL, raw_connection
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+def _column_exists(cur, table: str, column: str) -> bool:
+    if USE_MYSQL:
+        cur.execute(f"SHOW COLUMNS FROM {table} LIKE %s", (column,))
+        return cur.fetchone() is not None
+    cur.execute(f"PRAGMA table_info({table})")
+    return column in {row[1] for row in cur.fetchall()}
+
+
+def _add_column(cur, table: str, column: str, sqlite_type: str, mysql_type: str) -> None:
+    if not _column_exists(cur, table, column):
+        col_type = mysql_type if USE_MYSQL else sqlite_type
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+
+
+# ---------------------------------------------------------------------------
+# Migrações (em ordem; nunca altere uma migração já publicada, crie outra)
+# ---------------------------------------------------------------------------
+def _m001_schema_inicial(cur) -> None:
+    """Tabelas básicas. Usa IF NOT EXISTS para adotar bancos criados antes das migrações."""
+    if USE_MYSQL:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS devices (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL UNIQUE,
+                owner_name VARCHAR(255),
+                license_type VARCHAR(50) NOT NULL,
+                status VARCHAR(50) NOT NULL DEFAULT 'active',
+                start_date DATE NOT NULL,
+                end_date DATE,
+                allow_offline TINYINT NOT NULL DEFAULT 0,
+                custom_interval INT,
+                features TEXT,
+                update_url TEXT,
+                update_hash TEXT,
+                update_version TEXT,
+                notes TEXT,
+                last_seen_at DATETIME,
+                last_seen_ip VARCHAR(45),
+                last_version VARCHAR(50),
+                last_hostname VARCHAR(255),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_device_id (device_id),
+                INDEX idx_status (status)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS blocked_devices (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL UNIQUE,
+                reason TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_device_id (device_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS access_logs (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                ip VARCHAR(45) NOT NULL,
+                user_agent TEXT,
+                hostname VARCHAR(255),
+                client_version VARCHAR(50),
+                telemetry_json TEXT,
+                allowed TINYINT NOT NULL,
+                message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_device_id (device_id),
+                INDEX idx_created_at (created_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS license_history (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_id VARCHAR(255) NOT NULL,
+                action VARCHAR(100) NOT NULL,
+                details TEXT,
+                admin VARCHAR(100),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_device_id (device_id),
+                INDEX idx_created_at (created_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS admin_users (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                username VARCHAR(100) NOT NULL UNIQUE,
+                password_hash VARCHAR(255) NOT NULL,
+                must_change_password TINYINT NOT NULL DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_username (username)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                username VARCHAR(100) NOT NULL UNIQUE,
+                password_hash VARCHAR(255) NOT NULL,
+                email VARCHAR(255),
+                role VARCHAR(50) NOT NULL DEFAULT 'user',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_username (username),
+                INDEX idx_role (role)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS devices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id TEXT NOT NULL UNIQUE,
+                owner_name TEXT,
+                license_type TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'active',
+                start_date TEXT NOT NULL,
+                end_date TEXT,
+                allow_offline INTEGER NOT NULL DEFAULT 0,
+                custom_interval INTEGER,
+                features TEXT,
+                update_url TEXT,
+                update_hash TEXT,
+                update_version TEXT,
+                notes TEXT,
+                last_seen_at TEXT,
+                last_seen_ip TEXT,
+                last_version TEXT,
+                last_hostname TEXT,
+                created_at TEXT DEFAULT (datetime('now')),
+                updated_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS blocked_devices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id TEXT NOT NULL UNIQUE,
+                reason TEXT,
+                created_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS access_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                user_agent TEXT,
+                hostname TEXT,
+                client_version TEXT,
+                telemetry_json TEXT,
+                allowed INTEGER NOT NULL,
+                message TEXT,
+                created_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS license_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id TEXT NOT NULL,
+                action TEXT NOT NULL,
+                details TEXT,
+                admin TEXT,
+                created_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS admin_users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL UNIQUE,
+                password_hash TEXT NOT NULL,
+                must_change_password INTEGER NOT NULL DEFAULT 1,
+                created_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL UNIQUE,
+                password_hash TEXT NOT NULL,
+                email TEXT,
+                role TEXT NOT NULL DEFAULT 'user',
+                created_at TEXT DEFAULT (datetime('now')),
+                updated_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+
+
+def _m002_devices_dados_cliente(cur) -> None:
+    """Colunas cpf, address, email e created_by em devices (bases antigas não têm)."""
+    _add_column(cur, "devices", "cpf", "TEXT", "VARCHAR(20)")
+    _add_column(cur, "devices", "address", "TEXT", "TEXT")
+    _add_column(cur, "devices", "email", "TEXT", "VARCHAR(255)")
+    _add_column(cur, "devices", "created_by", "TEXT", "VARCHAR(100)")
+    if USE_MYSQL:
+        cur.execute("SHOW INDEX FROM devices WHERE Key_name = 'idx_created_by'")
+        if not cur.fetchone():
+            cur.execute("CREATE INDEX idx_created_by ON devices (created_by)")
+
+
+def _m003_password_resets(cur) -> None:
+    """Tabela de tokens de recuperação de senha (antes criada dentro do /auth/forgot-password)."""
+    if USE_MYSQL:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS password_resets (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                username VARCHAR(100) NOT NULL,
+                token VARCHAR(255) NOT NULL UNIQUE,
+                expires_at DATETIME NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_token (token),
+                INDEX idx_expires_at (expires_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS password_resets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                token TEXT NOT NULL UNIQUE,
+                expires_at TEXT NOT NULL,
+                created_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+
+
+def _index_exists(cur, table: str, index: str) -> bool:
+    if USE_MYSQL:
+        cur.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (index,))
+        return cur.fetchone() is not None
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index,))
+    return cur.fetchone() is not None
+
+
+def _create_index(cur, table: str, index: str, columns: str) -> None:
+    if not _index_exists(cur, table, index):
+        cur.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+
+
+def _backfill_epoch(cur, table: str, epoch_column: str, source_column: str) -> None:
+    """Preenche `epoch_column` (segundos UTC) a partir do DATETIME/texto em `source_column`."""
+    if USE_MYSQL:
+        expr = f"UNIX_TIMESTAMP({source_column})"
+    else:
+        # Texto gravado por datetime('now') ou isoformat() do Python; ambos em UTC
+        expr = f"CAST(strftime('%s', replace(substr({source_column}, 1, 19), 'T', ' ')) AS INTEGER)"
+    cur.execute(
+        f"UPDATE {table} SET {epoch_column} = {expr} "
+        f"WHERE {epoch_column} IS NULL AND {source_column} IS NOT NULL"
+    )
+
+
+def _m004_epoch_timestamps(cur) -> None:
+    """
+    Colunas inteiras em segundos UTC (created_at_epoch / expires_at_epoch) e
+    índices compostos para as janelas de tempo. As colunas texto/DATETIME
+    continuam existindo para exibição; filtros por período usam as epoch.
+    """
+    _add_column(cur, "access_logs", "created_at_epoch", "INTEGER", "BIGINT")
+    _add_column(cur, "license_history", "created_at_epoch", "INTEGER", "BIGINT")
+    _add_column(cur, "password_resets", "created_at_epoch", "INTEGER", "BIGINT")
+    _add_column(cur, "password_resets", "expires_at_epoch", "INTEGER", "BIGINT")
+
+    _backfill_epoch(cur, "access_logs", "created_at_epoch", "created_at")
+    _backfill_epoch(cur, "license_history", "created_at_epoch", "created_at")
+    _backfill_epoch(cur, "password_resets", "created_at_epoch", "created_at")
+    _backfill_epoch(cur, "password_resets", "expires_at_epoch", "expires_at")
+
+    _create_index(cur, "access_logs", "idx_access_logs_device_allowed_epoch",
+                  "device_id, allowed, created_at_epoch")
+    _create_index(cur, "access_logs", "idx_access_logs_epoch", "created_at_epoch")
+    _create_index(cur, "license_history", "idx_license_history_device_epoch",
+                  "device_id, created_at_epoch")
+    _create_index(cur, "password_resets", "idx_password_resets_expires_epoch", "expires_at_epoch")
+
+
+def _drop_index(cur, table: str, index: str) -> None:
+    if _index_exists(cur, table, index):
+        if USE_MYSQL:
+            cur.execute(f"DROP INDEX {index} ON {table}")
+        else:
+            cur.execute(f"DROP INDEX {index}")
+
+
+def _m005_indices_consultas_quentes(cur) -> None:
+    """
+    Índices compostos/cobrindo para as consultas de app.py, license_service.py
+    e email_service.py (conferir com ``python verificar_planos.py``).
+    """
+    # Janela de clones: (device_id, allowed, epoch) + ip/hostname cobre o SELECT
+    # inteiro; substitui o índice da 004, que é prefixo deste.
+    _create_index(cur, "access_logs", "idx_access_logs_clone_window",
+                  "device_id, allowed, created_at_epoch, ip, hostname")
+    _drop_index(cur, "access_logs", "idx_access_logs_device_allowed_epoch")
+
+    # /admin/devices: filtro por dono e ordenação por criação sem sort extra
+    _create_index(cur, "devices", "idx_devices_created_by_created_at", "created_by, created_at")
+    _create_index(cur, "devices", "idx_devices_created_at", "created_at")
+    # Job diário de alertas de vencimento
+    _create_index(cur, "devices", "idx_devices_status_end_date", "status, end_date")
+
+    # /auth/forgot-password e listagem de usuários
+    _create_index(cur, "users", "idx_users_email", "email")
+    _create_index(cur, "users", "idx_users_created_at", "created_at")
+
+
+def _m006_rollups_access_logs(cur) -> None:
+    """
+    Agregados por hora ('h') e dia ('d') de access_logs, por versão do cliente
+    e dono da licença (devices.created_by), mantidos por rollups.py a partir do
+    último access_logs.id processado (rollup_state). access_log_rollup_devices
+    guarda os devices vistos em cada balde recente (para contar únicos).
+    """
+    if USE_MYSQL:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS access_log_rollups (
+                period CHAR(1) NOT NULL,
+                bucket_start BIGINT NOT NULL,
+                client_version VARCHAR(50) NOT NULL DEFAULT '',
+                created_by VARCHAR(100) NOT NULL DEFAULT '',
+                checks INT NOT NULL DEFAULT 0,
+                allowed INT NOT NULL DEFAULT 0,
+                denied INT NOT NULL DEFAULT 0,
+                unique_devices INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (period, bucket_start, client_version, created_by)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS access_log_rollup_devices (
+                period CHAR(1) NOT NULL,
+                bucket_start BIGINT NOT NULL,
+                client_version VARCHAR(50) NOT NULL DEFAULT '',
+                created_by VARCHAR(100) NOT NULL DEFAULT '',
+                device_id VARCHAR(255) NOT NULL,
+                PRIMARY KEY (period, bucket_start, client_version, created_by, device_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                name VARCHAR(64) PRIMARY KEY,
+                last_id BIGINT NOT NULL DEFAULT 0,
+                updated_at_epoch BIGINT
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS access_log_rollups (
+                period TEXT NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                client_version TEXT NOT NULL DEFAULT '',
+                created_by TEXT NOT NULL DEFAULT '',
+                checks INTEGER NOT NULL DEFAULT 0,
+                allowed INTEGER NOT NULL DEFAULT 0,
+                denied INTEGER NOT NULL DEFAULT 0,
+                unique_devices INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (period, bucket_start, client_version, created_by)
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS access_log_rollup_devices (
+                period TEXT NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                client_version TEXT NOT NULL DEFAULT '',
+                created_by TEXT NOT NULL DEFAULT '',
+                device_id TEXT NOT NULL,
+                PRIMARY KEY (period, bucket_start, client_version, created_by, device_id)
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                name TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL DEFAULT 0,
+                updated_at_epoch INTEGER
+            )
+        """)
+    # Estatísticas por dono sem varrer os demais (o PK começa por período/balde)
+    _create_index(cur, "access_log_rollups", "idx_access_log_rollups_owner",
+                  "created_by, period, bucket_start")
+
+
+def _m007_telemetria_tipada(cur) -> None:
+    """
+    Telemetria do /verify em colunas tipadas de access_logs (ver telemetry.py):
+    username/osbuild como id de telemetry_labels, RAM em MB, CPU em % e a hora
+    do cliente (yyyyMMddHHmmss). telemetry_json passa a guardar só extras;
+    linhas antigas são convertidas por converter_telemetria.py.
+    """
+    if USE_MYSQL:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS telemetry_labels (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                kind VARCHAR(20) NOT NULL,
+                value VARCHAR(255) COLLATE utf8mb4_bin NOT NULL,
+                UNIQUE KEY uq_telemetry_labels_kind_value (kind, value)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS telemetry_labels (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                UNIQUE (kind, value)
+            )
+        """)
+    _add_column(cur, "access_logs", "username_id", "INTEGER", "INT")
+    _add_column(cur, "access_logs", "osbuild_id", "INTEGER", "INT")
+    _add_column(cur, "access_logs", "ram_total_mb", "INTEGER", "INT")
+    _add_column(cur, "access_logs", "ram_free_mb", "INTEGER", "INT")
+    _add_column(cur, "access_logs", "cpu_load_pct", "INTEGER", "SMALLINT")
+    _add_column(cur, "access_logs", "client_time", "INTEGER", "BIGINT")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "schema inicial", _m001_schema_inicial),
+    (2, "devices: cpf, address, email, created_by", _m002_devices_dados_cliente),
+    (3, "password_resets", _m003_password_resets),
+    (4, "timestamps epoch + índices de janela", _m004_epoch_timestamps),
+    (5, "índices das consultas quentes", _m005_indices_consultas_quentes),
+    (6, "agregados horários/diários de access_logs", _m006_rollups_access_logs),
+    (7, "telemetria tipada em access_logs", _m007_telemetria_tipada),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+def _ensure_version_table(cur) -> None:
+    if USE_MYSQL:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+
+
+def _current_version(cur) -> int:
+    cur.execute("SELECT MAX(version) AS version FROM schema_version")
+    row = cur.fetchone()
+    if not row:
+        return 0
+    value = row["version"] if isinstance(row, dict) else row[0]
+    return int(value or 0)
+
+
+def _seed_default_admin(cur) -> None:
+    """Usuário admin padrão (admin / admin123) se não existir nenhum usuário."""
+    from db import _hash_admin_password
+
+    cur.execute("SELECT COUNT(1) AS count FROM admin_users")
+    row = cur.fetchone()
+    count = (row["count"] if isinstance(row, dict) else row[0]) if row else 0
+    if count == 0:
+        default_user = getattr(config, "ADMIN_DEFAULT_USER", "admin")
+        default_pass = getattr(config, "ADMIN_DEFAULT_PASSWORD", "admin123")
+        placeholder = "%s" if USE_MYSQL else "?"
+        cur.execute(
+            "INSERT INTO admin_users (username, password_hash, must_change_password) "
+            f"VALUES ({placeholder}, {placeholder}, 1)",
+            (default_user, _hash_admin_password(default_pass)),
+        )
+
+
+def run_migrations(verbose: bool = False) -> int:
+    """
+    Aplica as migrações pendentes e garante o admin padrão.
+    Retorna a versão final do schema.
+    """
+    conn = raw_connection()
+    try:
+        cur = conn.cursor()
+        _ensure_version_table(cur)
+        current = _current_version(cur)
+        placeholder = "%s" if USE_MYSQL else "?"
+
+        for version, name, step in MIGRATIONS:
+            if version <= current:
+                continue
+            if verbose:
+                print(f"  → aplicando migração {version:03d}: {name}")
+            step(cur)
+            cur.execute(
+                f"INSERT INTO schema_version (version, name) VALUES ({placeholder}, {placeholder})",
+                (version, name),
+            )
+            # MySQL faz commit implícito em DDL; registrar cada passo isoladamente
+            conn.commit()
+            current = version
+
+        _seed_default_admin(cur)
+        conn.commit()
+        return current
+    finally:
+        conn.close()
+
+
+def pending_migrations() -> List[Tuple[int, str]]:
+    conn = raw_connection()
+    try:
+        cur = conn.cursor()
+        _ensure_version_table(cur)
+        conn.commit()
+        current = _current_version(cur)
+    finally:
+        conn.close()
+    return [(version, name) for version, name, _ in MIGRATIONS if version > current]
+
+
+def main(argv: List[str]) -> int:
+    command = argv[1] if len(argv) > 1 else "migrate"
+    backend = "MySQL" if USE_MYSQL else f"SQLite ({config.DB_PATH})"
+
+    if command == "status":
+        pending = pending_migrations()
+        print(f"Banco: {backend}")
+        print(f"Última migração disponível: {LATEST_VERSION}")
+        if not pending:
+            print("✓ Schema atualizado")
+        for version, name in pending:
+            print(f"  pendente {version:03d}: {name}")
+        return 0
+
+    if command == "migrate":
+        print(f"Aplicando migrações em {backend}...")
+        version = run_migrations(verbose=True)
+        print(f"✓ Schema na versão {version}")
+        return 0
+
+    print(f"Comando desconhecido: {command} (use 'migrate' ou 'status')")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
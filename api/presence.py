@@ -0,0 +1,155 @@
+"""
+Atualização agregada de "último acesso" (devices.last_seen_*).
+
+Cada /verify só registra o estado observado (IP, versão, hostname) em memória.
+Uma thread de fundo grava os estados pendentes a cada `flush_interval`
+segundos em um único lote de UPDATEs. Se o estado for igual ao último gravado
+e a gravação tiver menos de `max_staleness` segundos, nada é enfileirado, de
+modo que as escritas em devices acompanham mudanças de estado e não o volume
+de requisições. Por isso last_seen_at pode ficar até `max_staleness` segundos
+defasado para um device que não muda.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from db import get_conn, get_cursor
+
+logger = logging.getLogger(__name__)
+
+# updated_at = updated_at: presença não é alteração da licença (e evita o ON UPDATE do MySQL)
+_UPDATE_SEEN = """
+    UPDATE devices
+       SET last_seen_at = ?,
+           last_seen_ip = ?,
+           last_version = ?,
+           last_hostname = ?,
+           updated_at = updated_at
+     WHERE id = ?
+"""
+
+
+class PresenceTracker:
+    def __init__(self, flush_interval: float = 10.0, max_staleness: float = 300.0):
+        self.flush_interval = max(0.1, flush_interval)
+        self.max_staleness = max_staleness
+
+        self._pending = {}  # id -> (seen_at, ip, version, hostname)
+        self._inflight = {}  # lote sendo gravado agora (mesmo formato de _pending)
+        self._flushed = {}  # id -> (ip, version, hostname, monotonic da gravação)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.recorded = 0
+        self.skipped = 0
+        self.written = 0
+        self.flushes = 0
+        self.failures = 0
+
+    def record(self, primary_id: int, ip: str, version: str, hostname: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if primary_id not in self._pending:
+                last = self._flushed.get(primary_id)
+                if (
+                    last is not None
+                    and last[0] == ip and last[1] == version and last[2] == hostname
+                    and now - last[3] < self.max_staleness
+                ):
+                    self.skipped += 1
+                    return
+            seen_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            self._pending[primary_id] = (seen_at, ip, version, hostname)
+            self.recorded += 1
+        if self._thread is None:
+            self._start()
+
+    def flush(self) -> int:
+        """Grava os estados pendentes em um lote. Retorna quantos devices foram atualizados."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._inflight = pending
+            if not pending:
+                return 0
+
+            rows = [
+                (seen_at, ip, version, hostname, primary_id)
+                for primary_id, (seen_at, ip, version, hostname) in pending.items()
+            ]
+            try:
+                with get_conn() as conn:
+                    cur = get_cursor(conn)
+                    cur.executemany(_UPDATE_SEEN, rows)
+                    conn.commit()
+            except Exception as e:
+                logger.warning("PRESENCE: falha ao gravar %s devices: %s", len(rows), e)
+                with self._lock:
+                    self.failures += 1
+                    # Devolve ao pendente sem sobrescrever observações mais novas
+                    for primary_id, state in pending.items():
+                        self._pending.setdefault(primary_id, state)
+                    self._inflight = {}
+                return 0
+
+            now = time.monotonic()
+            with self._lock:
+                self._inflight = {}
+                for primary_id, (_, ip, version, hostname) in pending.items():
+                    self._flushed[primary_id] = (ip, version, hostname, now)
+                # Descarta lembranças velhas (seriam regravadas de qualquer forma)
+                expired = [k for k, v in self._flushed.items() if now - v[3] >= self.max_staleness]
+                for key in expired:
+                    del self._flushed[key]
+                self.written += len(rows)
+                self.flushes += 1
+            return len(rows)
+
+    def last_seen(self, primary_id: int) -> Optional[Tuple[str, str]]:
+        """(ip, hostname) observado e ainda não gravado em devices, ou None (vale o banco)."""
+        with self._lock:
+            state = self._pending.get(primary_id) or self._inflight.get(primary_id)
+        if state is None:
+            return None
+        return state[1], state[3]
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.flush_interval + 5)
+        self.flush()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="presence-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("PRESENCE: erro no flush periódico: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "tracked": len(self._flushed),
+                "recorded": self.recorded,
+                "skipped": self.skipped,
+                "written": self.written,
+                "flushes": self.flushes,
+                "failures": self.failures,
+                "flush_interval_s": self.flush_interval,
+                "max_staleness_s": self.max_staleness,
+            }
@@ -0,0 +1,66 @@
+"""
+Limitação de taxa em memória por chave (token bucket).
+
+Cada chave (Device ID, IP) tem um balde com até `burst` fichas, reabastecido a
+`rate` fichas por segundo; cada requisição gasta uma ficha. Sem fichas, a
+requisição é recusada e acquire() diz quantos segundos faltam para a próxima.
+As chaves ficam em LRU limitada a `max_keys` (quem sai volta com o balde cheio,
+o que só acontece com chaves ociosas). Vale por processo.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max(1, max_keys)
+        self._buckets = OrderedDict()  # chave -> [fichas, monotonic da última atualização]
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.shed = 0
+        self.evictions = 0
+
+    def acquire(self, key: str, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Gasta `cost` fichas de `key`. Retorna 0 se permitido, ou os segundos até poder tentar de novo."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._buckets.get(key)
+            if state is None:
+                tokens = self.burst
+                state = self._buckets[key] = [tokens, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._buckets.move_to_end(key)
+                tokens = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+            if tokens >= cost:
+                state[0] = tokens - cost
+                self.allowed += 1
+                return 0.0
+            state[0] = tokens
+            self.shed += 1
+            return (cost - tokens) / self.rate if self.rate > 0 else float(self.burst)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.allowed + self.shed
+        return {
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "keys": len(self._buckets),
+            "max_keys": self.max_keys,
+            "allowed": self.allowed,
+            "shed": self.shed,
+            "shed_ratio": round(self.shed / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Retenção de access_logs: arquiva e remove acessos antigos em lotes pequenos.
+
+Linhas com created_at_epoch mais antigo que RETENTION_DAYS são copiadas para
+um arquivo JSON Lines comprimido (gzip) em RETENTION_ARCHIVE_DIR e depois
+apagadas, um lote por transação. Cada lote é gravado e sincronizado no
+arquivo antes do DELETE: uma falha no meio pode repetir linhas no arquivo,
+nunca perdê-las. O tamanho do lote se ajusta para cada transação durar no
+máximo RETENTION_CHUNK_MAX_MS, com uma pausa entre lotes, para o /verify
+nunca esperar muito pelo lock de escrita.
+
+No SQLite, ao final roda PRAGMA incremental_vacuum (bancos criados com
+auto_vacuum=INCREMENTAL; para converter um banco antigo use
+--habilitar-vacuum-incremental, que faz um VACUUM completo). Retorna/mostra
+linhas arquivadas e removidas e bytes liberados.
+
+Com ROLLUP_ENABLED, só apaga linhas já somadas nos rollups (id até
+rollup_state.last_id): o que o rollup ainda não alcançou espera a próxima
+execução, para os totais não perderem acessos.
+
+Roda diariamente pelo scheduler do app (RETENTION_ENABLED) ou manualmente.
+
+Uso (a partir da pasta api/):
+
+    python retencao.py                          # aplica a retenção configurada
+    python retencao.py --days 30 --sem-arquivo  # só apaga (sem arquivar)
+    python retencao.py --dry-run                # só conta o que seria removido
+    python retencao.py --habilitar-vacuum-incremental
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import config
+from db import USE_MYSQL, get_conn, get_cursor, raw_connection
+
+logger = logging.getLogger(__name__)
+
+# Parâmetros por DELETE ... IN (...) (SQLite antigo limita a 999 variáveis)
+_IN_CHUNK = 500
+# Teto de id quando não há rollups a respeitar
+_NO_MAX_ID = 2 ** 63 - 1
+
+# Lote de expirados, com os rótulos da telemetria em texto (o arquivo não
+# depende de telemetry_labels); verificar_planos.py confere o plano desta query
+EXPIRED_CHUNK_SQL = """
+    SELECT a.*, u.value AS username, o.value AS osbuild
+    FROM access_logs a
+    LEFT JOIN telemetry_labels u ON u.id = a.username_id
+    LEFT JOIN telemetry_labels o ON o.id = a.osbuild_id
+    WHERE a.created_at_epoch < ? AND a.id <= ?
+    ORDER BY a.created_at_epoch, a.id
+    LIMIT ?
+"""
+
+
+def _sqlite_pages(cur) -> Dict[str, int]:
+    cur.execute("PRAGMA page_size")
+    page_size = cur.fetchone()[0]
+    cur.execute("PRAGMA page_count")
+    page_count = cur.fetchone()[0]
+    cur.execute("PRAGMA freelist_count")
+    freelist = cur.fetchone()[0]
+    cur.execute("PRAGMA auto_vacuum")
+    auto_vacuum = cur.fetchone()[0]
+    return {"page_size": page_size, "page_count": page_count, "freelist": freelist, "auto_vacuum": auto_vacuum}
+
+
+def _mysql_table_bytes(cur) -> int:
+    # Estatística aproximada do InnoDB (pode estar em cache por alguns segundos)
+    cur.execute(
+        """
+        SELECT COALESCE(data_length, 0) + COALESCE(index_length, 0) AS total
+        FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = 'access_logs'
+        """
+    )
+    row = cur.fetchone()
+    return int(row["total"] or 0) if row else 0
+
+
+def _archive_path(archive_dir: str, cutoff: int) -> str:
+    os.makedirs(archive_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    until = datetime.fromtimestamp(cutoff, timezone.utc).strftime("%Y%m%d")
+    return os.path.join(archive_dir, f"access_logs_ate_{until}_{stamp}.jsonl.gz")
+
+
+def _write_archive(path: str, rows) -> None:
+    # Um membro gzip por lote (o arquivo continua legível com gzip.open)
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="ab", compresslevel=6) as gz:
+            for row in rows:
+                gz.write(json.dumps(row.as_dict(), ensure_ascii=False, default=str).encode("utf-8"))
+                gz.write(b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def _incremental_vacuum(max_runtime: float) -> Dict[str, Any]:
+    """Devolve ao sistema as páginas livres (em passos, para não segurar o lock)."""
+    with get_conn() as conn:
+        cur = get_cursor(conn)
+        before = _sqlite_pages(cur)
+        if before["auto_vacuum"] != 2:
+            return {"vacuum": "indisponível (auto_vacuum != INCREMENTAL)", "freelist_pages": before["freelist"]}
+        deadline = time.monotonic() + max_runtime
+        step = getattr(config, "RETENTION_VACUUM_PAGES", 2000)
+        while time.monotonic() < deadline:
+            cur.execute("PRAGMA freelist_count")
+            if cur.fetchone()[0] == 0:
+                break
+            cur.execute(f"PRAGMA incremental_vacuum({int(step)})")
+            cur.fetchall()
+            conn.commit()
+        after = _sqlite_pages(cur)
+    return {
+        "vacuum": "incremental",
+        "pages_released": before["page_count"] - after["page_count"],
+        "freelist_pages": after["freelist"],
+    }
+
+
+def purge_access_logs(
+    days: Optional[int] = None,
+    archive_dir: Optional[str] = None,
+    archive: bool = True,
+    dry_run: bool = False,
+    max_runtime: Optional[float] = None,
+    max_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Arquiva e apaga os access_logs mais antigos que `days` dias e com id até
+    `max_id` (padrão: o último somado nos rollups, se ROLLUP_ENABLED). Para ao
+    fim das linhas ou após `max_runtime` segundos ("complete" diz qual).
+    """
+    days = config.RETENTION_DAYS if days is None else days
+    archive_dir = archive_dir or config.RETENTION_ARCHIVE_DIR
+    archive = archive and bool(archive_dir)
+    max_runtime = config.RETENTION_MAX_RUNTIME if max_runtime is None else max_runtime
+    target_s = config.RETENTION_CHUNK_MAX_MS / 1000
+    pause_s = config.RETENTION_PAUSE_MS / 1000
+    max_chunk = max(1, config.RETENTION_CHUNK_ROWS)
+    if max_id is None and getattr(config, "ROLLUP_ENABLED", False):
+        from rollups import rolled_up_until
+
+        max_id = rolled_up_until()
+
+    started = time.monotonic()
+    cutoff = int(time.time()) - days * 86400
+    report = {
+        "cutoff_epoch": cutoff,
+        "max_id": max_id,
+        "rows_archived": 0,
+        "rows_deleted": 0,
+        "chunks": 0,
+        "archive_file": None,
+        "archive_bytes": 0,
+        "bytes_reclaimed": 0,
+        "complete": False,
+    }
+
+    with get_conn() as conn:
+        cur = get_cursor(conn)
+        cur.execute(
+            "SELECT COUNT(1) FROM access_logs WHERE created_at_epoch < ? AND id <= ?",
+            (cutoff, _NO_MAX_ID if max_id is None else max_id),
+        )
+        report["rows_expired"] = cur.fetchone()[0]
+        if USE_MYSQL:
+            bytes_before = _mysql_table_bytes(cur)
+        else:
+            pages = _sqlite_pages(cur)
+            bytes_before = pages["page_count"] * pages["page_size"]
+    if dry_run or not report["rows_expired"]:
+        report["complete"] = not report["rows_expired"]
+        report["elapsed_s"] = round(time.monotonic() - started, 3)
+        return report
+
+    path = _archive_path(archive_dir, cutoff) if archive else None
+    chunk = min(max_chunk, 500)
+    while time.monotonic() - started < max_runtime:
+        chunk_started = time.monotonic()
+        with get_conn() as conn:
+            cur = get_cursor(conn)
+            cur.execute(EXPIRED_CHUNK_SQL, (cutoff, _NO_MAX_ID if max_id is None else max_id, chunk))
+            rows = cur.fetchall()
+            if not rows:
+                report["complete"] = True
+                break
+            if path:
+                _write_archive(path, rows)
+                report["rows_archived"] += len(rows)
+            ids = [row["id"] for row in rows]
+            for start in range(0, len(ids), _IN_CHUNK):
+                part = ids[start:start + _IN_CHUNK]
+                cur.execute(f"DELETE FROM access_logs WHERE id IN ({', '.join('?' for _ in part)})", part)
+            conn.commit()
+        report["rows_deleted"] += len(rows)
+        report["chunks"] += 1
+
+        # Lote seguinte do tamanho que cabe no tempo-alvo por transação
+        elapsed = time.monotonic() - chunk_started
+        if elapsed > target_s:
+            chunk = max(50, chunk // 2)
+        elif elapsed < target_s / 2:
+            chunk = min(max_chunk, chunk * 2)
+        time.sleep(pause_s)
+
+    if path and os.path.exists(path):
+        report["archive_file"] = path
+        report["archive_bytes"] = os.path.getsize(path)
+
+    if USE_MYSQL:
+        with get_conn() as conn:
+            report["bytes_reclaimed"] = max(0, bytes_before - _mysql_table_bytes(get_cursor(conn)))
+    else:
+        vacuum = _incremental_vacuum(max(5.0, max_runtime - (time.monotonic() - started)))
+        report.update(vacuum)
+        with get_conn() as conn:
+            pages = _sqlite_pages(get_cursor(conn))
+        report["bytes_reclaimed"] = max(0, bytes_before - pages["page_count"] * pages["page_size"])
+        # Páginas livres ainda dentro do arquivo: reaproveitadas por inserts futuros
+        report["bytes_free_in_file"] = pages["freelist"] * pages["page_size"]
+
+    report["elapsed_s"] = round(time.monotonic() - started, 3)
+    logger.info(
+        "RETENCAO: %s removidas, %s arquivadas, %s bytes liberados, completo=%s",
+        report["rows_deleted"], report["rows_archived"], report["bytes_reclaimed"], report["complete"],
+        extra={"event": "retention.run", "fields": report},
+    )
+    return report
+
+
+def run_retention_job() -> None:
+    """Entrada do scheduler: aplica a retenção e registra falhas sem derrubar o app."""
+    try:
+        if config.ROLLUP_ENABLED:
+            # Agrega o que falta antes de apagar; o que não couber (ou se outra
+            # execução estiver em andamento) fica de fora do DELETE pelo max_id
+            from rollups import update_rollups
+
+            update_rollups()
+        purge_access_logs()
+    except Exception:
+        logger.exception("RETENCAO: falha ao aplicar retenção de access_logs")
+
+
+def enable_incremental_vacuum() -> None:
+    """Converte um banco SQLite existente para auto_vacuum=INCREMENTAL (VACUUM completo)."""
+    if USE_MYSQL:
+        print("Só se aplica ao SQLite.")
+        return
+    conn = raw_connection()
+    try:
+        conn.isolation_level = None  # VACUUM não roda dentro de transação
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    finally:
+        conn.close()
+    print(f"✓ auto_vacuum = {mode} (2 = INCREMENTAL)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Retenção de access_logs")
+    parser.add_argument("--days", type=int, help=f"idade máxima em dias (padrão {config.RETENTION_DAYS})")
+    parser.add_argument("--archive-dir", help="pasta dos arquivos .jsonl.gz")
+    parser.add_argument("--sem-arquivo", action="store_true", help="apaga sem arquivar")
+    parser.add_argument("--dry-run", action="store_true", help="só conta as linhas expiradas")
+    parser.add_argument("--max-runtime", type=float, help="tempo máximo em segundos")
+    parser.add_argument("--habilitar-vacuum-incremental", action="store_true",
+                        help="converte o SQLite para auto_vacuum=INCREMENTAL (VACUUM completo, bloqueia o banco)")
+    args = parser.parse_args()
+
+    if args.habilitar_vacuum_incremental:
+        enable_incremental_vacuum()
+        return 0
+
+    report = purge_access_logs(
+        days=args.days,
+        archive_dir=args.archive_dir,
+        archive=not args.sem_arquivo,
+        dry_run=args.dry_run,
+        max_runtime=args.max_runtime,
+    )
+    for key, value in report.items():
+        print(f"  {key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
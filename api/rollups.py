@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Agregados de access_logs por hora e por dia (tabelas da migração 006).
+
+update_rollups() lê os access_logs com id acima do último processado
+(rollup_state), em lotes, e soma em access_log_rollups as verificações,
+liberadas e negadas por (período, início do balde, versão do cliente, dono da
+licença). Devices únicos vêm de access_log_rollup_devices (um registro por
+device em cada balde); só os baldes recentes guardam esse conjunto, os
+antigos ficam apenas com o total. Cada lote e o novo id máximo são gravados
+na mesma transação: rodar de novo nunca conta duas vezes.
+
+Linhas mais novas que ROLLUP_LAG_SECONDS ficam para a próxima execução, para
+não pular ids de transações ainda abertas (MySQL). Uma execução por vez
+(o scheduler do app roda a cada ROLLUP_INTERVAL_MINUTES).
+
+Uso (a partir da pasta api/):
+
+    python rollups.py              # processa o que estiver pendente
+    python rollups.py status       # último id processado e pendências
+    python rollups.py rebuild      # zera os agregados e reprocessa o que houver em access_logs
+"""
+
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import config
+from db import bulk_insert, bulk_upsert, get_conn, get_cursor
+
+logger = logging.getLogger(__name__)
+
+# (período, tamanho do balde em segundos; baldes alinhados em UTC)
+PERIODS = (("h", 3600), ("d", 86400))
+DIMENSIONS = {"version": "client_version", "created_by": "created_by"}
+
+_STATE_NAME = "access_logs"
+
+# verificar_planos.py confere o plano destas mesmas consultas
+PENDING_CHUNK_SQL = """
+    SELECT a.id, a.device_id, a.client_version, a.allowed, a.created_at_epoch, d.created_by
+    FROM access_logs a
+    LEFT JOIN devices d ON d.device_id = a.device_id
+    WHERE a.id > ?
+    ORDER BY a.id
+    LIMIT ?
+"""
+
+
+def series_query(group_by: Optional[str] = None, by_owner: bool = False) -> str:
+    """SELECT de query_rollups: soma por balde (e pela dimensão de group_by), opcionalmente de um dono."""
+    dim = DIMENSIONS.get(group_by or "")
+    select_dim = f", {dim}" if dim else ""
+    where = "period = ? AND bucket_start >= ? AND bucket_start < ?"
+    if by_owner:
+        where += " AND created_by = ?"
+    return f"""
+        SELECT bucket_start{select_dim},
+               SUM(checks) AS checks,
+               SUM(allowed) AS allowed,
+               SUM(denied) AS denied,
+               SUM(unique_devices) AS unique_devices
+        FROM access_log_rollups
+        WHERE {where}
+        GROUP BY bucket_start{select_dim}
+        ORDER BY bucket_start{select_dim}
+    """
+
+
+_run_lock = threading.Lock()
+
+
+def _last_id(cur) -> int:
+    cur.execute("SELECT last_id FROM rollup_state WHERE name = ?", (_STATE_NAME,))
+    row = cur.fetchone()
+    return int(row["last_id"]) if row else 0
+
+
+def _aggregate(rows):
+    counts = {}
+    devices = set()
+    for row in rows:
+        epoch = row["created_at_epoch"]
+        if epoch is None:
+            continue
+        version = str(row["client_version"] or "")[:50]
+        owner = str(row["created_by"] or "")[:100]
+        allowed = 1 if row["allowed"] else 0
+        for period, size in PERIODS:
+            key = (period, epoch - epoch % size, version, owner)
+            totals = counts.get(key)
+            if totals is None:
+                totals = counts[key] = [0, 0, 0]
+            totals[0] += 1
+            totals[1] += allowed
+            totals[2] += 1 - allowed
+            devices.add(key + (row["device_id"],))
+    return counts, devices
+
+
+def _apply_chunk(conn, rows, last_id: int) -> None:
+    counts, devices = _aggregate(rows)
+    bulk_upsert(
+        "access_log_rollups",
+        ("period", "bucket_start", "client_version", "created_by", "checks", "allowed", "denied"),
+        (key + tuple(totals) for key, totals in counts.items()),
+        key_columns=("period", "bucket_start", "client_version", "created_by"),
+        update_columns=(),
+        accumulate_columns=("checks", "allowed", "denied"),
+        conn=conn,
+    )
+    bulk_insert(
+        "access_log_rollup_devices",
+        ("period", "bucket_start", "client_version", "created_by", "device_id"),
+        devices,
+        ignore_duplicates=True,
+        conn=conn,
+    )
+    # Únicos recontados só nos baldes tocados por este lote. Nunca diminuem: um
+    # acesso atrasado num balde cujo conjunto já foi podado não zera o total.
+    distinct = """
+        SELECT COUNT(1) FROM access_log_rollup_devices d
+         WHERE d.period = access_log_rollups.period
+           AND d.bucket_start = access_log_rollups.bucket_start
+           AND d.client_version = access_log_rollups.client_version
+           AND d.created_by = access_log_rollups.created_by
+    """
+    cur = get_cursor(conn)
+    for period, bucket_start in {(key[0], key[1]) for key in counts}:
+        cur.execute(
+            f"""
+            UPDATE access_log_rollups
+               SET unique_devices = ({distinct})
+             WHERE period = ? AND bucket_start = ?
+               AND unique_devices < ({distinct})
+            """,
+            (period, bucket_start),
+        )
+    bulk_upsert(
+        "rollup_state",
+        ("name", "last_id", "updated_at_epoch"),
+        [(_STATE_NAME, last_id, int(time.time()))],
+        key_columns=("name",),
+        conn=conn,
+    )
+    conn.commit()
+
+
+def _prune_device_sets(conn) -> int:
+    """Apaga os conjuntos de devices de baldes que não recebem mais linhas (antes de ontem)."""
+    now = int(time.time())
+    cutoff = now - now % 86400 - 86400
+    cur = get_cursor(conn)
+    removed = 0
+    for period, _size in PERIODS:
+        while True:
+            cur.execute(
+                "DELETE FROM access_log_rollup_devices WHERE period = ? AND bucket_start < ? LIMIT 5000",
+                (period, cutoff),
+            )
+            conn.commit()
+            removed += max(0, cur.rowcount)
+            if cur.rowcount < 5000:
+                break
+    return removed
+
+
+def update_rollups(max_runtime: Optional[float] = None) -> Dict[str, Any]:
+    """Processa os access_logs pendentes. Retorna linhas processadas e o último id."""
+    max_runtime = config.ROLLUP_MAX_RUNTIME if max_runtime is None else max_runtime
+    chunk_rows = max(1, config.ROLLUP_CHUNK_ROWS)
+    report = {"rows": 0, "chunks": 0, "last_id": 0, "pruned_device_sets": 0, "complete": False}
+    if not _run_lock.acquire(blocking=False):
+        report["skipped"] = "execução em andamento"
+        return report
+    started = time.monotonic()
+    try:
+        with get_conn() as conn:
+            cur = get_cursor(conn)
+            last_id = _last_id(cur)
+            conn.commit()
+            while time.monotonic() - started < max_runtime:
+                fresh_after = int(time.time()) - config.ROLLUP_LAG_SECONDS
+                cur.execute(PENDING_CHUNK_SQL, (last_id, chunk_rows))
+                rows = cur.fetchall()
+                # Para no primeiro acesso recente demais (ids anteriores podem não ter sido confirmados)
+                ready = []
+                for row in rows:
+                    if row["created_at_epoch"] is not None and row["created_at_epoch"] > fresh_after:
+                        break
+                    ready.append(row)
+                if not ready:
+                    report["complete"] = True
+                    break
+                last_id = ready[-1]["id"]
+                _apply_chunk(conn, ready, last_id)
+                report["rows"] += len(ready)
+                report["chunks"] += 1
+                if len(ready) < len(rows) or len(rows) < chunk_rows:
+                    report["complete"] = True
+                    break
+            report["pruned_device_sets"] = _prune_device_sets(conn)
+        report["last_id"] = last_id
+    finally:
+        _run_lock.release()
+    report["elapsed_s"] = round(time.monotonic() - started, 3)
+    logger.info(
+        "ROLLUPS: %s acessos agregados até id %s, completo=%s",
+        report["rows"], report["last_id"], report["complete"],
+        extra={"event": "rollups.run", "fields": report},
+    )
+    return report
+
+
+def run_rollup_job() -> None:
+    """Entrada do scheduler: atualiza os agregados sem derrubar o app em caso de erro."""
+    try:
+        update_rollups()
+    except Exception:
+        logger.exception("ROLLUPS: falha ao atualizar agregados de access_logs")
+
+
+def rebuild_rollups() -> Dict[str, Any]:
+    """Zera agregados e estado e reprocessa os access_logs existentes (os já removidos pela retenção se perdem)."""
+    with _run_lock:
+        with get_conn() as conn:
+            cur = get_cursor(conn)
+            cur.execute("DELETE FROM access_log_rollups")
+            cur.execute("DELETE FROM access_log_rollup_devices")
+            cur.execute("DELETE FROM rollup_state WHERE name = ?", (_STATE_NAME,))
+            conn.commit()
+    return update_rollups(max_runtime=float("inf"))
+
+
+def rolled_up_until() -> int:
+    """Maior id de access_logs já somado nos rollups (a retenção não apaga além dele)."""
+    with get_conn() as conn:
+        return _last_id(get_cursor(conn))
+
+
+def rollup_status() -> Dict[str, Any]:
+    with get_conn() as conn:
+        cur = get_cursor(conn)
+        cur.execute("SELECT last_id, updated_at_epoch FROM rollup_state WHERE name = ?", (_STATE_NAME,))
+        state = cur.fetchone()
+        cur.execute("SELECT MAX(id) AS max_id FROM access_logs")
+        max_id = cur.fetchone()["max_id"] or 0
+    last_id = int(state["last_id"]) if state else 0
+    return {
+        "last_id": last_id,
+        "max_access_log_id": max_id,
+        "pending_rows": max(0, max_id - last_id),
+        "updated_at_epoch": state["updated_at_epoch"] if state else None,
+    }
+
+
+def query_rollups(
+    period: str,
+    since: int,
+    until: int,
+    group_by: Optional[str] = None,
+    created_by: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Séries do período ('h' ou 'd') em [since, until) (epoch UTC), somando as
+    demais dimensões. Com group_by ("version" ou "created_by"), uma linha por
+    balde e valor. unique_devices somado entre versões é aproximado (um device
+    que trocou de versão no balde conta duas vezes).
+    """
+    dim = DIMENSIONS.get(group_by or "")
+    params = [period, since, until]
+    if created_by is not None:
+        params.append(created_by)
+    with get_conn() as conn:
+        cur = get_cursor(conn)
+        cur.execute(series_query(group_by, by_owner=created_by is not None), params)
+        rows = cur.fetchall()
+    items = []
+    for row in rows:
+        item = {
+            "bucket_start": int(row["bucket_start"]),
+            "bucket": datetime.fromtimestamp(int(row["bucket_start"]), timezone.utc).isoformat(),
+            "checks": int(row["checks"] or 0),
+            "allowed": int(row["allowed"] or 0),
+            "denied": int(row["denied"] or 0),
+            "unique_devices": int(row["unique_devices"] or 0),
+        }
+        if dim:
+            item[group_by] = row[dim]
+        items.append(item)
+    return items
+
+
+def main(argv: List[str]) -> int:
+    command = argv[1] if len(argv) > 1 else "update"
+    if command == "status":
+        for key, value in rollup_status().items():
+            print(f"  {key}: {value}")
+        return 0
+    if command in ("update", "rebuild"):
+        report = rebuild_rollups() if command == "rebuild" else update_rollups(max_runtime=float("inf"))
+        for key, value in report.items():
+            print(f"  {key}: {value}")
+        return 0
+    print(f"Comando desconhecido: {command} (use 'update', 'status' ou 'rebuild')")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,130 @@
+"""
+Compilador de SQL por dialeto, com cache de statements.
+
+As queries da aplicação são escritas no dialeto do SQLite (placeholders ``?``,
+``datetime('now')``, ``ON CONFLICT ... DO UPDATE``). ``compile_query`` traduz
+cada statement para o dialeto do banco em uso uma única vez; as execuções
+seguintes só fazem uma consulta ao cache.
+
+Traduções suportadas (SQLite → MySQL):
+
+- ``?``                                   → ``%s`` (fora de literais)
+- ``datetime('now')`` / ``date('now')``   → ``NOW()`` / ``CURDATE()``
+- ``datetime('now', '-5 minutes')``       → ``DATE_SUB(NOW(), INTERVAL 5 MINUTE)``
+- ``ON CONFLICT(col) DO UPDATE SET ...``  → ``ON DUPLICATE KEY UPDATE ...``
+- ``excluded.col``                        → ``VALUES(col)``
+- ``ON CONFLICT ... DO NOTHING`` / ``INSERT OR IGNORE`` → ``INSERT IGNORE``
+- ``INSERT OR REPLACE``                   → ``REPLACE``
+
+E no sentido contrário (para o SQLite):
+
+- ``%s`` → ``?`` e ``NOW()`` → ``datetime('now')`` (queries escritas para MySQL)
+- ``DELETE FROM t WHERE ... LIMIT n`` → ``DELETE ... WHERE rowid IN (SELECT rowid ... LIMIT n)``
+  (o SQLite padrão não aceita LIMIT em DELETE; o MySQL não aceita LIMIT em subquery IN)
+
+Limitação: ``%`` literal no texto da query (fora de parâmetros) não é escapado
+para o MySQL; passe padrões de LIKE como parâmetro.
+"""
+
+import re
+from functools import lru_cache
+
+SQLITE = "sqlite"
+MYSQL = "mysql"
+
+_NOW_FUNC = re.compile(
+    r"\b(date|datetime)\(\s*'now'\s*(?:,\s*'([+-]?)(\d+)\s+(second|minute|hour|day|month|year)s?'\s*)?\)",
+    re.IGNORECASE,
+)
+_ON_CONFLICT_UPDATE = re.compile(r"\bON\s+CONFLICT\s*(?:\([^)]*\))?\s*DO\s+UPDATE\s+SET\b", re.IGNORECASE)
+_ON_CONFLICT_NOTHING = re.compile(r"\s*\bON\s+CONFLICT\s*(?:\([^)]*\))?\s*DO\s+NOTHING\b", re.IGNORECASE)
+_EXCLUDED = re.compile(r"\bexcluded\.(\w+)", re.IGNORECASE)
+_INSERT_OR_IGNORE = re.compile(r"^\s*INSERT\s+OR\s+IGNORE\b", re.IGNORECASE)
+_INSERT_OR_REPLACE = re.compile(r"^\s*INSERT\s+OR\s+REPLACE\b", re.IGNORECASE)
+_INSERT = re.compile(r"^\s*INSERT\b", re.IGNORECASE)
+_MYSQL_NOW = re.compile(r"\bNOW\(\s*\)", re.IGNORECASE)
+_DELETE_LIMIT = re.compile(
+    r"^\s*DELETE\s+FROM\s+(\w+)\s+(WHERE\s+.+?)?\s*((?:ORDER\s+BY\s+.+?\s+)?LIMIT\s+(?:\?|\d+))\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _replace_outside_literals(query: str, old: str, new: str) -> str:
+    """Troca `old` por `new` apenas fora de literais '...' e "..."."""
+    if old not in query:
+        return query
+    out = []
+    quote = None
+    i = 0
+    n = len(query)
+    step = len(old)
+    while i < n:
+        ch = query[i]
+        if quote:
+            out.append(ch)
+            if ch == quote:
+                quote = None
+            i += 1
+        elif ch in ("'", '"'):
+            quote = ch
+            out.append(ch)
+            i += 1
+        elif query.startswith(old, i):
+            out.append(new)
+            i += step
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def _mysql_now(match) -> str:
+    func, sign, amount, unit = match.groups()
+    base = "CURDATE()" if func.lower() == "date" else "NOW()"
+    if not amount:
+        return base
+    op = "DATE_SUB" if sign == "-" else "DATE_ADD"
+    return f"{op}({base}, INTERVAL {int(amount)} {unit.upper()})"
+
+
+def _to_mysql(query: str) -> str:
+    query = _NOW_FUNC.sub(_mysql_now, query)
+
+    if _ON_CONFLICT_NOTHING.search(query):
+        query = _ON_CONFLICT_NOTHING.sub("", query)
+        query = _INSERT.sub("INSERT IGNORE", query, count=1)
+    if _ON_CONFLICT_UPDATE.search(query):
+        query = _ON_CONFLICT_UPDATE.sub("ON DUPLICATE KEY UPDATE", query)
+        query = _EXCLUDED.sub(r"VALUES(\1)", query)
+    query = _INSERT_OR_IGNORE.sub("INSERT IGNORE", query)
+    query = _INSERT_OR_REPLACE.sub("REPLACE", query)
+
+    return _replace_outside_literals(query, "?", "%s")
+
+
+def _to_sqlite(query: str) -> str:
+    query = _MYSQL_NOW.sub("datetime('now')", query)
+    query = _replace_outside_literals(query, "%s", "?")
+
+    match = _DELETE_LIMIT.match(query)
+    if match:
+        table, where, limit = match.groups()
+        query = (
+            f"DELETE FROM {table} WHERE rowid IN "
+            f"(SELECT rowid FROM {table} {where or ''} {limit})"
+        )
+    return query
+
+
+@lru_cache(maxsize=2048)
+def compile_query(query: str, dialect: str) -> str:
+    """Traduz `query` (dialeto SQLite) para `dialect`. Resultado fica em cache."""
+    if dialect == MYSQL:
+        return _to_mysql(query)
+    return _to_sqlite(query)
+
+
+def cache_info():
+    """Estatísticas do cache de statements (hits, misses, tamanho)."""
+    info = compile_query.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
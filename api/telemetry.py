@@ -0,0 +1,236 @@
+"""
+Telemetria do /verify em colunas tipadas de access_logs (migração 007).
+
+O cliente manda hostname, username, osbuild, ram_total, ram_free, cpu_load e
+client_time como texto. compact_telemetry() converte para as colunas:
+RAM em MB e CPU em % (inteiros), client_time como o número yyyyMMddHHmmss
+enviado (hora do cliente, sem fuso) e username/osbuild como texto, trocado na
+gravação pelo id de telemetry_labels (resolve_labels). Só o que não se encaixa
+(parâmetros desconhecidos, valores que não são número) vai para
+telemetry_json; sem extras, a coluna fica NULL.
+"""
+
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from db import bulk_insert, conn_scope, get_cursor
+
+TELEMETRY_FIELDS = ("hostname", "username", "osbuild", "ram_total", "ram_free", "cpu_load", "client_time")
+# Colunas de access_logs preenchidas por compact_telemetry(), na ordem da tupla retornada
+TELEMETRY_COLUMNS = ("username_id", "osbuild_id", "ram_total_mb", "ram_free_mb", "cpu_load_pct", "client_time")
+LABEL_COLUMNS = {"username_id": "username", "osbuild_id": "osbuild"}
+
+# Parâmetros do /verify que não são telemetria (nem vão para telemetry_json)
+_RESERVED = frozenset(("id", "version", "ts", "sig", "fp", "format", "api_key", "hostname"))
+_EXTRA_MAX_KEYS = 16
+_EXTRA_MAX_LEN = 200
+_LABEL_MAX_LEN = 255
+
+_NUMBER = re.compile(r"^\s*(-?\d+(?:[.,]\d+)?)\s*([a-zA-Z%]*)\s*$")
+_RAM_FACTORS_MB = {"b": 1 / 1048576, "kb": 1 / 1024, "k": 1 / 1024, "mb": 1, "m": 1, "gb": 1024, "g": 1024}
+# Sem unidade: a partir daqui o valor só pode estar em bytes (16 TB em MB)
+_RAM_BYTES_THRESHOLD = 1 << 24
+
+
+def collect_telemetry(params) -> Dict[str, Any]:
+    """Campos de TELEMETRY_FIELDS + parâmetros desconhecidos (limitados) da query/entrada."""
+    telemetry = {field: params.get(field, "") for field in TELEMETRY_FIELDS}
+    extras = 0
+    for key in params.keys():
+        if key in _RESERVED or key in telemetry:
+            continue
+        if extras >= _EXTRA_MAX_KEYS:
+            break
+        telemetry[str(key)[:50]] = str(params.get(key))[:_EXTRA_MAX_LEN]
+        extras += 1
+    return telemetry
+
+
+def _number(value) -> Optional[Tuple[float, str]]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value), ""
+    match = _NUMBER.match(str(value))
+    if not match:
+        return None
+    return float(match.group(1).replace(",", ".")), match.group(2).lower()
+
+
+def _ram_mb(value) -> Optional[int]:
+    parsed = _number(value)
+    if parsed is None:
+        return None
+    number, unit = parsed
+    if unit:
+        factor = _RAM_FACTORS_MB.get(unit)
+        if factor is None:
+            return None
+    else:
+        factor = 1 / 1048576 if number >= _RAM_BYTES_THRESHOLD else 1
+    mb = int(round(number * factor))
+    return mb if 0 <= mb < 2 ** 31 else None
+
+
+def _cpu_pct(value) -> Optional[int]:
+    parsed = _number(value)
+    if parsed is None or parsed[1] not in ("", "%"):
+        return None
+    pct = int(round(parsed[0]))
+    return pct if 0 <= pct <= 1000 else None
+
+
+def _client_time(value) -> Optional[int]:
+    # yyyyMMddHHmmss (A_Now/A_NowUTC) ou "yyyy-MM-dd HH:mm:ss"
+    digits = re.sub(r"[-: T]", "", str(value).strip())
+    if len(digits) != 14 or not digits.isdigit():
+        return None
+    return int(digits)
+
+
+_PARSERS = (("ram_total", _ram_mb), ("ram_free", _ram_mb), ("cpu_load", _cpu_pct), ("client_time", _client_time))
+
+
+def compact_telemetry(telemetry: Optional[Dict[str, Any]]) -> Tuple:
+    """
+    (username, osbuild, ram_total_mb, ram_free_mb, cpu_load_pct, client_time,
+    telemetry_json) — username/osbuild ainda em texto (ver resolve_labels).
+    Valores que não convertem ficam em telemetry_json com a chave original.
+    """
+    if not telemetry:
+        return (None,) * 7
+    extras = {}
+    labels = []
+    for field in ("username", "osbuild"):
+        value = str(telemetry.get(field) or "").strip()
+        labels.append(value[:_LABEL_MAX_LEN] or None)
+    numbers = []
+    for field, parse in _PARSERS:
+        raw = telemetry.get(field)
+        if raw is None or raw == "":
+            numbers.append(None)
+            continue
+        value = parse(raw)
+        if value is None:
+            extras[field] = str(raw)[:_EXTRA_MAX_LEN]
+        numbers.append(value)
+    for key, value in telemetry.items():
+        if key not in TELEMETRY_FIELDS and value not in (None, ""):
+            extras[key] = value
+    extras_json = json.dumps(extras, ensure_ascii=False) if extras else None
+    return tuple(labels) + tuple(numbers) + (extras_json,)
+
+
+class LabelCache:
+    """(tipo, texto) -> id de telemetry_labels, em LRU limitada (os ids nunca mudam)."""
+
+    def __init__(self, maxsize: int = 20000):
+        self.maxsize = max(1, maxsize)
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                label_id = self._items.get(key)
+                if label_id is None:
+                    self.misses += 1
+                    continue
+                self._items.move_to_end(key)
+                found[key] = label_id
+                self.hits += 1
+        return found
+
+    def set_many(self, items: Dict[Tuple[str, str], int]) -> None:
+        with self._lock:
+            for key, label_id in items.items():
+                self._items[key] = label_id
+                self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+_label_cache = LabelCache()
+
+# Parâmetros por SELECT ... IN (...) (SQLite antigo limita a 999 variáveis)
+_IN_CHUNK = 500
+
+
+def _select_labels(cur, kind: str, values: List[str]) -> Dict[Tuple[str, str], int]:
+    found = {}
+    for start in range(0, len(values), _IN_CHUNK):
+        part = values[start:start + _IN_CHUNK]
+        cur.execute(
+            f"SELECT id, value FROM telemetry_labels WHERE kind = ? AND value IN ({', '.join('?' for _ in part)})",
+            [kind] + part,
+        )
+        for row in cur.fetchall():
+            found[(kind, row["value"])] = int(row["id"])
+    return found
+
+
+def label_ids(keys: Iterable[Tuple[str, str]], conn=None) -> Dict[Tuple[str, str], int]:
+    """
+    Ids de telemetry_labels para os pares (tipo, texto), criando os que faltam.
+    Com `conn` do chamador, os criados só entram no cache depois de aparecerem
+    num SELECT seguinte (a transação dele ainda pode ser desfeita).
+    """
+    keys = set(keys)
+    ids = _label_cache.get_many(keys)
+    missing = keys - ids.keys()
+    if not missing:
+        return ids
+    with conn_scope(conn) as (conn, owned):
+        cur = get_cursor(conn)
+        by_kind = {}
+        for kind, value in missing:
+            by_kind.setdefault(kind, []).append(value)
+        existing = {}
+        for kind, values in by_kind.items():
+            existing.update(_select_labels(cur, kind, values))
+        created = {}
+        new_keys = missing - existing.keys()
+        if new_keys:
+            bulk_insert("telemetry_labels", ("kind", "value"), sorted(new_keys), conn=conn, ignore_duplicates=True)
+            for kind in {kind for kind, _ in new_keys}:
+                created.update(_select_labels(cur, kind, [value for k, value in new_keys if k == kind]))
+        if owned:
+            conn.commit()
+    _label_cache.set_many(existing)
+    if owned:
+        _label_cache.set_many(created)
+    ids.update(existing)
+    ids.update(created)
+    return ids
+
+
+def resolve_labels(rows: Sequence[Sequence[Any]], columns: Sequence[str], conn=None) -> List[Tuple]:
+    """Troca o texto de username_id/osbuild_id nas linhas (na ordem de `columns`) pelo id do rótulo."""
+    slots = [(columns.index(column), kind) for column, kind in LABEL_COLUMNS.items() if column in columns]
+    keys = {(kind, row[idx]) for row in rows for idx, kind in slots if isinstance(row[idx], str)}
+    if not keys:
+        return [tuple(row) for row in rows]
+    ids = label_ids(keys, conn=conn)
+    resolved = []
+    for row in rows:
+        row = list(row)
+        for idx, kind in slots:
+            if isinstance(row[idx], str):
+                row[idx] = ids.get((kind, row[idx]))
+        resolved.append(tuple(row))
+    return resolved
+
+
+def label_cache_stats() -> Dict[str, Any]:
+    return _label_cache.stats()
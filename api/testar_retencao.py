@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Testa a retenção de access_logs junto com os rollups: com ROLLUP_ENABLED, a
+retenção não pode apagar acessos que o rollup ainda não somou, mesmo quando
+ele para no meio (tempo esgotado) ou é pulado (outra execução em andamento).
+
+Usa um SQLite temporário (não mexe no banco configurado no .env).
+
+Uso (a partir da pasta api/):
+
+    python testar_retencao.py
+    python -m pytest testar_retencao.py    # mesmos testes pelo pytest
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+_TMP = tempfile.mkdtemp()
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["DB_PATH"] = os.path.join(_TMP, "retencao.db")
+os.environ["RETENTION_ARCHIVE_DIR"] = os.path.join(_TMP, "arquivo")
+os.environ["RETENTION_PAUSE_MS"] = "0"
+os.environ["ROLLUP_ENABLED"] = "true"
+
+import config  # noqa: E402
+import rollups  # noqa: E402
+from db import bulk_insert, get_conn, get_cursor, init_db  # noqa: E402
+from log_writer import ACCESS_LOG_COLUMNS  # noqa: E402
+from retencao import run_retention_job  # noqa: E402
+
+init_db()
+
+
+def _reset() -> None:
+    with get_conn() as conn:
+        cur = get_cursor(conn)
+        for table in ("access_logs", "access_log_rollups", "access_log_rollup_devices", "rollup_state"):
+            cur.execute(f"DELETE FROM {table}")
+        conn.commit()
+
+
+def _seed(count: int) -> None:
+    """`count` acessos de 200 dias atrás (já expirados para a retenção)."""
+    old = int(time.time()) - 200 * 86400
+    row = dict.fromkeys(ACCESS_LOG_COLUMNS)
+    rows = []
+    for i in range(count):
+        row.update(device_id=f"DEV{i % 7}", ip="1.1.1.1", client_version="1.0", allowed=1, message="ok",
+                   created_at_epoch=old + i)
+        rows.append(tuple(row[column] for column in ACCESS_LOG_COLUMNS))
+    bulk_insert("access_logs", ACCESS_LOG_COLUMNS, rows)
+
+
+def _counts():
+    """(acessos restantes em access_logs, acessos somados nos rollups horários)."""
+    with get_conn() as conn:
+        cur = get_cursor(conn)
+        cur.execute("SELECT COUNT(1) FROM access_logs")
+        left = cur.fetchone()[0]
+        cur.execute("SELECT COALESCE(SUM(checks), 0) FROM access_log_rollups WHERE period = 'h'")
+        rolled = cur.fetchone()[0]
+    return left, rolled
+
+
+def test_rollup_incompleto_nao_perde_acessos():
+    _reset()
+    _seed(100)
+    rollups.update_rollups()
+    _seed(200)
+
+    # Rollup sem tempo para nada: só o que já estava somado pode sair
+    runtime = config.ROLLUP_MAX_RUNTIME
+    config.ROLLUP_MAX_RUNTIME = 0
+    try:
+        run_retention_job()
+    finally:
+        config.ROLLUP_MAX_RUNTIME = runtime
+    assert _counts() == (200, 100)
+
+    run_retention_job()
+    assert _counts() == (0, 300)
+
+
+def test_rollup_em_andamento_nao_perde_acessos():
+    _reset()
+    _seed(50)
+    rollups.update_rollups()
+    _seed(80)
+
+    # Outra execução segurando o lock: update_rollups() volta "skipped"
+    with rollups._run_lock:
+        assert "skipped" in rollups.update_rollups()
+        run_retention_job()
+    assert _counts() == (80, 50)
+
+    run_retention_job()
+    assert _counts() == (0, 130)
+
+
+def main() -> int:
+    failures = 0
+    for name, test in sorted((name, fn) for name, fn in globals().items() if name.startswith("test_")):
+        try:
+            test()
+            print(f"✓ {name}")
+        except AssertionError as e:
+            failures += 1
+            print(f"✗ {name}: {e!r} (restantes, somados) = {_counts()}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Verificação de planos de execução das consultas quentes.
+
+Roda EXPLAIN QUERY PLAN (SQLite) ou EXPLAIN (MySQL) em cada consulta de
+hot_queries() contra o banco configurado e falha (exit 1) se alguma fizer
+varredura completa da tabela em vez de usar um índice. Serve como checagem de
+regressão depois de mexer em queries ou migrações.
+
+Uso (a partir da pasta api/):
+
+    python verificar_planos.py                 # banco configurado (.env)
+    python verificar_planos.py --temp          # SQLite temporário, schema das migrações
+    python verificar_planos.py --verbose       # mostra o plano de cada consulta
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+
+def hot_queries():
+    """
+    (nome, query no dialeto SQLite, parâmetros, índice esperado ou None). As
+    strings são importadas dos módulos que as executam, app.py inclusive
+    (depois de --temp ajustar o banco), para o plano checado ser o da consulta real.
+    """
+    from app import (
+        ADMIN_DEVICES_BY_OWNER_SQL,
+        ADMIN_DEVICES_SQL,
+        ADMIN_LOGIN_SQL,
+        USER_BY_EMAIL_SQL,
+        USER_LOGIN_SQL,
+        VALID_RESET_TOKEN_SQL,
+    )
+    from email_service import ALERT_SENT_SQL, EXPIRING_LICENSES_SQL
+    from license_service import CLONE_REBUILD_SQL, CLONE_WINDOW_SQL, DEVICE_BY_ID_SQL, DEVICES_BY_IDS_SQL
+    from retencao import EXPIRED_CHUNK_SQL
+    from rollups import PENDING_CHUNK_SQL, series_query
+
+    return [
+        ("verify: device por device_id", DEVICE_BY_ID_SQL, ("DEV",), None),
+        (
+            "verify/batch: devices por lista de device_id",
+            DEVICES_BY_IDS_SQL.format(placeholders="?, ?, ?"),
+            ("DEV1", "DEV2", "DEV3"),
+            None,
+        ),
+        ("verify: janela de clones (backend database)", CLONE_WINDOW_SQL, ("DEV", 0),
+         "idx_access_logs_clone_window"),
+        ("startup: reconstrução da janela de clones", CLONE_REBUILD_SQL, (0, 1000), "idx_access_logs_epoch"),
+        ("retenção: lote de access_logs expirados", EXPIRED_CHUNK_SQL, (0, 1000, 500), "idx_access_logs_epoch"),
+        ("rollups: lote de access_logs após o último id", PENDING_CHUNK_SQL, (0, 5000), None),
+        ("admin/stats/access: série do período", series_query(), ("h", 0, 86400), None),
+        (
+            "admin/stats/access: série das licenças do usuário",
+            series_query(by_owner=True),
+            ("h", 0, 86400, "user"),
+            "idx_access_log_rollups_owner",
+        ),
+        ("email: licenças ativas a vencer", EXPIRING_LICENSES_SQL, (), "idx_devices_status_end_date"),
+        ("email: alerta já enviado", ALERT_SENT_SQL, ("DEV", "%Email enviado%", 0), None),
+        ("admin/devices: licenças do usuário", ADMIN_DEVICES_BY_OWNER_SQL, ("user",),
+         "idx_devices_created_by_created_at"),
+        ("admin/devices: todas as licenças", ADMIN_DEVICES_SQL, (), "idx_devices_created_at"),
+        ("login: admin_users por username", ADMIN_LOGIN_SQL, ("admin",), None),
+        ("login: users por username", USER_LOGIN_SQL, ("user",), None),
+        ("forgot-password: users por email", USER_BY_EMAIL_SQL, ("a@b.c",), "idx_users_email"),
+        ("reset-password: token válido", VALID_RESET_TOKEN_SQL, ("tok", 0), None),
+    ]
+
+
+def _sqlite_problems(cur, query, params, expected_index):
+    cur.execute(f"EXPLAIN QUERY PLAN {query}", params)
+    details = [row["detail"] for row in cur.fetchall()]
+    problems = []
+    for detail in details:
+        # "SCAN t" sem índice = varredura completa ("SCAN t USING INDEX x" é ok)
+        if detail.startswith("SCAN ") and "USING" not in detail:
+            problems.append(f"varredura completa: {detail}")
+    if expected_index and not any(expected_index in detail for detail in details):
+        problems.append(f"índice {expected_index} não utilizado")
+    return details, problems
+
+
+def _mysql_problems(cur, query, params, expected_index):
+    cur.execute(f"EXPLAIN {query}", params)
+    rows = cur.fetchall()
+    details = [f"{row['table']}: type={row['type']} key={row['key']}" for row in rows]
+    problems = []
+    for row in rows:
+        if row["type"] == "ALL":
+            problems.append(f"varredura completa em {row['table']}")
+    if expected_index and not any(row["key"] == expected_index for row in rows):
+        problems.append(f"índice {expected_index} não utilizado")
+    return details, problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Checa os planos das consultas quentes")
+    parser.add_argument("--temp", action="store_true", help="usa um SQLite temporário com o schema das migrações")
+    parser.add_argument("--verbose", action="store_true", help="mostra o plano de cada consulta")
+    args = parser.parse_args()
+
+    if args.temp:
+        os.environ["DB_TYPE"] = "sqlite"
+        os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "planos.db")
+
+    from db import USE_MYSQL, get_conn, get_cursor, init_db
+
+    init_db()
+    check = _mysql_problems if USE_MYSQL else _sqlite_problems
+    failures = 0
+
+    with get_conn() as conn:
+        cur = get_cursor(conn)
+        queries = hot_queries()
+        for name, query, params, expected_index in queries:
+            details, problems = check(cur, " ".join(query.split()), params, expected_index)
+            status = "FALHA" if problems else "ok"
+            print(f"[{status:>5}] {name}")
+            if args.verbose or problems:
+                for detail in details:
+                    print(f"          {detail}")
+            for problem in problems:
+                print(f"          ✗ {problem}")
+            failures += bool(problems)
+
+    print()
+    if failures:
+        print(f"✗ {failures} consulta(s) sem índice adequado")
+        return 1
+    print(f"✓ {len(queries)} consultas usando índices")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
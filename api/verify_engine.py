@@ -0,0 +1,505 @@
+"""
+Núcleo da verificação de licença, independente do Flask.
+
+VerifyEngine recebe VerifyRequest (objeto simples, montado pelo app, pelo
+/verify/batch, por um servidor assíncrono ou por um benchmark) e decide usando
+um VerifyStorage:
+
+- DatabaseStorage: o banco configurado (SQLite ou MySQL, conforme DB_TYPE),
+  com os caches, a blocklist, a detecção de clones e os writers de
+  license_service;
+- MemoryStorage: tudo em dicionários, sem banco (testes e microbenchmarks).
+
+A validação de API key e o cache de retentativas continuam no app (são do
+transporte HTTP); timestamp, assinatura, blocklist, licença, clones, registro
+do acesso e montagem do token ficam aqui.
+"""
+
+import hashlib
+import hmac
+import logging
+import math
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+from clone_detector import CloneDetector
+from db import unit_of_work
+from license_service import (
+    access_log_row,
+    auto_create_device,
+    block_device,
+    build_compact_response,
+    build_config_payload,
+    build_license_token,
+    build_unchanged_response,
+    calculate_end_date,
+    detect_clone_usage,
+    evaluate_license,
+    fetch_devices,
+    insert_access_logs,
+    is_device_blocklisted,
+    license_fingerprint,
+    record_clone_observation,
+    update_device_seen,
+)
+from rate_limiter import TokenBucketLimiter
+from telemetry import collect_telemetry
+
+logger = logging.getLogger(__name__)
+
+# IPs que não identificam o cliente (proxy mal configurado, fallback de
+# get_client_ip): todos cairiam no mesmo balde, então não passam pelo limite por IP
+_UNLIMITED_IPS = frozenset(("", "unknown", "127.0.0.1", "::1"))
+
+
+class VerifyRequest:
+    """Uma verificação assinada: parâmetros do cliente + origem (ip, user agent)."""
+
+    __slots__ = ("device_id", "version", "ts", "sig", "ip", "user_agent", "telemetry", "token_fp", "compact")
+
+    def __init__(self, device_id: str, version: str, ts: str = "", sig: str = "", ip: str = "",
+                 user_agent: str = "", telemetry: Optional[Dict[str, Any]] = None,
+                 token_fp: str = "", compact: bool = False):
+        self.device_id = device_id
+        self.version = version
+        self.ts = ts
+        self.sig = sig
+        self.ip = ip
+        self.user_agent = user_agent
+        self.telemetry = telemetry or {}
+        self.token_fp = token_fp
+        self.compact = compact
+
+    @classmethod
+    def from_params(cls, params, ip: str, user_agent: str = "", compact: bool = False) -> "VerifyRequest":
+        """A partir da query string do /verify ou de uma entrada do /verify/batch."""
+        def text(name: str) -> str:
+            return str(params.get(name) or "").strip()
+
+        return cls(
+            device_id=text("id"),
+            version=text("version"),
+            ts=text("ts"),
+            sig=text("sig"),
+            ip=ip,
+            user_agent=user_agent,
+            telemetry=collect_telemetry(params),
+            # Fingerprint do license_token que o cliente já tem (verify condicional)
+            token_fp=text("fp"),
+            compact=compact,
+        )
+
+    @property
+    def hostname(self) -> str:
+        return str(self.telemetry.get("hostname") or "")
+
+
+class VerifyResult:
+    """
+    Corpo da resposta, o status HTTP equivalente, se limitada (429) o Retry-After
+    em segundos e, nas verificações avaliadas, o fingerprint do estado da licença.
+    """
+
+    __slots__ = ("status", "body", "retry_after", "fingerprint")
+
+    def __init__(self, body: Dict[str, Any], status: int = 200, retry_after: int = 0,
+                 fingerprint: Optional[str] = None):
+        self.body = body
+        self.status = status
+        self.retry_after = retry_after
+        self.fingerprint = fingerprint
+
+    @property
+    def allow(self) -> bool:
+        return bool(self.body.get("allow", self.body.get("a")))
+
+
+class VerifyStorage:
+    """
+    Interface de armazenamento do VerifyEngine. `transaction()` devolve o
+    contexto (tx) repassado às demais chamadas de uma mesma verificação/lote.
+    """
+
+    @contextmanager
+    def transaction(self):
+        yield None
+
+    def is_blocklisted(self, device_id: str) -> bool:
+        raise NotImplementedError
+
+    def fetch_devices(self, device_ids: List[str], tx) -> Dict[str, Optional[Any]]:
+        raise NotImplementedError
+
+    def create_device(self, device_id: str, tx) -> Any:
+        raise NotImplementedError
+
+    def detect_clone(self, device_id: str, ip: str, hostname: str, tx) -> Tuple[bool, Optional[str]]:
+        raise NotImplementedError
+
+    def block_device(self, device_id: str, tx) -> None:
+        raise NotImplementedError
+
+    def record_access(self, req: VerifyRequest, device, allow: bool, msg: str, tx) -> None:
+        """Janela de clones, last_seen_* e access_logs de uma verificação decidida."""
+        raise NotImplementedError
+
+
+class _DatabaseTx:
+    __slots__ = ("conn", "log_rows")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.log_rows = []
+
+
+class DatabaseStorage(VerifyStorage):
+    """
+    Banco configurado (SQLite ou MySQL: as queries são compiladas por dialeto).
+    Uma transação é uma unidade de trabalho com commit único; os access_logs
+    acumulados são gravados em lote ao final.
+    """
+
+    @contextmanager
+    def transaction(self):
+        with unit_of_work() as conn:
+            tx = _DatabaseTx(conn)
+            yield tx
+            insert_access_logs(tx.log_rows, conn=conn)
+
+    def is_blocklisted(self, device_id: str) -> bool:
+        return is_device_blocklisted(device_id)
+
+    def fetch_devices(self, device_ids: List[str], tx) -> Dict[str, Optional[Any]]:
+        return fetch_devices(device_ids, conn=tx.conn)
+
+    def create_device(self, device_id: str, tx):
+        return auto_create_device(device_id, conn=tx.conn)
+
+    def detect_clone(self, device_id: str, ip: str, hostname: str, tx) -> Tuple[bool, Optional[str]]:
+        return detect_clone_usage(device_id, ip, hostname, conn=tx.conn)
+
+    def block_device(self, device_id: str, tx) -> None:
+        block_device(device_id, conn=tx.conn)
+
+    def record_access(self, req: VerifyRequest, device, allow: bool, msg: str, tx) -> None:
+        record_clone_observation(req.device_id, req.ip, req.hostname, allow)
+        update_device_seen(device["id"], req.ip, req.version, req.hostname, conn=tx.conn)
+        tx.log_rows.append(access_log_row(
+            device_id=req.device_id,
+            allowed=allow,
+            message=msg,
+            version=req.version,
+            hostname=req.hostname,
+            telemetry=req.telemetry,
+            ip=req.ip,
+            user_agent=req.user_agent,
+        ))
+
+
+class MemoryStorage(VerifyStorage):
+    """
+    Devices, blocklist e access_logs em memória, sem banco. Os devices são
+    dicts com as mesmas colunas de `devices`; os acessos ficam em `access_logs`
+    (tuplas de access_log_row), limitados a `max_logs`.
+    """
+
+    def __init__(self, devices: Iterable[Dict[str, Any]] = (), blocklist: Iterable[str] = (),
+                 max_logs: int = 100000):
+        self.devices = {}
+        self.blocklist = set(config.HARDCODED_BLOCKLIST) | set(blocklist)
+        self.access_logs = []
+        self.max_logs = max_logs
+        self._next_id = 1
+        self._lock = threading.RLock()
+        self._clones = CloneDetector(
+            window=config.CLONE_DETECTION_WINDOW,
+            max_ips=config.MAX_SIMULTANEOUS_IPS,
+            per_device=getattr(config, "CLONE_DETECTOR_PER_DEVICE", 20),
+            max_devices=getattr(config, "CLONE_DETECTOR_MAX_DEVICES", 100000),
+        )
+        for device in devices:
+            self.add_device(**device)
+
+    def add_device(self, device_id: str, **fields) -> Dict[str, Any]:
+        with self._lock:
+            device = {"id": self._next_id, "device_id": device_id, "license_type": "mensal",
+                      "status": "pending", "start_date": None, "end_date": None}
+            device.update(fields)
+            self._next_id += 1
+            self.devices[device_id] = device
+            return device
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            yield None
+
+    def is_blocklisted(self, device_id: str) -> bool:
+        return device_id in self.blocklist
+
+    def fetch_devices(self, device_ids: List[str], tx) -> Dict[str, Optional[Any]]:
+        return {device_id: self.devices.get(device_id) for device_id in device_ids}
+
+    def create_device(self, device_id: str, tx):
+        # Mesmo registro automático de auto_create_device (pending, mensal)
+        start = datetime.now(timezone.utc).date().isoformat()
+        return self.add_device(device_id, license_type="mensal", status="pending",
+                               start_date=start, end_date=calculate_end_date("mensal", start))
+
+    def detect_clone(self, device_id: str, ip: str, hostname: str, tx) -> Tuple[bool, Optional[str]]:
+        if not config.ENABLE_CLONE_DETECTION:
+            return (False, None)
+        return self._clones.check(device_id, ip, hostname)
+
+    def block_device(self, device_id: str, tx) -> None:
+        device = self.devices.get(device_id)
+        if device is not None:
+            device["status"] = "blocked"
+
+    def record_access(self, req: VerifyRequest, device, allow: bool, msg: str, tx) -> None:
+        if config.ENABLE_CLONE_DETECTION:
+            self._clones.record(req.device_id, req.ip, req.hostname, allow)
+        device["last_seen_ip"] = req.ip
+        device["last_version"] = req.version
+        device["last_hostname"] = req.hostname
+        if len(self.access_logs) >= self.max_logs:
+            del self.access_logs[: max(1, self.max_logs // 10)]
+        self.access_logs.append(access_log_row(
+            req.device_id, allow, msg, req.version, req.hostname,
+            req.telemetry, req.ip, req.user_agent,
+        ))
+
+
+class VerifyEngine:
+    def __init__(self, storage: VerifyStorage, device_limiter: Optional[TokenBucketLimiter] = None,
+                 ip_limiter: Optional[TokenBucketLimiter] = None):
+        self.storage = storage
+        self.device_limiter = device_limiter
+        self.ip_limiter = ip_limiter
+
+    def check(self, req: VerifyRequest, now_utc: datetime) -> Optional[VerifyResult]:
+        """
+        Validações sem banco (parâmetros, timestamp dentro de MAX_TIME_SKEW,
+        assinatura sha256(id|version|ts|secret), limites de taxa e blocklist).
+        Retorna None se ok, ou o VerifyResult do erro.
+        """
+        if not req.device_id or not req.version:
+            logger.warning("VERIFY: Parâmetros ausentes - id=%s, version=%s", bool(req.device_id), bool(req.version),
+                           extra={"event": "verify.deny", "fields": {"reason": "params"}})
+            return VerifyResult({"allow": False, "msg": "Parâmetros ausentes."}, 400)
+
+        # Timestamp
+        ts = req.ts
+        try:
+            if not ts or len(ts) != 14:
+                raise ValueError("formato esperado YYYYMMDDHHMMSS")
+            client_dt = datetime.strptime(ts, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+        except ValueError as e:
+            logger.warning("VERIFY: Timestamp inválido - ts=%s, error=%s", ts, e,
+                           extra={"event": "verify.deny", "fields": {"device_id": req.device_id, "reason": "timestamp"}})
+            return VerifyResult({"allow": False, "msg": f"Timestamp inválido: {ts}"}, 400)
+
+        time_diff = abs((now_utc - client_dt).total_seconds())
+        hours_diff = time_diff / 3600
+
+        logger.info("VERIFY: Timestamp OK - client=%s, server=%s, diff=%ss, max_skew=%ss",
+                    client_dt, now_utc, time_diff, config.MAX_TIME_SKEW,
+                    extra={"event": "verify.timestamp", "fields": {"device_id": req.device_id, "skew_s": time_diff}})
+
+        if time_diff > config.MAX_TIME_SKEW:
+            logger.warning("VERIFY: Requisição expirada - diff=%ss (%.1fh), max=%ss", time_diff, hours_diff, config.MAX_TIME_SKEW,
+                           extra={"event": "verify.deny", "fields": {"device_id": req.device_id, "reason": "skew"}})
+            hours_max = config.MAX_TIME_SKEW / 3600
+            return VerifyResult({
+                "allow": False,
+                "msg": f"Relógio desincronizado. Diferença: {int(hours_diff)}h {int((time_diff % 3600) / 60)}min (máximo permitido: {int(hours_max)}h). Sincronize o relógio do sistema."
+            }, 400)
+
+        # Assinatura
+        if config.REQUIRE_SIGNATURE and config.SHARED_SECRET:
+            if not req.sig:
+                logger.warning("VERIFY: Assinatura ausente",
+                               extra={"event": "verify.deny", "fields": {"device_id": req.device_id, "reason": "signature"}})
+                return VerifyResult({"allow": False, "msg": "Assinatura ausente."}, 403)
+            expected = hashlib.sha256(
+                f"{req.device_id}|{req.version}|{ts}|{config.SHARED_SECRET}".encode("utf-8")
+            ).hexdigest()
+            # Usa hmac.compare_digest() em vez de hashlib.compare_digest() para compatibilidade com Python antigo
+            if not hmac.compare_digest(expected, req.sig):
+                logger.warning("VERIFY: Assinatura inválida - received=%s...", req.sig[:20],
+                               extra={"event": "verify.deny", "fields": {"device_id": req.device_id, "reason": "signature"}})
+                return VerifyResult({"allow": False, "msg": "Assinatura inválida."}, 403)
+
+        # Limite de taxa por device, antes de qualquer acesso ao banco (o por IP
+        # vale só para o lote: vários devices legítimos dividem o mesmo NAT)
+        limited = self._limit(self.device_limiter, req.device_id, req)
+        if limited is not None:
+            return limited
+
+        # Blocklist (hardcoded + blocked_devices)
+        if self.storage.is_blocklisted(req.device_id):
+            logger.info("VERIFY: Dispositivo bloqueado (blocklist) - id=%s", req.device_id,
+                        extra={"event": "verify.deny", "fields": {"device_id": req.device_id, "reason": "blocklist"}})
+            # Mensagens de sempre (os clientes AHK exibem): lista fixa x tabela blocked_devices
+            if req.device_id in config.HARDCODED_BLOCKLIST:
+                return VerifyResult({"allow": False, "msg": "Dispositivo bloqueado."}, 403)
+            return VerifyResult({"allow": False, "msg": "Este dispositivo está bloqueado."}, 403)
+
+        return None
+
+    def verify(self, req: VerifyRequest, now_utc: Optional[datetime] = None) -> VerifyResult:
+        """Verificação completa de uma requisição."""
+        now_utc = now_utc or datetime.now(timezone.utc)
+        error = self.check(req, now_utc)
+        if error:
+            return error
+        return self.decide(req, now_utc)
+
+    def verify_many(self, reqs: List[VerifyRequest], now_utc: Optional[datetime] = None) -> List[VerifyResult]:
+        """
+        Várias verificações com um único fetch de devices e uma única transação
+        (access_logs gravados em lote). Resultados na ordem de `reqs`.
+        """
+        now_utc = now_utc or datetime.now(timezone.utc)
+        # O IP (gateway do lote) gasta uma ficha por chamada, não uma por entrada
+        results = [self.check(req, now_utc) for req in reqs]
+        shed_ips = {}
+        for ip in dict.fromkeys(req.ip for req, result in zip(reqs, results) if result is None):
+            if ip in _UNLIMITED_IPS:
+                continue
+            limited = self._limit(self.ip_limiter, ip, None)
+            if limited is not None:
+                shed_ips[ip] = limited
+        if shed_ips:
+            results = [shed_ips.get(req.ip) if result is None else result for req, result in zip(reqs, results)]
+        pending = [index for index, result in enumerate(results) if result is None]
+        if pending:
+            for index, result in zip(pending, self.decide_many([reqs[i] for i in pending], now_utc)):
+                results[index] = result
+        return results
+
+    @staticmethod
+    def _limit(limiter: Optional[TokenBucketLimiter], key: str, req: Optional[VerifyRequest]) -> Optional[VerifyResult]:
+        if limiter is None or not key:
+            return None
+        wait = limiter.acquire(key)
+        if not wait:
+            return None
+        retry_after = max(1, math.ceil(wait))
+        logger.info("VERIFY: Limite de taxa excedido - chave=%s, retry_after=%ss", key, retry_after,
+                    extra={"event": "verify.shed", "fields": {"key": key, "retry_after": retry_after,
+                                                              "device_id": req.device_id if req else None}})
+        return VerifyResult(
+            {"allow": False, "msg": f"Muitas requisições. Tente novamente em {retry_after}s.", "retry_after": retry_after},
+            429,
+            retry_after,
+        )
+
+    def decide(self, req: VerifyRequest, now_utc: datetime) -> VerifyResult:
+        """Decisão de uma requisição que já passou por check()."""
+        return self.decide_many([req], now_utc)[0]
+
+    def decide_many(self, reqs: List[VerifyRequest], now_utc: datetime) -> List[VerifyResult]:
+        """Decisão em conjunto (requisições já validadas por check())."""
+        storage = self.storage
+        results = []
+        decisions = []
+        # Unidade de trabalho: leituras e escritas compartilham a transação (commit único)
+        with storage.transaction() as tx:
+            devices = storage.fetch_devices([req.device_id for req in reqs], tx)
+            for req in reqs:
+                id_ = req.device_id
+                device = devices.get(id_)
+                if not device:
+                    if not config.ALLOW_AUTO_PROVISION:
+                        logger.warning("VERIFY: ID não registrado - id=%s", id_,
+                                       extra={"event": "verify.deny", "fields": {"device_id": id_, "reason": "unknown"}})
+                        results.append(VerifyResult({"allow": False, "msg": "ID não registrado."}, 403))
+                        continue
+                    logger.info("VERIFY: Auto-provisionando dispositivo - id=%s", id_,
+                                extra={"event": "verify.provision", "fields": {"device_id": id_}})
+                    device = devices[id_] = storage.create_device(id_, tx)
+
+                validation = evaluate_license(device)
+                allow = bool(validation["allow"])
+                msg = validation["msg"]
+                effective_end = validation.get("end_date")
+
+                logger.info("VERIFY: Device encontrado - id=%s, license_type=%s, status=%s",
+                            id_, device.get("license_type"), device.get("status"),
+                            extra={"event": "verify.device", "fields": {"device_id": id_}})
+
+                # Detecção de clones (ANTES de registrar o acesso)
+                is_clone, clone_message = storage.detect_clone(id_, req.ip, req.hostname, tx)
+                if is_clone:
+                    logger.warning("VERIFY: Clone detectado - Device ID: %s, IP: %s, Hostname: %s, Mensagem: %s",
+                                   id_, req.ip, req.hostname, clone_message,
+                                   extra={"event": "verify.clone", "fields": {"device_id": id_, "ip": req.ip}})
+
+                    # Bloqueia automaticamente; a licença passa a ser avaliada como bloqueada
+                    storage.block_device(id_, tx)
+                    device = devices[id_] = {**device, "status": "blocked"}
+                    allow = False
+                    msg = clone_message or "Licença bloqueada - uso simultâneo detectado."
+
+                storage.record_access(req, device, allow, msg, tx)
+                results.append(None)
+                decisions.append((len(results) - 1, req, device, allow, msg, effective_end))
+
+        for index, req, device, allow, msg, effective_end in decisions:
+            config_payload = build_config_payload(device, effective_end)
+            result = self.build_response(req, device, allow, msg, effective_end, config_payload, now_utc)
+            # Liberações são amostradas (LOG_SAMPLE_RATES); negativas saem sempre
+            logger.info("VERIFY: Resposta final - id=%s, allow=%s, msg=%s", req.device_id, allow, msg,
+                        extra={"event": "verify.allow" if allow else "verify.deny",
+                               "fields": {"device_id": req.device_id, "allow": allow, "ip": req.ip,
+                                          "version": req.version}})
+            results[index] = result
+        return results
+
+    @staticmethod
+    def build_response(req: VerifyRequest, device, allow: bool, msg: str, effective_end,
+                       config_payload: Dict[str, Any], now_utc: datetime) -> VerifyResult:
+        """
+        Monta a resposta de verificação (inalterada, v2 ou v1) a partir da decisão.
+        O corpo v1 não leva o fingerprint (formato inalterado): vai em
+        VerifyResult.fingerprint, que o /verify devolve no header X-License-Fingerprint.
+        """
+        id_ = req.device_id
+        # Verify condicional: se o cliente mandou o fingerprint do token que já tem e
+        # o estado não mudou, responde só "unchanged" (sem montar/assinar o token)
+        fingerprint = license_fingerprint(id_, {
+            "allow": allow,
+            "msg": msg,
+            "license_type": device.get("license_type"),
+            "status": device.get("status"),
+            "expires_at": effective_end,
+            "config": {key: value for key, value in config_payload.items() if key != "interval"},
+        })
+        if req.token_fp and hmac.compare_digest(req.token_fp, fingerprint):
+            return VerifyResult(build_unchanged_response(
+                allow, fingerprint, id_, effective_end, now_utc, config_payload["interval"], req.compact
+            ), fingerprint=fingerprint)
+
+        if req.compact:
+            # Formato v2: cada campo uma vez, token como blob canônico assinado
+            return VerifyResult(build_compact_response(
+                allow, msg, id_, device, effective_end, config_payload, now_utc, fingerprint
+            ), fingerprint=fingerprint)
+
+        # ------------------------------------------------------------------
+        # Token de licença assinado (para cache/offline no cliente)
+        # Assinatura HMAC-SHA256 sobre o JSON serializado do payload.
+        # ------------------------------------------------------------------
+        license_token = build_license_token(
+            id_, device, effective_end, config_payload.get("features", []), now_utc
+        )
+        return VerifyResult({
+            "allow": allow,
+            "msg": msg,
+            "config": config_payload,
+            "license_token": license_token,
+        }, fingerprint=fingerprint)